@@ -0,0 +1,81 @@
+"""Накладные расходы на подключение: sqlite3.connect на каждый вызов против пула
+
+Запуск: python -m benchmarks.bench_connections [--calls 5000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from db_pool import ConnectionPool
+
+
+def prepare_db(path, rows=1000):
+    """Создать тестовую таблицу транзакций"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER, type TEXT, amount REAL, category TEXT,
+            description TEXT, date DATE, is_deleted BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO transactions (user_id, type, amount, category, date) VALUES (?, 'expense', ?, 'Еда', DATE('now'))",
+        [(i % 2, float(i)) for i in range(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+
+QUERY = 'SELECT * FROM transactions WHERE id = ?'
+
+
+def bench_connect_per_call(path, calls):
+    """Старый подход: открыть и закрыть подключение на каждый запрос"""
+    start = time.perf_counter()
+    for i in range(calls):
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute(QUERY, (i % 1000 + 1,))
+        cursor.fetchone()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def bench_pool(path, calls):
+    """Новый подход: переиспользуемое подключение из пула"""
+    pool = ConnectionPool(path)
+    start = time.perf_counter()
+    for i in range(calls):
+        with pool.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(QUERY, (i % 1000 + 1,))
+            cursor.fetchone()
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        prepare_db(path)
+
+        before = bench_connect_per_call(path, args.calls)
+        after = bench_pool(path, args.calls)
+
+    print(f"Вызовов: {args.calls}")
+    print(f"connect на вызов: {before / args.calls * 1e6:8.1f} мкс/вызов")
+    print(f"пул подключений:  {after / args.calls * 1e6:8.1f} мкс/вызов")
+    print(f"ускорение:        {before / after:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Рассылка напоминаний: отправка по одному в цикле против delivery.deliver
+
+Замена бота отвечает через --latency мс; часть отправок (--flaky)
+временно падает с NetworkError, часть чатов заблокировала бота.
+Сравниваются время рассылки, доставленные и потерянные сообщения,
+задержка доставки (p50/p99 от начала рассылки) и порядок сообщений
+внутри чата.
+Запуск: python -m benchmarks.bench_delivery [--messages 2000] [--chats 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from aiogram.utils.exceptions import BotBlocked, NetworkError
+
+from benchmarks.common import use_database
+
+
+class FakeBot:
+    """send_message с задержкой сети, случайными сбоями и заблокированными чатами"""
+
+    def __init__(self, latency, flaky, blocked, seed=0):
+        self.latency = latency
+        self.flaky = flaky
+        self.blocked = blocked
+        self.rnd = random.Random(seed)
+        self.received = {}
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            raise BotBlocked('Forbidden: bot was blocked by the user')
+        if self.rnd.random() < self.flaky:
+            raise NetworkError('Connection reset by peer')
+        self.received.setdefault(chat_id, []).append(text)
+
+
+async def send_in_loop(bot, messages):
+    """Как check_and_send_reminders: по одному, ошибка - сообщение потеряно"""
+    started = time.perf_counter()
+    latencies = []
+    for chat_id, text in messages:
+        try:
+            await bot.send_message(chat_id, text)
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            pass
+    return latencies
+
+
+def in_order(bot, messages):
+    """Сообщения каждого чата пришли в порядке рассылки"""
+    expected = {}
+    for chat_id, text in messages:
+        expected.setdefault(chat_id, []).append(text)
+    return all(received == [text for text in expected[chat_id] if text in set(received)]
+               for chat_id, received in bot.received.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=20, help="мс на отправку")
+    parser.add_argument('--flaky', type=float, default=0.05, help="доля временных сбоев")
+    parser.add_argument('--blocked', type=int, default=5, help="чатов, заблокировавших бота")
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        use_database(os.path.join(directory, 'bench.db'))
+        import delivery
+        delivery.BACKOFF_BASE = 0.05  # паузы короче, чтобы замер не ждал секундами
+
+        rnd = random.Random(1)
+        messages = [(rnd.randrange(1, args.chats + 1), f'🔔 Напоминание {i}') for i in range(args.messages)]
+        blocked = set(range(1, args.blocked + 1))
+
+        for mode in ('цикл', 'рассылка'):
+            bot = FakeBot(args.latency / 1000, args.flaky, blocked)
+            started = time.perf_counter()
+            if mode == 'цикл':
+                latencies = sorted(asyncio.run(send_in_loop(bot, messages)))
+                retried = 0
+                p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+            else:
+                deliveries = [delivery.Delivery(chat_id, text, 'reminder') for chat_id, text in messages]
+                report = asyncio.run(delivery.deliver(bot, deliveries, 'замер', concurrency=args.concurrency))
+                retried, p50, p99 = report.retried, report.p50_ms, report.p99_ms
+            elapsed = time.perf_counter() - started
+            delivered = sum(len(texts) for texts in bot.received.values())
+            print(f"{mode:<9} {elapsed:>6.2f} с  {delivered / elapsed:>7.0f} сообщ/с  доставлено {delivered:>5} "
+                  f"из {args.messages}, повторов {retried:>4}  p50 {p50:>7.0f} мс, p99 {p99:>7.0f} мс  "
+                  f"порядок в чатах {'сохранен' if in_order(bot, messages) else 'НАРУШЕН'}")
+
+        import database
+        dead = sum(1 for _ in database.get_dead_letters(args.messages))
+        print(f"в delivery_dead_letters: {dead} (сообщения заблокированным чатам и исчерпавшие попытки)")
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
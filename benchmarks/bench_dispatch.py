@@ -0,0 +1,117 @@
+"""Стоимость выбора обработчика: цепочка lambda-фильтров против routing.Router
+
+Для N зарегистрированных обработчиков нажатий (префиксы вида
+'actionK_item_') и N кнопок меню замеряет dispatcher.process_update
+для нажатия/сообщения, которое обслуживает последний обработчик
+(худший случай для перебора), и чистый поиск в таблице маршрутов.
+Запуск: python -m benchmarks.bench_dispatch [--handlers 10,30,100,300,1000]
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from routing import Router
+
+TOKEN = '123456:fake-token'
+
+
+def callback_update(data):
+    return types.Update(**{
+        'update_id': 1,
+        'callback_query': {
+            'id': '1', 'chat_instance': '1', 'data': data,
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}},
+        },
+    })
+
+
+def message_update(text):
+    return types.Update(**{
+        'update_id': 1,
+        'message': {
+            'message_id': 1, 'date': 0, 'text': text,
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+        },
+    })
+
+
+async def noop(event):
+    pass
+
+
+async def noop_payload(event, payload):
+    pass
+
+
+def make_linear(count):
+    """Диспетчер с фильтрами, как было в bot.py"""
+    dp = Dispatcher(Bot(TOKEN), storage=MemoryStorage())
+    for i in range(count):
+        dp.register_message_handler(noop, lambda message, text=f'кнопка {i}': message.text == text)
+        dp.register_callback_query_handler(noop, lambda c, prefix=f'action{i}_item_': c.data.startswith(prefix))
+    return dp
+
+
+def make_routed(count):
+    """Диспетчер с таблицей маршрутов"""
+    dp = Dispatcher(Bot(TOKEN), storage=MemoryStorage())
+    router = Router()
+    router.setup(dp)
+    for i in range(count):
+        router.text(f'кнопка {i}')(noop)
+        router.callback(f'action{i}_item_')(noop_payload)
+    return dp, router
+
+
+async def measure(dp, update, repeat):
+    """Среднее время process_update, мкс; каждое обновление в своей задаче, как при polling"""
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await asyncio.create_task(dp.process_update(update))
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+async def run(args):
+    print(f"{'обработчиков':>12} {'нажатие, мкс':>26} {'сообщение, мкс':>26} {'поиск, мкс':>11}")
+    print(f"{'':>12} {'фильтры':>12} {'таблица':>13} {'фильтры':>12} {'таблица':>13}")
+    for count in args.handlers:
+        last = count - 1
+        callback = callback_update(f'action{last}_item_{12345}')
+        message = message_update(f'кнопка {last}')
+
+        linear = make_linear(count)
+        routed, router = make_routed(count)
+        results = []
+        for update in (callback, message):
+            results.append(await measure(linear, update, args.repeat))
+            results.append(await measure(routed, update, args.repeat))
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            router.resolve_callback(callback.callback_query.data)
+        lookup = (time.perf_counter() - started) / args.repeat * 1e6
+
+        for dp in (linear, routed):
+            await (await dp.bot.get_session()).close()
+        print(f"{count:>12} {results[0]:>12.1f} {results[1]:>13.1f} {results[2]:>12.1f} {results[3]:>13.1f} "
+              f"{lookup:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handlers', type=lambda value: [int(part) for part in value.split(',')],
+                        default=[10, 30, 100, 300, 1000])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Хранилище FSM: MemoryStorage против SQLiteStorage (fsm_storage.py)
+
+Замеряет задержку get_state/get_data/update_data/set_state на горячем
+кэше, чтение диалога, которого нет в кэше, и время записи накопленных
+изменений на диск.
+Запуск: python -m benchmarks.bench_fsm [--users 10000]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+STATE = 'AddExpense:waiting_for_category'
+
+
+def percentiles(samples):
+    """(p50, p99) в микросекундах"""
+    samples = sorted(samples)
+    return (samples[len(samples) // 2] * 1e6,
+            samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6)
+
+
+async def measure(operation, users):
+    """Задержка operation(user) для каждого пользователя"""
+    samples = []
+    for user in users:
+        started = time.perf_counter()
+        await operation(user)
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def operations(storage):
+    """Сценарии обработчика: (название, операция)"""
+    async def set_state(user):
+        await storage.set_state(chat=user, user=user, state=STATE)
+
+    async def update_data(user):
+        await storage.update_data(chat=user, user=user, amount=450.0, category='Еда')
+
+    async def get_state(user):
+        await storage.get_state(chat=user, user=user)
+
+    async def get_data(user):
+        await storage.get_data(chat=user, user=user)
+
+    async def reset_state(user):
+        await storage.reset_state(chat=user, user=user)
+
+    return (('set_state', set_state), ('update_data', update_data), ('get_state', get_state),
+            ('get_data', get_data), ('reset_state', reset_state))
+
+
+async def run(args, path):
+    users = range(1, args.users + 1)
+    storages = (
+        ('MemoryStorage', MemoryStorage()),
+        ('SQLiteStorage', SQLiteStorage(path, cache_size=args.users * 2, flush_interval=3600)),
+    )
+
+    print(f"{'хранилище':<14} {'операция':<12} {'p50, мкс':>9} {'p99, мкс':>9}")
+    for name, storage in storages:
+        for operation_name, operation in operations(storage):
+            p50, p99 = await measure(operation, users)
+            print(f"{name:<14} {operation_name:<12} {p50:>9.1f} {p99:>9.1f}")
+
+    sqlite_storage = storages[1][1]
+
+    # Запись накопленных изменений: одна транзакция на все диалоги
+    for operation_name, operation in operations(sqlite_storage)[:2]:
+        for user in users:
+            await operation(user)
+    started = time.perf_counter()
+    await sqlite_storage.flush()
+    elapsed = time.perf_counter() - started
+    print(f"\nflush {args.users} диалогов: {elapsed * 1000:.1f} мс ({args.users / elapsed:,.0f} диалогов/с)")
+
+    # Промах кэша: диалог читается из таблицы
+    sqlite_storage._cache.clear()
+    _, get_state = operations(sqlite_storage)[2]
+    p50, p99 = await measure(get_state, users)
+    print(f"get_state без кэша: p50 {p50:.1f} мкс, p99 {p99:.1f} мкс")
+    size = sum(os.path.getsize(file) for file in (path, path + '-wal') if os.path.exists(file))
+    print(f"размер базы с WAL: {size / 2 ** 20:.1f} МБ")
+
+    for _, storage in storages:
+        await storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args, os.path.join(tmp, 'fsm.db')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Пропускная способность записи: commit на каждую вставку против групповой фиксации
+
+Запуск: python -m benchmarks.bench_group_commit [--threads 16 --inserts 200]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from db_pool import ConnectionPool
+
+SCHEMA = '''
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER, type TEXT, amount REAL, category TEXT,
+        description TEXT, date DATE, is_deleted BOOLEAN DEFAULT 0
+    )
+'''
+INSERT = "INSERT INTO transactions (user_id, type, amount, category, date) VALUES (?, 'expense', ?, 'Еда', DATE('now'))"
+
+
+def run_threads(threads, inserts, insert_one):
+    """Запустить параллельные вставки и вернуть число вставок в секунду"""
+    def worker(n):
+        for i in range(inserts):
+            insert_one(n, i)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return threads * inserts / (time.perf_counter() - start)
+
+
+def bench_commit_per_insert(path, threads, inserts, synchronous):
+    """Старый подход: rollback-журнал и commit на каждую вставку"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    lock = threading.Lock()
+
+    def insert_one(n, i):
+        with lock:
+            conn.execute(INSERT, (n, float(i)))
+            conn.commit()
+
+    rate = run_threads(threads, inserts, insert_one)
+    conn.close()
+    return rate
+
+
+def bench_group_commit(path, threads, inserts, synchronous):
+    """Новый подход: WAL и поток-писатель с групповой фиксацией"""
+    pool = ConnectionPool(path, synchronous=synchronous)
+
+    def operation(n, i):
+        def insert(cursor):
+            cursor.execute(INSERT, (n, float(i)))
+            return cursor.lastrowid
+        return insert
+
+    rate = run_threads(threads, inserts, lambda n, i: pool.write(operation(n, i)))
+    pool.close()
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--inserts', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Потоков: {args.threads}, вставок на поток: {args.inserts}")
+    for synchronous in ('NORMAL', 'FULL'):
+        for name, bench in (('commit на вставку', bench_commit_per_insert),
+                            ('групповая фиксация', bench_group_commit)):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.db')
+                conn = sqlite3.connect(path)
+                conn.execute(SCHEMA)
+                conn.close()
+                rate = bench(path, args.threads, args.inserts, synchronous)
+            print(f"synchronous={synchronous:6} {name:20} {rate:10.0f} вставок/с")
+
+
+if __name__ == '__main__':
+    main()
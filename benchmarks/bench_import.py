@@ -0,0 +1,90 @@
+"""Импорт выписки: весь файл в память против потокового importer.import_file
+
+Для каждого размера генерируется CSV-выписка и импортируется в пустую
+базу в отдельном процессе (чтобы пиковая память процесса относилась
+только к одному импорту): сначала целиком (все строки в список и одна
+запись), затем потоково пачками. Потом тот же файл импортируется
+повторно - все строки должны оказаться дублями.
+Запуск: python -m benchmarks.bench_import [--rows 20000,100000,400000]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import rare_words
+
+
+def generate_statement(path, rows, seed=0):
+    """CSV в формате профиля generic"""
+    rnd = random.Random(seed)
+    start = date(2015, 1, 1)
+    words = ['обед', 'такси', 'кино', 'аптека', 'продукты', 'аренда', 'бензин', 'зп', 'кофе', 'подарок']
+    places = rare_words()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('date;amount;category;description\n')
+        for i in range(rows):
+            day = start + timedelta(days=i * 3650 // rows)
+            amount = rnd.uniform(50, 5000) if rnd.random() < 0.1 else -rnd.uniform(50, 5000)
+            f.write(f"{day.isoformat()} {rnd.randrange(24):02}:{rnd.randrange(60):02}:00;"
+                    f"{amount:.2f}".replace('.', ',') + f";;{rnd.choice(words)} {rnd.choice(places)}\n")
+
+
+def worker(path, db_path, mode):
+    """Один импорт в отдельном процессе; печатает JSON с результатом"""
+    from benchmarks.common import use_database
+    database = use_database(db_path)
+    import importer
+
+    profile = importer.load_profiles(None)['generic']
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        if mode == 'память':
+            stats = importer.ImportStats()
+            rows = list(importer.read_statement(stream, profile, 1, stats))
+            stats.inserted, stats.duplicates = database.import_transactions(1, rows)
+        else:
+            stats = importer.import_file(stream, 1, profile)
+    elapsed = time.perf_counter() - started
+    database.close_db()
+    print(json.dumps({'rows': stats.read, 'inserted': stats.inserted, 'duplicates': stats.duplicates,
+                      'seconds': elapsed, 'maxrss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def run_worker(path, db_path, mode):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_import', '--worker', mode, path, db_path],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='20000,100000,400000')
+    parser.add_argument('--worker', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        mode, path, db_path = args.worker
+        worker(path, db_path, mode)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in (int(value) for value in args.rows.split(',')):
+            path = os.path.join(directory, f'statement_{rows}.csv')
+            generate_statement(path, rows)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            for mode in ('память', 'поток', 'повтор'):
+                db_path = os.path.join(directory, f'{rows}_{"поток" if mode == "повтор" else mode}.db')
+                result = run_worker(path, db_path, 'поток' if mode == 'повтор' else mode)
+                print(f"{rows:>8} строк ({size_mb:6.1f} МБ) {mode:<7} {result['seconds']:>6.1f} с  "
+                      f"{result['rows'] / result['seconds']:>8,.0f} строк/с  память {result['maxrss_mb']:>6.0f} МБ  "
+                      f"добавлено {result['inserted']:>7}, дублей {result['duplicates']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Рассылка напоминаний под лимитами Telegram: отправка в цикле против outbox.Outbox
+
+Локальная замена Bot API отвечает 429 с retry_after, если бот отправляет
+больше --limit сообщений в секунду или чаще раза в секунду в один чат
+(с небольшим запасом). Бот рассылает --reminders напоминаний по --chats
+чатам, а в это время пользователи нажимают кнопки и ждут ответа.
+Сравниваются потерянные сообщения, число ответов 429 и задержка ответов
+пользователям.
+Запуск: python -m benchmarks.bench_outbox [--reminders 150] [--chats 50]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import web
+
+import outbox
+from outbox import Outbox, QueuedBot, TokenBucket
+
+TOKEN = '123456:fake-token'
+
+
+class FloodLimitedTelegram:
+    """Замена Bot API с ограничением частоты sendMessage"""
+
+    def __init__(self, limit, chat_rate, chat_burst):
+        self.limit = limit
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = None
+        self.chat_buckets = {}
+        self.delivered = 0
+        self.flooded = 0
+
+    async def handle(self, request):
+        form = await request.post()
+        now = time.monotonic()
+        if self.global_bucket is None:
+            self.global_bucket = TokenBucket(self.limit, self.limit, now)
+        chat_id = int(form['chat_id'])
+        chat = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst, now))
+        wait = max(self.global_bucket.delay(now), chat.delay(now))
+        if wait:
+            self.flooded += 1
+            retry_after = max(1, round(wait))
+            return web.json_response({'ok': False, 'error_code': 429,
+                                      'description': f'Too Many Requests: retry after {retry_after}',
+                                      'parameters': {'retry_after': retry_after}}, status=429)
+        self.global_bucket.take()
+        chat.take()
+        self.delivered += 1
+        await asyncio.sleep(0.02)  # сетевая задержка Bot API
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.delivered, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': ''}})
+
+
+async def send_reminders_in_loop(bot, reminders):
+    """Как check_and_send_reminders до очереди: по одному, ошибки только печатаются"""
+    failed = 0
+    for chat_id, text in reminders:
+        try:
+            await bot.send_message(chat_id, text)
+        except Exception:
+            failed += 1
+    return failed
+
+
+async def send_reminders_queued(bot, reminders):
+    with outbox.priority(outbox.REMINDER):
+        results = await asyncio.gather(*(bot.send_message(chat_id, text) for chat_id, text in reminders),
+                                       return_exceptions=True)
+    return sum(isinstance(result, Exception) for result in results)
+
+
+async def interactive_replies(bot, chats, count, interval):
+    """Ответы на нажатия кнопок во время рассылки; время от запроса до доставки"""
+    rnd = random.Random(1)
+    latencies = []
+    failed = 0
+    for _ in range(count):
+        await asyncio.sleep(interval)
+        started = time.perf_counter()
+        try:
+            await bot.send_message(rnd.randrange(1, chats + 1) + 10_000, 'ответ')
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            failed += 1
+    return latencies, failed
+
+
+async def run(args, mode):
+    fake = FloodLimitedTelegram(args.limit * 1.1, 1.0, 4)
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', fake.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.api_port).start()
+
+    server = TelegramAPIServer.from_base(f'http://127.0.0.1:{args.api_port}')
+    rnd = random.Random(0)
+    reminders = [(rnd.randrange(1, args.chats + 1), f'🔔 Напоминание {i}') for i in range(args.reminders)]
+    if mode == 'цикл':
+        bot = Bot(TOKEN, server=server)
+        send = send_reminders_in_loop
+    else:
+        bot = QueuedBot(TOKEN, server=server, outbox=Outbox(global_rate=args.limit))
+        send = send_reminders_queued
+
+    started = time.perf_counter()
+    (failed, (latencies, reply_failed)) = await asyncio.gather(
+        send(bot, reminders),
+        interactive_replies(bot, args.chats, args.replies, args.reminders / args.limit / args.replies),
+    )
+    elapsed = time.perf_counter() - started
+
+    if isinstance(bot, QueuedBot):
+        await bot.outbox.close()
+    await (await bot.get_session()).close()
+    await runner.cleanup()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+    print(f"{mode:<8} {elapsed:>6.1f} с  доставлено {fake.delivered:>4}  ответов 429 {fake.flooded:>4}  "
+          f"потеряно напоминаний {failed:>4}, ответов {reply_failed:>3}  "
+          f"ответ пользователю p50 {p50:>6.0f} мс, p99 {p99:>6.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', type=int, default=150)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--replies', type=int, default=20, help="ответов пользователям во время рассылки")
+    parser.add_argument('--limit', type=float, default=30, help="сообщений в секунду на бота")
+    parser.add_argument('--api-port', type=int, default=18083)
+    args = parser.parse_args()
+
+    for mode in ('цикл', 'очередь'):
+        asyncio.run(run(args, mode))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Глубокие страницы: LIMIT/OFFSET против постраничного вывода по ключу
+
+Запуск: python -m benchmarks.bench_pagination [--rows 500000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+
+from benchmarks.common import fill_transactions, timeit, use_database
+
+OFFSET_SQL = '''
+    SELECT id, type, amount, category, description, date, strftime('%H:%M', created_at)
+    FROM transactions
+    WHERE user_id = ? AND is_deleted = 0
+    ORDER BY date DESC, created_at DESC, id DESC
+    LIMIT ? OFFSET ?
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--page-size', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        database = use_database(path)
+        conn = sqlite3.connect(path)
+        fill_transactions(conn, args.rows)
+
+        print(f"{'глубина':>10} {'OFFSET, мс':>12} {'ключ, мс':>10}")
+        for depth in (0, 1_000, 10_000, 100_000):
+            if depth >= args.rows // 2:
+                break
+            # id строки на нужной глубине - курсор, который пришел бы из кнопки
+            cursor_id = conn.execute(OFFSET_SQL, (1, 1, depth)).fetchone()[0]
+
+            offset_ms = timeit(lambda: conn.execute(OFFSET_SQL, (1, args.page_size, depth + 1)).fetchall(),
+                               args.repeat)
+            keyset_ms = timeit(lambda: database.get_transactions_page(1, after_id=cursor_id,
+                                                                      limit=args.page_size),
+                               args.repeat)
+            print(f"{depth:>10} {offset_ms:>12.2f} {keyset_ms:>10.2f}")
+
+        conn.close()
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Фильтр по месяцу: strftime('%Y-%m', date) против полуоткрытого диапазона дат
+
+Запуск: python -m benchmarks.bench_periods [--rows 2000000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+
+from benchmarks.common import fill_transactions, query_plan, timeit, use_database
+
+OLD_SQL = '''
+    SELECT SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+           SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+           COUNT(*)
+    FROM transactions
+    WHERE user_id = ? AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now') AND is_deleted = 0
+'''
+
+NEW_SQL = '''
+    SELECT SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END),
+           SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+           COUNT(*)
+    FROM transactions
+    WHERE user_id = ? AND is_deleted = 0 AND date >= ? AND date < ?
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        database = use_database(path)
+        from periods import period_bounds
+
+        conn = sqlite3.connect(path)
+        print(f"Заполнение {args.rows} строк...")
+        fill_transactions(conn, args.rows)
+        conn.execute('ANALYZE')
+
+        start, end = period_bounds('month')
+        print(f"старый план: {query_plan(conn, OLD_SQL, (1,))}")
+        print(f"новый план:  {query_plan(conn, NEW_SQL, (1, start, end))}")
+
+        old_ms = timeit(lambda: conn.execute(OLD_SQL, (1,)).fetchone(), args.repeat)
+        new_ms = timeit(lambda: conn.execute(NEW_SQL, (1, start, end)).fetchone(), args.repeat)
+        conn.close()
+
+        funcs = {
+            'get_period_statistics': lambda: database.get_period_statistics(1, 'month'),
+            'get_user_transactions': lambda: database.get_user_transactions(1, 'month'),
+            'get_common_categories_statistics': database.get_common_categories_statistics,
+            'get_monthly_comparison': database.get_monthly_comparison,
+            'get_shared_expenses_by_category': database.get_shared_expenses_by_category,
+            'get_combined_statistics': database.get_combined_statistics,
+        }
+        print(f"\nstrftime-фильтр: {old_ms:8.2f} мс")
+        print(f"диапазон дат:    {new_ms:8.2f} мс")
+        for name, func in funcs.items():
+            print(f"{name:34} {timeit(func, args.repeat):8.2f} мс")
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Фабрики строк: кортежи, sqlite3.Row, словари и записи records.py
+
+Сравнивает время выборки и память на удержание результата.
+Запуск: python -m benchmarks.bench_records [--rows 200000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import tracemalloc
+
+from benchmarks.common import fill_transactions, timeit, use_database
+
+SQL = '''
+    SELECT id, user_id, type, amount, category, description, date, strftime('%H:%M', created_at)
+    FROM transactions
+    LIMIT ?
+'''
+
+
+def dict_factory(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def fetch(conn, factory, rows):
+    cursor = conn.cursor()
+    if factory is not None:
+        cursor.row_factory = factory
+    return cursor.execute(SQL, (rows,)).fetchall()
+
+
+def retained_memory(conn, factory, rows):
+    """Сколько байт занимает результат fetchall()"""
+    tracemalloc.start()
+    result = fetch(conn, factory, rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        database = use_database(path)
+        from records import TRANSACTION_ROW
+
+        conn = sqlite3.connect(path)
+        fill_transactions(conn, args.rows)
+
+        factories = (
+            ('tuple', None),
+            ('sqlite3.Row', sqlite3.Row),
+            ('dict', dict_factory),
+            ('records', TRANSACTION_ROW),
+        )
+        print(f"{'фабрика':>12} {'мс':>10} {'МБ':>8}")
+        for name, factory in factories:
+            ms = timeit(lambda: fetch(conn, factory, args.rows), args.repeat)
+            megabytes = retained_memory(conn, factory, args.rows) / 2 ** 20
+            print(f"{name:>12} {ms:>10.1f} {megabytes:>8.1f}")
+
+        conn.close()
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Повторяющиеся планы и транзакции: развертка правил на окно в год
+
+Тысячи правил (каждый день, дни недели, раз в 2 недели, число месяца,
+последний день, n-й день недели) с датами начала за последние 3 года.
+Замеряются развертка окна в год в Python (occurrences и recurrence_count),
+запросы database.py с этими правилами (get_user_plans, статистика) и,
+для сравнения, материализация повторов на год вперед отдельными строками.
+Запуск: python -m benchmarks.bench_recurrence [--rules 1000,5000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.common import timeit, use_database
+
+RULES = ('FREQ=DAILY', 'FREQ=DAILY;INTERVAL=3', 'FREQ=WEEKLY;BYDAY={day}', 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+         'FREQ=WEEKLY;INTERVAL=2;BYDAY={day}', 'FREQ=MONTHLY;BYMONTHDAY={monthday}', 'FREQ=MONTHLY;BYMONTHDAY=-1',
+         'FREQ=MONTHLY;BYDAY={nth}{day}', 'FREQ=MONTHLY;BYDAY=-1{day}')
+
+
+def random_rules(count, today, seed=0):
+    """Случайные (правило, дата начала)"""
+    rnd = random.Random(seed)
+    return [(rnd.choice(RULES).format(day=rnd.choice(('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')),
+                                      monthday=rnd.randint(1, 31), nth=rnd.randint(1, 4)),
+             (today - timedelta(days=rnd.randrange(365 * 3))).isoformat())
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', default='1000,5000', help="числа правил через запятую")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        database = use_database(path)
+        import recurrence
+        database.add_user(1, 'user1', 'Пользователь 1')
+        today = database.get_user_today(1)
+        since, until = today.isoformat(), (today + timedelta(days=365)).isoformat()
+
+        added = 0
+        for count in map(int, args.rules.split(',')):
+            rules = random_rules(count, today)
+            print(f"\n{count} правил, окно {since} - {until}")
+
+            started = time.perf_counter()
+            dates = [list(recurrence.occurrences(rule, start, since, until)) for rule, start in rules]
+            expand = time.perf_counter() - started
+            total = sum(map(len, dates))
+            counted_ms = timeit(lambda: [recurrence.count_occurrences(rule, start, None, since, until)
+                                         for rule, start in rules], args.repeat)
+            print(f"occurrences:      {expand * 1000:8.1f} мс  {total} повторов ({total / expand:,.0f} повт/с)")
+            print(f"recurrence_count: {counted_ms:8.1f} мс")
+
+            # Половина - планы, половина - транзакции; в базе накапливаются правила всех прогонов
+            futures = []
+            for index, (rule, start) in enumerate(rules[added:] if added < count else []):
+                if index % 2:
+                    futures.append(database.add_recurring_transaction.submit(1, 'expense', 100, 'Жилье', '',
+                                                                             rule, start))
+                else:
+                    futures.append(database.add_plan.submit(1, f'План {index}', '', start, '09:00', 'Дом',
+                                                            recurrence=rule))
+            for future in futures:
+                future.result()
+            added = max(added, count)
+
+            queries = {
+                'get_user_plans (день)': lambda: database.get_user_plans(1, today.isoformat()),
+                'get_period_statistics (месяц)': lambda: database.get_period_statistics(1, 'month'),
+                'get_period_statistics (год)': lambda: database.get_period_statistics(1, (today - timedelta(days=364),
+                                                                                          today + timedelta(days=1))),
+                'get_period_statistics (все)': lambda: database.get_period_statistics(1, 'all'),
+            }
+            for name, func in queries.items():
+                print(f"{name:32} {timeit(func, args.repeat):8.2f} мс")
+
+            # Для сравнения: те же повторы отдельными строками на год вперед
+            conn = sqlite3.connect(os.path.join(directory, f'materialized{count}.db'))
+            conn.execute('CREATE TABLE occurrences (rule_id INTEGER, date TEXT)')
+            conn.execute('CREATE INDEX idx_occurrences_date ON occurrences (date)')
+            started = time.perf_counter()
+            with conn:
+                conn.executemany('INSERT INTO occurrences VALUES (?, ?)',
+                                 ((rule_id, day.isoformat()) for rule_id, days in enumerate(dates) for day in days))
+            insert = time.perf_counter() - started
+            conn.close()
+            size = os.path.getsize(os.path.join(directory, f'materialized{count}.db')) / 1024 / 1024
+            print(f"материализация на год: {total} строк вместо {count}, вставка {insert * 1000:.0f} мс, "
+                  f"{size:.1f} МБ")
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
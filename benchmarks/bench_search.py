@@ -0,0 +1,49 @@
+"""Поиск транзакций: LIKE '%текст%' против FTS5 при росте истории
+
+Запуск: python -m benchmarks.bench_search [--sizes 10000 100000 500000]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+
+from benchmarks.common import fill_transactions, rare_words, timeit, use_database
+
+LIKE_SQL = '''
+    SELECT id FROM transactions
+    WHERE user_id = ? AND is_deleted = 0 AND (description LIKE ? OR category LIKE ?)
+    ORDER BY date DESC, created_at DESC
+    LIMIT 50
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--text', default=rare_words()[7],
+                        help='искомое слово (по умолчанию - редкое название места)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        database = use_database(path)
+        conn = sqlite3.connect(path)
+
+        print(f"{'строк':>10} {'LIKE, мс':>10} {'FTS5, мс':>10}")
+        loaded = 0
+        for size in sorted(args.sizes):
+            fill_transactions(conn, size - loaded, seed=size)
+            loaded = size
+
+            pattern = f'%{args.text}%'
+            like_ms = timeit(lambda: conn.execute(LIKE_SQL, (1, pattern, pattern)).fetchall(), args.repeat)
+            fts_ms = timeit(lambda: database.search_transactions(1, args.text), args.repeat)
+            print(f"{size:>10} {like_ms:>10.2f} {fts_ms:>10.2f}")
+
+        conn.close()
+        database.close_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Нагрузочный тест приема обновлений: long polling против webhook
+
+Поднимает локальную замену Bot API (getUpdates, sendMessage и т.д.),
+бот обрабатывает N обновлений простым обработчиком, который отвечает
+одним sendMessage. В режиме polling обновления отдает getUpdates,
+в режиме webhook их присылает генератор POST-запросами в webhook.py.
+Генератор - отдельный процесс: на одном ядре он отнимает процессор у бота,
+поэтому кроме времени печатается процессорное время самого бота на обновление.
+Запуск: python -m benchmarks.bench_updates [--updates 5000] [--handler-ms 5]
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiohttp import ClientSession, web
+
+import webhook
+
+TOKEN = '123456:fake-token'
+SECRET = 'bench-secret'
+
+
+def make_update(update_id, chats):
+    chat_id = 1 + update_id % chats
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': f'сообщение {update_id}',
+        },
+    }
+
+
+class FakeTelegram:
+    """Замена Bot API: отдает обновления через getUpdates и считает sendMessage"""
+
+    def __init__(self, updates):
+        self.pending = list(updates)
+        self.sent = 0
+
+    async def handle(self, request):
+        method = request.match_info['method'].lower()
+        form = await request.post()
+        if method == 'getupdates':
+            offset = int(form.get('offset', 0) or 0)
+            limit = int(form.get('limit', 100) or 100)
+            self.pending = [update for update in self.pending if update['update_id'] >= offset]
+            batch = self.pending[:limit]
+            if not batch:
+                await asyncio.sleep(0.05)  # пустой long poll
+            return web.json_response({'ok': True, 'result': batch})
+        if method == 'sendmessage':
+            self.sent += 1
+            chat_id = int(form['chat_id'])
+            return web.json_response({'ok': True, 'result': {
+                'message_id': self.sent, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'},
+                'text': form.get('text', ''),
+            }})
+        if method == 'getme':
+            return web.json_response({'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench'}})
+        return web.json_response({'ok': True, 'result': True})
+
+
+async def start_site(app, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+def make_dispatcher(api_port, total, handler_delay):
+    """Бот с обработчиком-эхом; done срабатывает после total обработанных сообщений"""
+    bot = Bot(TOKEN, server=TelegramAPIServer.from_base(f'http://127.0.0.1:{api_port}'))
+    dp = Dispatcher(bot)
+    done = asyncio.Event()
+    handled = itertools.count(1)
+
+    @dp.message_handler()
+    async def echo(message: types.Message):
+        if handler_delay:
+            await asyncio.sleep(handler_delay)
+        await message.answer('ok')
+        if next(handled) == total:
+            done.set()
+
+    return dp, done
+
+
+async def bench_polling(args):
+    fake = FakeTelegram(make_update(i, args.chats) for i in range(1, args.updates + 1))
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', fake.handle)
+    api = await start_site(app, args.api_port)
+
+    dp, done = make_dispatcher(args.api_port, args.updates, args.handler_ms / 1000)
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    started, cpu = time.perf_counter(), time.process_time()
+    polling = asyncio.create_task(dp.start_polling(reset_webhook=False, timeout=1, relax=0))
+    await done.wait()
+    elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu
+
+    dp.stop_polling()
+    await polling
+    await (await dp.bot.get_session()).close()
+    await api.cleanup()
+    return {'mode': 'polling', 'elapsed': elapsed, 'cpu': cpu, 'sent': fake.sent}
+
+
+async def bench_webhook(args):
+    fake = FakeTelegram(())
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', fake.handle)
+    api = await start_site(app, args.api_port)
+
+    dp, done = make_dispatcher(args.api_port, args.updates, args.handler_ms / 1000)
+    workers = webhook.UpdateWorkers(dp, args.workers, args.max_pending)
+    workers.start()
+    server = await start_site(webhook.create_app(workers, '/webhook', SECRET), args.webhook_port)
+
+    # Запросы шлет отдельный процесс, как это делал бы Telegram
+    results = multiprocessing.Queue()
+    started, cpu = time.perf_counter(), time.process_time()
+    sender = multiprocessing.Process(target=send_updates, args=(args, results))
+    sender.start()
+    await done.wait()
+    elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu
+    acked, retries, acks = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    sender.join()
+
+    await workers.stop()
+    await server.cleanup()
+    await (await dp.bot.get_session()).close()
+    await api.cleanup()
+    return {'mode': 'webhook', 'elapsed': elapsed, 'cpu': cpu, 'sent': fake.sent, 'acked': acked, 'retries': retries,
+            'ack_p50': acks[len(acks) // 2] * 1000, 'ack_p99': acks[int(len(acks) * 0.99)] * 1000}
+
+
+def send_updates(args, results):
+    """Процесс-генератор: POST обновлений в webhook с concurrency параллельными запросами"""
+    url = f'http://127.0.0.1:{args.webhook_port}/webhook'
+    ids = iter(range(1, args.updates + 1))
+    acks = []
+    retries = 0
+
+    async def sender(session):
+        nonlocal retries
+        for update_id in ids:
+            update = make_update(update_id, args.chats)
+            while True:
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers={webhook.SECRET_HEADER: SECRET}) as response:
+                    status = response.status
+                acks.append(time.perf_counter() - started)
+                if status == 200:
+                    break
+                retries += 1  # 503: очередь полна, Telegram повторил бы позже
+                await asyncio.sleep(0.01)
+
+    async def run():
+        started = time.perf_counter()
+        async with ClientSession() as session:
+            # Неверный секрет должен отклоняться
+            headers = {webhook.SECRET_HEADER: 'wrong'}
+            async with session.post(url, json=make_update(0, 1), headers=headers) as response:
+                assert response.status == 401, response.status
+            await asyncio.gather(*(sender(session) for _ in range(args.concurrency)))
+        return time.perf_counter() - started
+
+    acked = asyncio.run(run())
+    results.put((acked, retries, sorted(acks)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--handler-ms', type=float, default=5, help="имитация работы обработчика")
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--max-pending', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16, help="параллельных POST в режиме webhook")
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--webhook-port', type=int, default=18082)
+    args = parser.parse_args()
+
+    for bench in (bench_polling, bench_webhook):
+        result = asyncio.run(bench(args))
+        line = (f"{result['mode']:<8} {args.updates / result['elapsed']:>8,.0f} обновлений/с "
+                f"({result['elapsed']:.2f} с, ответов {result['sent']}, "
+                f"CPU бота {result['cpu'] / args.updates * 1000:.2f} мс/обновление)")
+        if 'acked' in result:
+            line += (f", прием {args.updates / result['acked']:,.0f}/с, "
+                     f"ответ webhook p50 {result['ack_p50']:.2f} мс, p99 {result['ack_p99']:.2f} мс, "
+                     f"повторов после 503: {result['retries']}")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import rollups
+
+
+def use_database(db_path):
+    """Подключить database.py к отдельному файлу БД для замеров
+
+    Переменные окружения нужно выставить до первого импорта config.
+    """
+    os.environ['DB_PATH'] = db_path
+    os.environ['DB_SHARDS'] = db_path
+    os.environ.setdefault('MY_USER_ID', '1')
+    os.environ.setdefault('GIRLFRIEND_USER_ID', '2')
+    import database
+    database.init_db()
+    return database
+
+
+def rare_words(count=2000):
+    """Словарь редких слов (названия мест), одинаковый при каждом запуске"""
+    syllables = ['ба', 'ве', 'го', 'да', 'ки', 'ло', 'му', 'ны', 'ро', 'су', 'та', 'фи', 'ша', 'ёж']
+    rnd = random.Random(0)
+    return [''.join(rnd.choice(syllables) for _ in range(4)) + str(i) for i in range(count)]
+
+
+def fill_transactions(conn, rows, users=(1, 2), years=3, seed=42, batch=50000):
+    """Быстро заполнить таблицу transactions случайными строками"""
+    rnd = random.Random(seed)
+    today = date.today()
+    categories = ['Еда', 'Транспорт', 'Развлечения', 'Одежда', 'Жилье', 'Здоровье', 'Подарки', 'Другое']
+    words = ['обед', 'ужин', 'кафе', 'такси', 'метро', 'кино', 'аптека', 'продукты',
+             'подарок', 'куртка', 'аренда', 'коммуналка', 'бензин', 'кофе', 'ёлка', 'книга']
+    places = rare_words()
+
+    def generate():
+        for _ in range(rows):
+            day = today - timedelta(days=rnd.randrange(365 * years))
+            trans_type = 'income' if rnd.random() < 0.1 else 'expense'
+            yield (rnd.choice(users), trans_type, round(rnd.uniform(50, 5000), 2),
+                   rnd.choice(categories), f'{rnd.choice(words)} {rnd.choice(places)}', day.isoformat(), int(rnd.random() < 0.02))
+
+    conn.executemany(
+        'INSERT OR IGNORE INTO users (id, username, full_name) VALUES (?, ?, ?)',
+        [(user_id, f'user{user_id}', f'Пользователь {user_id}') for user_id in users]
+    )
+
+    it = generate()
+    while True:
+        chunk = [row for _, row in zip(range(batch), it)]
+        if not chunk:
+            break
+        conn.executemany('''
+            INSERT INTO transactions (user_id, type, amount, category, description, date, is_deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', chunk)
+    # Строки вставлены в обход database.py, поэтому агрегаты пересчитываем
+    rollups.rebuild(conn.cursor())
+    conn.commit()
+
+
+def timeit(func, repeat=20):
+    """Среднее время вызова в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def query_plan(conn, sql, params=()):
+    """Текст EXPLAIN QUERY PLAN"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "; ".join(row[-1] for row in rows)
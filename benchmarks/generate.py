@@ -0,0 +1,201 @@
+"""Генератор синтетических данных для замеров database.py
+
+Заполняет transactions, plans и planned_purchases правдоподобными строками:
+категории с перекосом (частые траты встречаются намного чаще редких),
+даты за несколько лет, суммы с длинным хвостом, часть строк удалена.
+При одинаковом --seed результат одинаковый.
+
+Запуск: python -m benchmarks.generate bench.db [--transactions 1000000]
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import rollups
+
+# Категории в порядке убывания частоты и типичная сумма траты
+EXPENSE_CATEGORIES = (
+    ('Еда', 600), ('Транспорт', 250), ('Развлечения', 1500), ('Здоровье', 1200),
+    ('Одежда', 3500), ('Подарки', 2500), ('Жилье', 25000), ('Другое', 800),
+)
+INCOME_CATEGORIES = (('Зарплата', 90000), ('Подработка', 15000), ('Подарок', 5000), ('Другое', 3000))
+PLAN_CATEGORIES = ('личные', 'работа', 'встречи', 'здоровье', 'покупки', 'путешествия')
+PRIORITIES = ('high', 'medium', 'low')
+
+WORDS = ('обед', 'ужин', 'кафе', 'такси', 'метро', 'кино', 'аптека', 'продукты', 'подарок',
+         'куртка', 'аренда', 'коммуналка', 'бензин', 'кофе', 'ёлка', 'книга', 'врач', 'концерт')
+PLAN_TITLES = ('Встреча', 'Созвон', 'Врач', 'Оплатить', 'Купить', 'Позвонить', 'Тренировка', 'Поездка')
+ITEMS = ('Ноутбук', 'Телефон', 'Наушники', 'Пылесос', 'Куртка', 'Кроссовки', 'Велосипед', 'Диван')
+
+# Доля мягко удаленных строк
+DELETED_SHARE = 0.03
+
+
+def zipf_weights(count, s=1.1):
+    """Веса по закону Ципфа: первый элемент самый частый"""
+    return [1 / (rank ** s) for rank in range(1, count + 1)]
+
+
+def _random_day(rnd, today, years):
+    """Случайный день за последние years лет, недавние дни чуть чаще"""
+    return today - timedelta(days=int(365 * years * rnd.random() ** 1.3))
+
+
+def _amount(rnd, typical):
+    """Сумма с логнормальным разбросом вокруг типичной"""
+    return round(typical * math.exp(rnd.gauss(0, 0.6)), 2)
+
+
+def _insert_chunks(conn, sql, rows, batch, label, total):
+    """Вставить строки пачками по batch, печатая прогресс"""
+    done = 0
+    started = time.perf_counter()
+    while True:
+        chunk = [row for _, row in zip(range(batch), rows)]
+        if not chunk:
+            break
+        conn.executemany(sql, chunk)
+        conn.commit()
+        done += len(chunk)
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"  {label}: {done}/{total} ({rate:,.0f} строк/с)", flush=True)
+
+
+def household_of(user_id, household_size):
+    """Домохозяйство пользователя: соседние id объединяются по household_size"""
+    return (user_id - 1) // household_size + 1
+
+
+def generate_transactions(rnd, count, users, years, today, household_size):
+    """Строки transactions: (user_id, household_id, type, amount, category, description, date,
+    created_at, is_deleted)"""
+    user_weights = zipf_weights(len(users), 0.5)
+    expense_weights = zipf_weights(len(EXPENSE_CATEGORIES))
+    income_weights = zipf_weights(len(INCOME_CATEGORIES))
+
+    for _ in range(count):
+        day = _random_day(rnd, today, years)
+        if rnd.random() < 0.08:
+            trans_type = 'income'
+            category, typical = rnd.choices(INCOME_CATEGORIES, income_weights)[0]
+        else:
+            trans_type = 'expense'
+            category, typical = rnd.choices(EXPENSE_CATEGORIES, expense_weights)[0]
+        description = rnd.choice(WORDS) if rnd.random() < 0.7 else None
+        created_at = datetime.combine(day, datetime.min.time()) + timedelta(seconds=rnd.randrange(86400))
+        user_id = rnd.choices(users, user_weights)[0]
+        yield (user_id, household_of(user_id, household_size), trans_type, _amount(rnd, typical), category,
+               description, day.isoformat(), created_at.strftime('%Y-%m-%d %H:%M:%S'),
+               int(rnd.random() < DELETED_SHARE))
+
+
+def generate_plans(rnd, count, users, years, today, household_size):
+    """Строки plans: планы в прошлом и на полгода вперед"""
+    category_weights = zipf_weights(len(PLAN_CATEGORIES))
+    for _ in range(count):
+        if rnd.random() < 0.2:
+            day = today + timedelta(days=rnd.randrange(180))
+        else:
+            day = _random_day(rnd, today, years)
+        plan_time = f"{rnd.randrange(8, 22):02d}:{rnd.choice((0, 15, 30, 45)):02d}" if rnd.random() < 0.6 else None
+        notification_time = plan_time if plan_time and rnd.random() < 0.5 else None
+        user_id = rnd.choice(users)
+        yield (user_id, household_of(user_id, household_size), f"{rnd.choice(PLAN_TITLES)} {rnd.choice(WORDS)}",
+               rnd.choice(WORDS) if rnd.random() < 0.5 else None, day.isoformat(), plan_time,
+               rnd.choices(PLAN_CATEGORIES, category_weights)[0], int(rnd.random() < 0.3),
+               notification_time, int(rnd.random() < DELETED_SHARE))
+
+
+def generate_purchases(rnd, count, users, today, household_size):
+    """Строки planned_purchases: большинство еще не куплено"""
+    for _ in range(count):
+        target = today + timedelta(days=rnd.randrange(-90, 365)) if rnd.random() < 0.6 else None
+        user_id = rnd.choice(users)
+        yield (user_id, household_of(user_id, household_size), f"{rnd.choice(ITEMS)} {rnd.choice(WORDS)}",
+               _amount(rnd, 20000), rnd.choices(PRIORITIES, (1, 3, 2))[0],
+               target.isoformat() if target else None, rnd.choice(WORDS) if rnd.random() < 0.4 else None,
+               'bought' if rnd.random() < 0.25 else 'planned', int(rnd.random() < DELETED_SHARE))
+
+
+def generate(conn, transactions=1_000_000, plans=50_000, purchases=10_000,
+             users=(1, 2), years=3, seed=42, batch=50_000, household_size=2):
+    """Заполнить базу синтетическими данными и пересчитать агрегаты
+
+    Таблицы должны уже существовать (database.init_db). Строки пишутся
+    напрямую через executemany, FTS-индексы обновляются триггерами.
+    Пользователи объединяются в домохозяйства по household_size.
+    """
+    rnd = random.Random(seed)
+    today = date.today()
+
+    conn.executemany(
+        'INSERT OR IGNORE INTO users (id, username, full_name) VALUES (?, ?, ?)',
+        [(user_id, f'user{user_id}', f'Пользователь {user_id}') for user_id in users]
+    )
+    households = sorted({household_of(user_id, household_size) for user_id in users})
+    conn.executemany(
+        'INSERT OR IGNORE INTO households (id, name, invite_code) VALUES (?, ?, ?)',
+        [(household_id, f'Бюджет {household_id}', f'code{household_id}') for household_id in households]
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO household_members (user_id, household_id, role) VALUES (?, ?, ?)',
+        [(user_id, household_of(user_id, household_size), 'member') for user_id in users]
+    )
+    _insert_chunks(conn, '''
+        INSERT INTO transactions (user_id, household_id, type, amount, category, description, date,
+                                  created_at, is_deleted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate_transactions(rnd, transactions, users, years, today, household_size),
+        batch, 'transactions', transactions)
+    _insert_chunks(conn, '''
+        INSERT INTO plans (user_id, household_id, title, description, date, time, category, is_shared,
+                           notification_time, is_deleted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate_plans(rnd, plans, users, years, today, household_size), batch, 'plans', plans)
+    _insert_chunks(conn, '''
+        INSERT INTO planned_purchases (user_id, household_id, item_name, estimated_cost, priority,
+                                       target_date, notes, status, is_deleted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate_purchases(rnd, purchases, users, today, household_size),
+        batch, 'planned_purchases', purchases)
+
+    # Строки вставлены в обход database.py, поэтому агрегаты пересчитываем
+    rollups.rebuild(conn.cursor())
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('db_path')
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--plans', type=int, default=50_000)
+    parser.add_argument('--purchases', type=int, default=10_000)
+    parser.add_argument('--users', type=int, default=2, help="число пользователей (id с 1)")
+    parser.add_argument('--household-size', type=int, default=2)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db_path):
+        parser.error(f"{args.db_path} уже существует")
+
+    from benchmarks.common import use_database
+    database = use_database(args.db_path)
+    database.close_db()
+
+    conn = sqlite3.connect(args.db_path)
+    started = time.perf_counter()
+    generate(conn, args.transactions, args.plans, args.purchases,
+             tuple(range(1, args.users + 1)), args.years, args.seed, household_size=args.household_size)
+    conn.close()
+    print(f"✅ {args.db_path} заполнена за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Замеры всех публичных функций database.py
+
+Каждая функция вызывается repeat раз на копии базы; для каждого сценария
+выводятся p50/p95/p99 задержки и строк/с, результат можно сохранить
+в JSON и сравнить с прошлым запуском.
+
+Запуск:
+    python -m benchmarks.generate bench.db
+    python -m benchmarks.run --db bench.db --output before.json
+    python -m benchmarks.run --db bench.db --compare before.json
+Без --db база генерируется во временном каталоге (--transactions строк).
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import use_database
+from benchmarks.generate import EXPENSE_CATEGORIES, WORDS, generate
+
+# Функции, которые не замеряются: управляют жизненным циклом модуля
+# или меняют состав домохозяйств, на которых построены остальные сценарии
+NOT_MEASURED = {'close_db', 'init_db', 'create_household', 'join_household'}
+
+
+class Context:
+    """Случайные аргументы для вызовов, взятые из реальных данных базы"""
+
+    def __init__(self, conn, seed):
+        self.rnd = random.Random(seed)
+        self.today = date.today()
+        self.users = [row[0] for row in conn.execute('SELECT id FROM users')]
+        self.households = [row[0] for row in conn.execute('SELECT id FROM households')]
+        self.ids = {}
+        for table in ('transactions', 'plans', 'planned_purchases'):
+            self.ids[table] = [row[0] for row in conn.execute(f'SELECT id FROM {table} WHERE is_deleted = 0')]
+
+    def user(self):
+        return self.rnd.choice(self.users)
+
+    def household(self):
+        return self.rnd.choice(self.households)
+
+    def id(self, table):
+        return self.rnd.choice(self.ids[table]) if self.ids[table] else 0
+
+    def pop_id(self, table):
+        # Удаляемые строки убираем из выборки, чтобы не удалять дважды
+        ids = self.ids[table]
+        if not ids:
+            return 0
+        return ids.pop(self.rnd.randrange(len(ids)))
+
+    def category(self):
+        return self.rnd.choice(EXPENSE_CATEGORIES)[0]
+
+    def word(self):
+        return self.rnd.choice(WORDS)
+
+    def day(self, back=365):
+        return (self.today - timedelta(days=self.rnd.randrange(back))).isoformat()
+
+
+# (сценарий, функция, построитель аргументов, множитель повторов)
+# Построитель вызывается перед каждым вызовом и возвращает (args, kwargs)
+CASES = [
+    ('get_user', 'get_user', lambda c: ((c.user(),), {}), 1),
+    ('get_transaction', 'get_transaction', lambda c: ((c.id('transactions'),), {}), 1),
+    ('get_user_transactions[today]', 'get_user_transactions', lambda c: ((c.user(), 'today'), {}), 1),
+    ('get_user_transactions[week]', 'get_user_transactions', lambda c: ((c.user(), 'week'), {}), 1),
+    ('get_user_transactions[month]', 'get_user_transactions', lambda c: ((c.user(), 'month'), {}), 1),
+    ('get_user_transactions[all]', 'get_user_transactions', lambda c: ((c.user(), 'all', 'expense'), {}), 0.2),
+    ('get_transactions_page[first]', 'get_transactions_page', lambda c: ((c.user(), 'expense'), {}), 1),
+    ('get_transactions_page[deep]', 'get_transactions_page',
+     lambda c: ((c.user(),), {'after_id': c.id('transactions')}), 1),
+    ('get_recent_transactions', 'get_recent_transactions', lambda c: ((c.user(),), {}), 1),
+    ('search_transactions[text]', 'search_transactions', lambda c: ((c.user(), c.word()), {}), 0.5),
+    ('search_transactions[filters]', 'search_transactions',
+     lambda c: ((c.user(),), {'category': c.category(), 'min_amount': 1000, 'date_from': c.day()}), 0.5),
+    ('get_plan', 'get_plan', lambda c: ((c.id('plans'),), {}), 1),
+    ('get_user_plans[all]', 'get_user_plans', lambda c: ((c.user(),), {}), 0.2),
+    ('get_user_plans[day]', 'get_user_plans', lambda c: ((c.user(), c.day(30)), {}), 1),
+    ('get_shared_plans', 'get_shared_plans', lambda c: ((c.household(),), {}), 0.2),
+    ('search_plans', 'search_plans', lambda c: ((c.user(), c.word()), {}), 0.5),
+    ('get_purchase', 'get_purchase', lambda c: ((c.id('planned_purchases'),), {}), 1),
+    ('get_user_purchases', 'get_user_purchases', lambda c: ((c.user(),), {}), 0.5),
+    ('search_purchases', 'search_purchases', lambda c: ((c.user(), c.word()), {'max_cost': 30000}), 0.5),
+    ('get_pending_reminders', 'get_pending_reminders', lambda c: ((f'{c.day(1)} 00:00:00', f'{c.day(1)} 23:59:59'), {}), 1),
+    ('get_period_statistics[month]', 'get_period_statistics', lambda c: ((c.user(), 'month'), {}), 1),
+    ('get_period_statistics[all]', 'get_period_statistics', lambda c: ((c.user(), 'all'), {}), 1),
+    ('get_common_categories_statistics', 'get_common_categories_statistics',
+     lambda c: ((c.household(),), {}), 1),
+    ('get_daily_combined_expenses', 'get_daily_combined_expenses', lambda c: ((c.household(), c.day(30)), {}), 1),
+    ('get_monthly_comparison', 'get_monthly_comparison', lambda c: ((c.household(),), {}), 1),
+    ('get_shared_expenses_by_category', 'get_shared_expenses_by_category',
+     lambda c: ((c.household(),), {}), 1),
+    ('get_combined_statistics', 'get_combined_statistics', lambda c: ((c.household(), 'month'), {}), 1),
+    ('get_weekly_summary', 'get_weekly_summary', lambda c: ((c.household(),), {}), 1),
+    ('get_household_id', 'get_household_id', lambda c: ((c.user(),), {}), 1),
+    ('get_household', 'get_household', lambda c: ((c.household(),), {}), 1),
+    ('get_household_members', 'get_household_members', lambda c: ((c.household(),), {}), 1),
+    ('add_user', 'add_user', lambda c: ((c.user(), 'user', 'Пользователь'), {}), 1),
+    ('add_transaction', 'add_transaction',
+     lambda c: ((c.user(), 'expense', 500.0, c.category(), c.word()), {}), 1),
+    ('update_transaction', 'update_transaction',
+     lambda c: ((c.id('transactions'),), {'amount': 700.0, 'category': c.category()}), 1),
+    ('soft_delete_transaction', 'soft_delete_transaction', lambda c: ((c.pop_id('transactions'),), {}), 1),
+    ('add_plan', 'add_plan', lambda c: ((c.user(), 'Встреча', c.word(), c.day(30), '12:00'), {}), 1),
+    ('update_plan', 'update_plan', lambda c: ((c.id('plans'),), {'title': 'Созвон'}), 1),
+    ('soft_delete_plan', 'soft_delete_plan', lambda c: ((c.pop_id('plans'),), {}), 1),
+    ('add_planned_purchase', 'add_planned_purchase',
+     lambda c: ((c.user(), 'Телефон', 30000.0, 'medium'), {}), 1),
+    ('update_purchase', 'update_purchase', lambda c: ((c.id('planned_purchases'),), {'status': 'bought'}), 1),
+    ('soft_delete_purchase', 'soft_delete_purchase', lambda c: ((c.pop_id('planned_purchases'),), {}), 1),
+    ('get_shard_report', 'get_shard_report', lambda c: ((), {}), 0.2),
+    ('verify_rollups', 'verify_rollups', lambda c: ((), {}), 0),
+    ('rebuild_rollups', 'rebuild_rollups', lambda c: ((), {}), 0),
+]
+
+
+def percentile(sorted_values, q):
+    """Перцентиль q (0..100) методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def count_rows(result):
+    """Сколько строк вернула функция"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])  # get_transactions_page: (rows, has_prev, has_next)
+    return 0 if result is None else 1
+
+
+def measure(func, build_args, ctx, repeat):
+    """Вызвать функцию repeat раз, вернуть сводку задержек"""
+    args, kwargs = build_args(ctx)
+    func(*args, **kwargs)  # прогрев кэша страниц
+
+    samples = []
+    rows = 0
+    for _ in range(repeat):
+        args, kwargs = build_args(ctx)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        samples.append(time.perf_counter() - start)
+        rows += count_rows(result)
+
+    samples.sort()
+    total = sum(samples)
+    return {
+        'calls': repeat,
+        'p50_ms': round(percentile(samples, 50) * 1000, 4),
+        'p95_ms': round(percentile(samples, 95) * 1000, 4),
+        'p99_ms': round(percentile(samples, 99) * 1000, 4),
+        'mean_ms': round(total / repeat * 1000, 4),
+        'rows': rows,
+        'rows_per_sec': round(rows / total, 1) if total else 0.0,
+    }
+
+
+def git_commit():
+    """Текущий коммит, если запуск из git-репозитория"""
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=repo).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def table_sizes(conn):
+    return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('transactions', 'plans', 'planned_purchases')}
+
+
+def print_report(results, baseline=None):
+    """Таблица результатов; с baseline - изменение p50 и p95 в процентах"""
+    header = f"{'сценарий':<36} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'строк/с':>12}"
+    if baseline:
+        header += f" {'Δp50':>8} {'Δp95':>8}"
+    print(header)
+    for name, stats in results.items():
+        line = (f"{name:<36} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+                f"{stats['p99_ms']:>9.3f} {stats['rows_per_sec']:>12,.0f}")
+        old = (baseline or {}).get(name)
+        if old:
+            for key in ('p50_ms', 'p95_ms'):
+                delta = (stats[key] / old[key] - 1) * 100 if old[key] else 0.0
+                line += f" {delta:>+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="база из benchmarks.generate (не изменяется, замеры идут на копии)")
+    parser.add_argument('--transactions', type=int, default=200_000, help="размер базы без --db")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', help="замерять только сценарии, содержащие эту подстроку")
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    parser.add_argument('--compare', help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        if args.db:
+            # Функции записи меняют данные, поэтому работаем с копией
+            with sqlite3.connect(args.db) as source, sqlite3.connect(path) as target:
+                source.backup(target)
+        database = use_database(path)
+
+        conn = sqlite3.connect(path)
+        if not args.db:
+            print(f"Генерация {args.transactions} транзакций...")
+            generate(conn, transactions=args.transactions, plans=args.transactions // 20,
+                     purchases=args.transactions // 100)
+        sizes = table_sizes(conn)
+        ctx = Context(conn, args.seed)
+        conn.close()
+
+        public = {name for name, func in inspect.getmembers(database, inspect.isfunction)
+                  if not name.startswith('_') and func.__module__ == database.__name__}
+        covered = {func_name for _, func_name, _, _ in CASES}
+        missing = sorted(public - covered - NOT_MEASURED)
+        if missing:
+            print(f"⚠️ Нет сценариев для: {', '.join(missing)}")
+
+        results = {}
+        for name, func_name, build_args, weight in CASES:
+            if args.only and args.only not in name:
+                continue
+            repeat = max(3, int(args.repeat * weight))
+            results[name] = dict(function=func_name, **measure(getattr(database, func_name), build_args,
+                                                               ctx, repeat))
+            print(f"  {name}: p50 {results[name]['p50_ms']:.3f} мс", file=sys.stderr)
+
+        database.close_db()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'tables': sizes,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'missing': missing,
+        'results': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
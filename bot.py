@@ -1,17 +1,37 @@
 import asyncio
+import csv
+import io
 import logging
+import secrets
 import sqlite3
-from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+import tempfile
+import time
+from aiogram import Dispatcher, types
 from aiogram.dispatcher import FSMContext
 from aiogram.utils import executor
-from datetime import datetime, date, timedelta
-
-from config import BOT_TOKEN, MY_USER_ID, GIRLFRIEND_USER_ID
-from database import *
+from aiogram.utils.exceptions import MessageNotModified
+from datetime import datetime, timedelta
+
+from config import (BOT_TOKEN, ADMIN_USER_ID, ALLOW_REGISTRATION,
+                    FSM_DB_PATH, FSM_TTL_HOURS, FSM_CACHE_SIZE, FSM_FLUSH_MS,
+                    BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET,
+                    WEBHOOK_WORKERS, WEBHOOK_MAX_PENDING,
+                    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST)
+import db_async as db
+from database import init_db, close_db
+from periods import get_zone, parse_zone
+import query_stats
+from fsm_storage import SQLiteStorage
+from outbox import Outbox, QueuedBot
+import delivery
+import importer
+import navigation
+import quick_entry
+import recurrence
+from routing import Router
 from keyboards import *
 from states import *
-from reminders import schedule_reminders
+from reminders import schedule_reminders, stop_reminders
 
 # Настройка логирования
 logging.basicConfig(
@@ -20,82 +40,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Инициализация бота: сообщения в чаты уходят через очередь с учетом лимитов Telegram
+bot = QueuedBot(token=BOT_TOKEN, outbox=Outbox(global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE,
+                                               chat_burst=OUTBOX_CHAT_BURST))
+# Состояния диалогов хранятся в SQLite и переживают перезапуск
+storage = SQLiteStorage(FSM_DB_PATH, ttl=FSM_TTL_HOURS * 3600, cache_size=FSM_CACHE_SIZE,
+                        flush_interval=FSM_FLUSH_MS / 1000)
 dp = Dispatcher(bot, storage=storage)
+# Кнопки меню и inline-кнопки ищутся в таблице маршрутов, а не перебором фильтров
+router = Router()
+router.setup(dp)
 
 # Инициализация базы данных
 init_db()
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
 
-def is_authorized_user(user_id):
-    """Проверка авторизации пользователя"""
-    return user_id in [MY_USER_ID, GIRLFRIEND_USER_ID]
-
-def format_transaction(trans, include_id=False):
-    """Форматирование транзакции для отображения"""
-    if len(trans) == 6:  # Сегодняшние транзакции
-        trans_id, trans_type, amount, category, description, time = trans
-        date_str = "сегодня"
-    else:  # Транзакции за период
-        trans_id, trans_type, amount, category, description, date_str, time = trans[:7]
-    
-    emoji = "💵" if trans_type == 'income' else "💸"
-    type_text = "Доход" if trans_type == 'income' else "Расход"
-    time_str = f" ({time})" if time else ""
-    
-    result = f"{emoji} *{type_text}:* {amount:.2f} руб.\n"
-    result += f"   📂 Категория: {category}\n"
+# Домохозяйства пользователей: членство меняется только через /start и /join,
+# поэтому найденное значение можно держать в памяти
+_household_ids = {}
+
+async def get_household_id(user_id):
+    """Домохозяйство пользователя (None - пользователь не допущен к боту)"""
+    household_id = _household_ids.get(user_id)
+    if household_id is None:
+        household_id = await db.get_household_id(user_id)
+        if household_id is not None:
+            _household_ids[user_id] = household_id
+    return household_id
+
+async def is_authorized_user(user_id):
+    """Проверка авторизации: пользователь состоит в домохозяйстве"""
+    return await get_household_id(user_id) is not None
+
+def is_admin(user_id):
+    """Проверка прав администратора"""
+    return user_id == ADMIN_USER_ID
+
+def format_transaction(trans, include_id=False, today=None):
+    """Форматирование транзакции для отображения; today - сегодняшняя дата пользователя (ISO)"""
+    date_str = "сегодня" if trans.date == today else trans.date
+    
+    emoji = "💵" if trans.type == 'income' else "💸"
+    type_text = "Доход" if trans.type == 'income' else "Расход"
+    time_str = f" ({trans.time})" if trans.time else ""
+    
+    result = f"{emoji} *{type_text}:* {trans.amount:.2f} руб.\n"
+    result += f"   📂 Категория: {trans.category}\n"
     result += f"   📅 Дата: {date_str}{time_str}\n"
     
-    if description:
-        result += f"   📝 Описание: {description}\n"
+    if trans.description:
+        result += f"   📝 Описание: {trans.description}\n"
     
     if include_id:
-        result += f"   🆔 ID: {trans_id}\n"
+        result += f"   🆔 ID: {trans.id}\n"
     
     return result
 
 def format_plan(plan, include_id=False):
     """Форматирование плана для отображения"""
-    plan_id, title, description, plan_date, time, category, is_shared = plan[:7]
+    shared_icon = " 👥" if plan.is_shared else ""
+    time_str = f" в {plan.time}" if plan.time else ""
     
-    shared_icon = " 👥" if is_shared else ""
-    time_str = f" в {time}" if time else ""
+    result = f"📅 *{plan.title}*{shared_icon}\n"
+    result += f"   📅 Дата: {plan.date}{time_str}\n"
+    if plan.recurrence:
+        result += f"   🔁 Повтор: {recurrence.describe(plan.recurrence)}\n"
+    result += f"   🏷️ Категория: {plan.category}\n"
     
-    result = f"📅 *{title}*{shared_icon}\n"
-    result += f"   📅 Дата: {plan_date}{time_str}\n"
-    result += f"   🏷️ Категория: {category}\n"
-    
-    if description:
-        result += f"   📋 Описание: {description}\n"
+    if plan.description:
+        result += f"   📋 Описание: {plan.description}\n"
     
     if include_id:
-        result += f"   🆔 ID: {plan_id}\n"
+        result += f"   🆔 ID: {plan.id}\n"
     
     return result
 
 def format_purchase(purchase, include_id=False):
     """Форматирование покупки для отображения"""
-    purchase_id, item_name, cost, priority, target_date, notes, status = purchase[:7]
-    
-    emoji = {'high': '🔴', 'medium': '🟡', 'low': '🟢'}[priority]
-    date_str = f"до {target_date}" if target_date else ""
-    status_emoji = "✅" if status == 'bought' else "📋"
+    emoji = {'high': '🔴', 'medium': '🟡', 'low': '🟢'}[purchase.priority]
+    date_str = f"до {purchase.target_date}" if purchase.target_date else ""
+    status_emoji = "✅" if purchase.status == 'bought' else "📋"
     
-    result = f"{emoji} *{item_name}* {status_emoji}\n"
-    result += f"   💰 Стоимость: {cost:.2f} руб.\n"
+    result = f"{emoji} *{purchase.item_name}* {status_emoji}\n"
+    result += f"   💰 Стоимость: {purchase.estimated_cost:.2f} руб.\n"
     
     if date_str:
         result += f"   📅 {date_str}\n"
     
-    if notes:
-        result += f"   📝 Заметки: {notes}\n"
+    if purchase.notes:
+        result += f"   📝 Заметки: {purchase.notes}\n"
     
     if include_id:
-        result += f"   🆔 ID: {purchase_id}\n"
+        result += f"   🆔 ID: {purchase.id}\n"
     
     return result
 
@@ -104,11 +141,20 @@ def format_purchase(purchase, include_id=False):
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
-    if not is_authorized_user(message.from_user.id):
-        await message.answer("❌ Доступ запрещен. Этот бот предназначен только для определенных пользователей.")
+    user_id = message.from_user.id
+    authorized = await is_authorized_user(user_id)
+    if not authorized and not ALLOW_REGISTRATION:
+        await message.answer("❌ Доступ запрещен. Попросите партнера прислать код приглашения "
+                             "и отправьте /join <код>")
         return
     
-    add_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
+    await db.add_user(user_id, message.from_user.username, message.from_user.full_name)
+    
+    if not authorized:
+        household_id, invite_code = await db.create_household(user_id, f"Бюджет {message.from_user.full_name}")
+        _household_ids[user_id] = household_id
+        await message.answer(f"🏠 Создан ваш общий бюджет.\n"
+                             f"Чтобы пригласить партнера, перешлите ему команду:\n/join {invite_code}")
     
     welcome_text = f"""
 👋 Привет, {message.from_user.first_name}!
@@ -133,6 +179,7 @@ async def cmd_start(message: types.Message):
 /search - поиск записей
 /shared - общие расходы сегодня
 /last - последние транзакции
+/household - общий бюджет и приглашение партнера
 /help - справка по командам
 """
     
@@ -152,6 +199,10 @@ async def cmd_help(message: types.Message):
 /shared - общие расходы сегодня
 /last - последние 10 транзакций
 /weekly - недельная сводка
+/timezone - часовой пояс (для "сегодня" и напоминаний)
+/recurring - повторяющиеся расходы и доходы
+/household - участники и код приглашения
+/join <код> - присоединиться к бюджету партнера
 
 **Управление записями:**
 ✏️ Редактировать - изменить запись
@@ -166,13 +217,50 @@ async def cmd_help(message: types.Message):
     
     await message.answer(help_text, parse_mode='Markdown')
 
+@dp.message_handler(commands=['join'])
+async def cmd_join(message: types.Message):
+    """Присоединиться к домохозяйству партнера по коду приглашения"""
+    invite_code = message.get_args().strip()
+    if not invite_code:
+        await message.answer("Использование: /join <код приглашения>")
+        return
+    
+    user_id = message.from_user.id
+    await db.add_user(user_id, message.from_user.username, message.from_user.full_name)
+    household_id = await db.join_household(user_id, invite_code)
+    
+    if household_id is None:
+        await message.answer("❌ Код приглашения недействителен или в бюджете уже нет свободных мест")
+        return
+    
+    _household_ids[user_id] = household_id
+    await message.answer("✅ Вы присоединились к общему бюджету!", reply_markup=get_main_keyboard())
+
+@dp.message_handler(commands=['household'])
+async def cmd_household(message: types.Message):
+    """Участники домохозяйства и код приглашения"""
+    household_id = await get_household_id(message.from_user.id)
+    if household_id is None:
+        return
+    
+    _, name, invite_code = await db.get_household(household_id)
+    members = await db.get_household_members(household_id)
+    
+    response = f"🏠 *{name}*\n\n👥 *Участники:*\n"
+    for _, full_name, role in members:
+        owner = " (создатель)" if role == 'owner' else ""
+        response += f"  • {full_name or 'без имени'}{owner}\n"
+    response += f"\n🔑 Пригласить партнера: `/join {invite_code}`"
+    
+    await message.answer(response, parse_mode='Markdown')
+
 @dp.message_handler(commands=['last'])
 async def cmd_last(message: types.Message):
     """Последние транзакции"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
-    transactions = get_recent_transactions(message.from_user.id, 10)
+    transactions = await db.get_recent_transactions(message.from_user.id, 10)
     
     if not transactions:
         await message.answer("📭 У вас еще нет транзакций")
@@ -181,16 +269,14 @@ async def cmd_last(message: types.Message):
     response = "📊 *Последние 10 транзакций:*\n\n"
     
     for trans in transactions:
-        trans_type, amount, category, description, datetime_str = trans
+        emoji = "💵" if trans.type == 'income' else "💸"
+        type_text = "Доход" if trans.type == 'income' else "Расход"
         
-        emoji = "💵" if trans_type == 'income' else "💸"
-        type_text = "Доход" if trans_type == 'income' else "Расход"
-        
-        response += f"{emoji} *{type_text}: {amount:.2f} руб.*\n"
-        response += f"   📂 Категория: {category}\n"
-        response += f"   📅 Дата: {datetime_str}\n"
-        if description:
-            response += f"   📝 Описание: {description}\n"
+        response += f"{emoji} *{type_text}: {trans.amount:.2f} руб.*\n"
+        response += f"   📂 Категория: {trans.category}\n"
+        response += f"   📅 Дата: {trans.date} {trans.time}\n"
+        if trans.description:
+            response += f"   📝 Описание: {trans.description}\n"
         response += "\n"
     
     await message.answer(response, parse_mode='Markdown')
@@ -198,10 +284,11 @@ async def cmd_last(message: types.Message):
 @dp.message_handler(commands=['weekly'])
 async def cmd_weekly(message: types.Message):
     """Недельная сводка"""
-    if not is_authorized_user(message.from_user.id):
+    household_id = await get_household_id(message.from_user.id)
+    if household_id is None:
         return
     
-    weekly_data = get_weekly_summary()
+    weekly_data = await db.get_weekly_summary(household_id)
     
     if not weekly_data:
         await message.answer("📊 Нет данных за последние 4 недели")
@@ -225,13 +312,101 @@ async def cmd_weekly(message: types.Message):
     
     await message.answer(response, parse_mode='Markdown')
 
+@dp.message_handler(commands=['timezone'])
+async def cmd_timezone(message: types.Message):
+    """Показать или сменить часовой пояс: /timezone Europe/Moscow, /timezone +3"""
+    user_id = message.from_user.id
+    if not await is_authorized_user(user_id):
+        return
+    
+    argument = message.get_args().strip()
+    if not argument:
+        zone_name = get_zone(await db.get_user_timezone(user_id)).key
+        today = await db.get_user_today(user_id)
+        await message.answer(f"🕒 Ваш часовой пояс: {zone_name} (сегодня {today.isoformat()})\n\n"
+                             f"Сменить: /timezone Europe/Moscow или /timezone +3")
+        return
+    
+    zone_name = parse_zone(argument)
+    if zone_name is None:
+        await message.answer("❌ Неизвестный часовой пояс. Примеры: Europe/Moscow, Asia/Yekaterinburg, +3, UTC")
+        return
+    
+    moved = await db.set_user_timezone(user_id, zone_name)
+    today = await db.get_user_today(user_id)
+    response = f"✅ Часовой пояс: {zone_name} (сегодня {today.isoformat()})"
+    if moved:
+        response += f"\n🔔 Напоминаний пересчитано: {len(moved)}"
+    await message.answer(response)
+
+def format_recurring(rule):
+    """Строка повторяющейся транзакции для /recurring"""
+    emoji = "💵" if rule.type == 'income' else "💸"
+    result = f"{emoji} *{rule.amount:.2f} руб.* - {rule.category}"
+    if rule.description:
+        result += f" ({rule.description})"
+    result += f"\n   🔁 {recurrence.describe(rule.recurrence)}, с {rule.start_date}"
+    if rule.end_date:
+        result += f" по {rule.end_date}"
+    return result + f"\n   🆔 ID: {rule.id}\n"
+
+@dp.message_handler(commands=['recurring'])
+async def cmd_recurring(message: types.Message):
+    """Повторяющиеся транзакции: список, '/recurring 45000 аренда, каждое 5 число',
+    '/recurring stop <id>', '/recurring delete <id>'"""
+    user_id = message.from_user.id
+    if not await is_authorized_user(user_id):
+        return
+    
+    argument = message.get_args().strip()
+    if not argument:
+        rules = await db.get_recurring_transactions(user_id)
+        if not rules:
+            await message.answer("📭 Повторяющихся транзакций нет\n\n"
+                                 "Добавить: `/recurring 45000 аренда, каждое 5 число`", parse_mode='Markdown')
+            return
+        response = "🔁 *Повторяющиеся транзакции:*\n\n" + "\n".join(format_recurring(rule) for rule in rules)
+        response += "\nОстановить: /recurring stop <id>, удалить вместе с прошлыми: /recurring delete <id>"
+        await message.answer(response, parse_mode='Markdown')
+        return
+    
+    command, _, rule_id = argument.partition(' ')
+    if command.lower() in ('stop', 'delete'):
+        rule = await db.get_recurring_transaction(int(rule_id)) if rule_id.strip().isdigit() else None
+        if rule is None or rule.user_id != user_id:
+            await message.answer("❌ Повторяющаяся транзакция не найдена")
+            return
+        if command.lower() == 'stop':
+            await db.stop_recurring_transaction(rule.id)
+            await message.answer("⏹️ Повторы остановлены, прошедшие остались в статистике")
+        else:
+            await db.soft_delete_recurring_transaction(rule.id)
+            await message.answer("🗑️ Повторяющаяся транзакция удалена")
+        return
+    
+    # Сумма и категория - как в быстром вводе, правило повтора - после запятой
+    text, _, phrase = argument.partition(',')
+    entry = quick_entry.parse(text)
+    rule = recurrence.parse_phrase(phrase, await db.get_user_today(user_id)) if phrase.strip() else None
+    if entry is None or entry.category is None or rule is None:
+        await message.answer("❌ Пример: `/recurring 45000 аренда, каждое 5 число` или "
+                             "`/recurring +80000 зарплата, в последний день месяца`", parse_mode='Markdown')
+        return
+    
+    rule_id = await db.add_recurring_transaction(user_id, entry.type, entry.amount, entry.category,
+                                                 entry.description, rule)
+    title = "✅ *Повторяющийся доход добавлен!*" if entry.type == 'income' else "✅ *Повторяющийся расход добавлен!*"
+    await message.answer(f"{title}\n\n{format_recurring(await db.get_recurring_transaction(rule_id))}",
+                         parse_mode='Markdown')
+
 @dp.message_handler(commands=['shared'])
 async def cmd_shared(message: types.Message):
     """Общие расходы сегодня"""
-    if not is_authorized_user(message.from_user.id):
+    household_id = await get_household_id(message.from_user.id)
+    if household_id is None:
         return
     
-    today_expenses = get_daily_combined_expenses()
+    today_expenses = await db.get_daily_combined_expenses(household_id)
     
     if not today_expenses:
         await message.answer("💸 *Сегодня еще не было общих расходов*", parse_mode='Markdown')
@@ -257,12 +432,268 @@ async def cmd_shared(message: types.Message):
     
     await message.answer(response, parse_mode='Markdown')
 
+@dp.message_handler(commands=['dbstats'])
+async def cmd_dbstats(message: types.Message):
+    """Счетчики запросов к базе данных (только для администратора)
+
+    /dbstats - сводка по функциям, /dbstats reset - обнулить счетчики.
+    """
+    if not is_admin(message.from_user.id):
+        return
+    
+    if message.get_args().strip() == 'reset':
+        query_stats.reset()
+        await message.answer("🔄 Счетчики запросов обнулены")
+        return
+    
+    stats = query_stats.snapshot()
+    if not stats:
+        await message.answer("📭 Запросов к базе еще не было")
+        return
+    
+    lines = [f"{'функция':<28} {'выз':>6} {'ср,мс':>7} {'макс':>7} {'строк':>7}"]
+    for item in stats[:25]:
+        errors = f" ❗{item['errors']}" if item['errors'] else ""
+        lines.append(f"{item['name'][:28]:<28} {item['calls']:>6} {item['avg_ms']:>7.1f} "
+                     f"{item['max_ms']:>7.1f} {item['rows']:>7}{errors}")
+    
+    response = "🗄️ *Запросы к БД* (по суммарному времени):\n```\n" + "\n".join(lines) + "\n```"
+    
+    slow = list(query_stats.recent_slow)[-5:]
+    if slow:
+        response += f"\n🐢 *Медленные* (порог {query_stats.slow_threshold * 1000:.0f} мс):\n"
+        for entry in reversed(slow):
+            response += f"• `{entry['name']}` {entry['ms']:.0f} мс, {entry['at']}\n"
+    
+    await message.answer(response, parse_mode='Markdown')
+
+@dp.message_handler(commands=['shards'])
+async def cmd_shards(message: types.Message):
+    """Сводка по шардам базы данных (только для администратора)"""
+    if not is_admin(message.from_user.id):
+        return
+
+    report = await db.get_shard_report()
+
+    lines = [f"{'#':>2} {'файл':<22} {'домох':>6} {'польз':>6} {'транз':>9} {'МБ':>7}"]
+    for shard, path, households, users, transactions, megabytes in report:
+        lines.append(f"{shard:>2} {path[:22]:<22} {households:>6} {users:>6} {transactions:>9} {megabytes:>7.1f}")
+    lines.append(f"{'':>2} {'всего':<22} {sum(row[2] for row in report):>6} {sum(row[3] for row in report):>6} "
+                 f"{sum(row[4] for row in report):>9} {sum(row[5] for row in report):>7.1f}")
+
+    await message.answer("🗂️ *Шарды базы данных:*\n```\n" + "\n".join(lines) + "\n```", parse_mode='Markdown')
+
+@dp.message_handler(commands=['outbox'])
+async def cmd_outbox(message: types.Message):
+    """Очередь исходящих сообщений: отправлено, повторы после 429, задержка в очереди (только для администратора)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    lines = [f"{'приоритет':<12} {'отпр':>6} {'429':>4} {'ошиб':>4} {'p50,мс':>7} {'p99,мс':>7} {'макс':>7}"]
+    for item in bot.outbox.snapshot():
+        lines.append(f"{item['priority']:<12} {item['sent']:>6} {item['retried']:>4} {item['failed']:>4} "
+                     f"{item['p50_ms']:>7.0f} {item['p99_ms']:>7.0f} {item['max_ms']:>7.0f}")
+    
+    await message.answer(f"📤 *Исходящие сообщения* (в очереди: {bot.outbox.pending()}):\n```\n"
+                         + "\n".join(lines) + "\n```", parse_mode='Markdown')
+
+@dp.message_handler(commands=['delivery'])
+async def cmd_delivery(message: types.Message):
+    """Последние рассылки: скорость, задержка доставки и недоставленные сообщения (только для администратора)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    lines = [f"{'время':<8} {'рассылка':<12} {'отпр':>5} {'ошиб':>4} {'повт':>4} {'в сек':>6} {'p50,мс':>7} {'p99,мс':>7}"]
+    for report in reversed(delivery.recent_reports):
+        lines.append(f"{report.at[11:]:<8} {report.name[:12]:<12} {report.sent:>5} {report.failed:>4} "
+                     f"{report.retried:>4} {report.rate:>6.0f} {report.p50_ms:>7.0f} {report.p99_ms:>7.0f}")
+    
+    response = "📬 *Рассылки:*\n```\n" + "\n".join(lines) + "\n```"
+    dead_letters = await db.get_dead_letters(5)
+    if dead_letters:
+        response += "\n📭 *Не доставлено:*\n```\n"
+        response += "\n".join(f"{created_at} {user_id} {kind} ({attempts}): {error[:60]}"
+                               for user_id, kind, error, attempts, created_at in dead_letters)
+        response += "\n```"
+    await message.answer(response, parse_mode='Markdown')
+
+# ========== ИМПОРТ ВЫПИСОК ==========
+
+# Больше Bot API не отдает боту на скачивание
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+# Как часто обновлять сообщение с прогрессом, секунд
+IMPORT_PROGRESS_INTERVAL = 3
+
+@dp.message_handler(commands=['import'], commands_ignore_caption=False,
+                    content_types=[types.ContentType.TEXT, types.ContentType.DOCUMENT])
+async def cmd_import(message: types.Message):
+    """Импорт банковской выписки: файл с подписью /import [профиль]"""
+    if not await is_authorized_user(message.from_user.id):
+        return
+    
+    profiles = importer.load_profiles()
+    args = (message.caption or message.text or '').split()[1:]
+    profile_name = args[0] if args else 'generic'
+    if message.document is None or profile_name not in profiles:
+        await message.answer(
+            "📥 *Импорт выписки*\n\n"
+            "Отправьте CSV или JSONL файл с подписью `/import профиль`.\n"
+            f"Профили: {', '.join(f'`{name}`' for name in sorted(profiles))}\n\n"
+            "Уже загруженные строки при повторном импорте пропускаются.",
+            parse_mode='Markdown'
+        )
+        return
+    if message.document.file_size and message.document.file_size > IMPORT_MAX_FILE_SIZE:
+        await message.answer(f"❌ Telegram не отдает боту файлы больше {IMPORT_MAX_FILE_SIZE // 1024 // 1024} МБ, "
+                             "импортируйте такой файл через `python importer.py`", parse_mode='Markdown')
+        return
+    
+    status = await message.answer("⏳ Загружаю файл...")
+    loop = asyncio.get_running_loop()
+    last_update = time.monotonic()
+    
+    async def show_progress(text):
+        try:
+            await status.edit_text(text)
+        except MessageNotModified:
+            pass
+    
+    def progress(stats):
+        # Вызывается в потоке импорта после каждой пачки
+        nonlocal last_update
+        if time.monotonic() - last_update >= IMPORT_PROGRESS_INTERVAL:
+            last_update = time.monotonic()
+            text = (f"⏳ {stats.percent():.0f}%: прочитано {stats.read}, добавлено {stats.inserted}, "
+                    f"дублей {stats.duplicates}")
+            asyncio.run_coroutine_threadsafe(show_progress(text), loop)
+    
+    # Пачки пишутся по мере чтения: при ошибке в базе остаются уже записанные
+    stats = importer.ImportStats()
+    with tempfile.TemporaryFile() as stream:
+        await message.document.download(destination_file=stream)
+        stream.seek(0)
+        try:
+            await loop.run_in_executor(
+                None, importer.import_file, stream, message.from_user.id, profiles[profile_name],
+                importer.IMPORT_CHUNK_SIZE, progress, False, stats
+            )
+        except (UnicodeDecodeError, ValueError, csv.Error) as e:
+            logger.warning(f"Импорт выписки не удался: {e}")
+            await show_progress(f"❌ Не удалось прочитать файл профилем {profile_name}: {e}\n"
+                                f"До ошибки добавлено {stats.inserted}, дублей {stats.duplicates}")
+            return
+        except Exception:
+            # Ошибка записи пачки (sqlite3.Error, таймаут) - сообщение не должно остаться на "⏳"
+            logger.exception("Импорт выписки прерван")
+            await show_progress(f"❌ Импорт прерван ошибкой\n"
+                                f"До ошибки добавлено {stats.inserted}, дублей {stats.duplicates}")
+            return
+    
+    report = [f"✅ Импорт завершен: {importer.summary(stats)}"]
+    report += [f"❌ строка {line}: {error}" for line, error in stats.error_samples]
+    await show_progress("\n".join(report))
+
+# ========== БЫСТРЫЙ ВВОД ==========
+
+# Сколько строк пакета перечислять в ответе
+BULK_REPORT_LINES = 40
+
+async def add_bulk(message: types.Message, lines):
+    """Добавить транзакции из строк пакета одной записью в БД и ответить сводкой по строкам"""
+    results = quick_entry.parse_lines(lines)
+    entries = [entry for _, entry, _ in results if entry is not None]
+    if not results:
+        await message.answer("📭 В сообщении нет строк с транзакциями")
+        return
+    
+    ids = iter(await db.add_transactions(
+        message.from_user.id,
+        [(entry.type, entry.amount, entry.category, entry.description) for entry in entries]
+    ))
+    
+    expenses = sum(entry.amount for entry in entries if entry.type == 'expense')
+    incomes = sum(entry.amount for entry in entries if entry.type == 'income')
+    report = [f"📥 Добавлено {len(entries)} из {len(results)} строк",
+              f"💸 Расходы: {expenses:.2f} руб.  💵 Доходы: {incomes:.2f} руб.", ""]
+    for number, entry, error in results:
+        if entry is not None:
+            sign = '+' if entry.type == 'income' else ''
+            description = f" - {entry.description}" if entry.description else ""
+            line = f"{number:>3} ✅ {sign}{entry.amount:.2f} {entry.category}{description} (ID {next(ids)})"
+        else:
+            line = f"{number:>3} ❌ {error}"
+        if len(report) < BULK_REPORT_LINES + 3:
+            report.append(line)
+    if len(results) > BULK_REPORT_LINES:
+        report.append(f"... и еще {len(results) - BULK_REPORT_LINES} строк")
+    
+    # Без разметки: описания из строк пользователя могут содержать * и _
+    await message.answer("\n".join(report))
+
+@dp.message_handler(regexp=quick_entry.BULK_TRIGGER, state=None)
+async def bulk_add_transactions(message: types.Message):
+    """Несколько транзакций одним сообщением, по одной на строку"""
+    if not await is_authorized_user(message.from_user.id):
+        return
+    
+    await add_bulk(message, message.text.splitlines())
+
+@dp.message_handler(content_types=types.ContentType.DOCUMENT)
+async def bulk_add_from_document(message: types.Message):
+    """Транзакции из .txt или .csv файла, по одной на строку"""
+    if not await is_authorized_user(message.from_user.id):
+        return
+    
+    document = message.document
+    filename = document.file_name or ''
+    if not filename.lower().endswith(quick_entry.BULK_EXTENSIONS):
+        return
+    if document.file_size and document.file_size > quick_entry.BULK_MAX_FILE_SIZE:
+        await message.answer(f"❌ Файл больше {quick_entry.BULK_MAX_FILE_SIZE // 1024} КБ")
+        return
+    
+    buffer = await document.download(destination_file=io.BytesIO())
+    await add_bulk(message, quick_entry.document_lines(buffer.getvalue(), filename))
+
+@dp.message_handler(regexp=quick_entry.TRIGGER, state=None)
+async def quick_add_transaction(message: types.Message):
+    """Расход или доход одним сообщением: '450 еда обед', '+50000 зарплата'
+
+    Только вне диалогов: числа, введенные в ответ на вопрос бота, разбирает
+    обработчик этого диалога.
+    """
+    if not await is_authorized_user(message.from_user.id):
+        return
+    
+    # Без категории в тексте ("12.05 встреча") сообщение - не транзакция
+    entry = quick_entry.parse(message.text, fallback=False)
+    if entry is None:
+        return
+    
+    transaction_id = await db.add_transaction(
+        user_id=message.from_user.id,
+        trans_type=entry.type,
+        amount=entry.amount,
+        category=entry.category,
+        description=entry.description
+    )
+    
+    title = "✅ *Доход добавлен!*" if entry.type == 'income' else "✅ *Расход добавлен!*"
+    response = f"{title}\n\n💰 Сумма: {entry.amount:.2f} руб.\n📂 Категория: {entry.category}\n"
+    if entry.description:
+        response += f"📝 Описание: {entry.description}\n"
+    response += f"🆔 ID: {transaction_id}"
+    
+    # Для расхода - кнопки исправления, если категория угадана неверно
+    keyboard = get_edit_transaction_keyboard(transaction_id, 'expense') if entry.type == 'expense' else None
+    await message.answer(response, parse_mode='Markdown', reply_markup=keyboard)
+
 # ========== ОБРАБОТЧИКИ ДОБАВЛЕНИЯ РАСХОДОВ ==========
 
-@dp.message_handler(lambda message: message.text == '💰 Добавить расход')
+@router.text('💰 Добавить расход')
 async def add_expense_start(message: types.Message):
     """Начало добавления расхода"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await AddExpense.waiting_for_amount.set()
@@ -284,10 +715,10 @@ async def process_expense_amount(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("❌ Пожалуйста, введите корректную сумму (например: 1500.50)")
 
-@dp.callback_query_handler(lambda c: c.data.startswith('expense_cat_'), state=AddExpense.waiting_for_category)
-async def process_expense_category(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('expense_cat_', state=AddExpense.waiting_for_category)
+async def process_expense_category(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Обработка категории расхода"""
-    category = callback_query.data[11:]  # Убираем 'expense_cat_'
+    category = payload
     await state.update_data(category=category)
     await AddExpense.next()
     await bot.send_message(callback_query.from_user.id, 
@@ -300,7 +731,7 @@ async def process_expense_description(message: types.Message, state: FSMContext)
     data = await state.get_data()
     description = message.text if message.text != '-' else None
     
-    transaction_id = add_transaction(
+    transaction_id = await db.add_transaction(
         user_id=message.from_user.id,
         trans_type='expense',
         amount=data['amount'],
@@ -325,10 +756,10 @@ async def process_expense_description(message: types.Message, state: FSMContext)
 
 # ========== ОБРАБОТЧИКИ ДОБАВЛЕНИЯ ДОХОДОВ ==========
 
-@dp.message_handler(lambda message: message.text == '💵 Добавить доход')
+@router.text('💵 Добавить доход')
 async def add_income_start(message: types.Message):
     """Начало добавления дохода"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await AddIncome.waiting_for_amount.set()
@@ -350,10 +781,10 @@ async def process_income_amount(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("❌ Пожалуйста, введите корректную сумму (например: 1500.50)")
 
-@dp.callback_query_handler(lambda c: c.data.startswith('income_cat_'), state=AddIncome.waiting_for_category)
-async def process_income_category(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('income_cat_', state=AddIncome.waiting_for_category)
+async def process_income_category(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Обработка категории дохода"""
-    category = callback_query.data[10:]  # Убираем 'income_cat_'
+    category = payload
     await state.update_data(category=category)
     await AddIncome.next()
     await bot.send_message(callback_query.from_user.id,
@@ -366,7 +797,7 @@ async def process_income_description(message: types.Message, state: FSMContext):
     data = await state.get_data()
     description = message.text if message.text != '-' else None
     
-    transaction_id = add_transaction(
+    transaction_id = await db.add_transaction(
         user_id=message.from_user.id,
         trans_type='income',
         amount=data['amount'],
@@ -391,10 +822,10 @@ async def process_income_description(message: types.Message, state: FSMContext):
 
 # ========== ОБРАБОТЧИКИ ДОБАВЛЕНИЯ ПЛАНОВ ==========
 
-@dp.message_handler(lambda message: message.text == '📅 Добавить план')
+@router.text('📅 Добавить план')
 async def add_plan_start(message: types.Message):
     """Начало добавления плана"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await AddPlan.waiting_for_title.set()
@@ -413,26 +844,33 @@ async def process_plan_description(message: types.Message, state: FSMContext):
     description = message.text if message.text != '-' else None
     await state.update_data(description=description)
     await AddPlan.next()
-    await message.answer("📅 Введите дату (в формате ГГГГ-ММ-ДД, или 'сегодня', 'завтра'):")
+    await message.answer("📅 Введите дату (в формате ГГГГ-ММ-ДД, или 'сегодня', 'завтра')\n"
+                         "или повтор: 'каждый день', 'по понедельникам', 'каждое 5 число', "
+                         "'в последнюю пятницу месяца':")
 
 @dp.message_handler(state=AddPlan.waiting_for_date)
 async def process_plan_date(message: types.Message, state: FSMContext):
-    """Обработка даты плана"""
+    """Обработка даты плана (или правила повтора - тогда план начинается сегодня)"""
     date_str = message.text.lower()
+    rule = None
     
-    if date_str == 'сегодня':
-        plan_date = date.today().isoformat()
-    elif date_str == 'завтра':
-        plan_date = (date.today() + timedelta(days=1)).isoformat()
+    if date_str in ('сегодня', 'завтра'):
+        today = await db.get_user_today(message.from_user.id)
+        plan_date = (today + timedelta(days=1 if date_str == 'завтра' else 0)).isoformat()
     else:
         try:
             datetime.strptime(date_str, '%Y-%m-%d')
             plan_date = date_str
         except ValueError:
-            await message.answer("❌ Неверный формат даты. Используйте ГГГГ-ММ-ДД")
-            return
-    
-    await state.update_data(date=plan_date)
+            today = await db.get_user_today(message.from_user.id)
+            rule = recurrence.parse_phrase(message.text, today)
+            if rule is None:
+                await message.answer("❌ Неверный формат даты. Используйте ГГГГ-ММ-ДД "
+                                     "или повтор, например 'каждый вторник'")
+                return
+            plan_date = today.isoformat()
+    
+    await state.update_data(date=plan_date, recurrence=rule)
     await AddPlan.next()
     await message.answer("⏰ Введите время (в формате ЧЧ:ММ, или '-' если не нужно):")
 
@@ -452,10 +890,10 @@ async def process_plan_time(message: types.Message, state: FSMContext):
     await AddPlan.next()
     await message.answer("🏷️ Выберите категорию плана:", reply_markup=get_plan_categories_keyboard())
 
-@dp.callback_query_handler(lambda c: c.data.startswith('plan_cat_'), state=AddPlan.waiting_for_category)
-async def process_plan_category(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('plan_cat_', state=AddPlan.waiting_for_category)
+async def process_plan_category(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Обработка категории плана"""
-    category = callback_query.data[9:]  # Убираем 'plan_cat_'
+    category = payload
     await state.update_data(category=category)
     await AddPlan.next()
     
@@ -471,14 +909,15 @@ async def process_plan_shared(message: types.Message, state: FSMContext):
     
     data = await state.get_data()
     
-    plan_id = add_plan(
+    plan_id = await db.add_plan(
         user_id=message.from_user.id,
         title=data['title'],
         description=data['description'],
         plan_date=data['date'],
         time=data['time'],
         category=data['category'],
-        is_shared=is_shared
+        is_shared=is_shared,
+        recurrence=data.get('recurrence')
     )
     
     await state.finish()
@@ -494,6 +933,8 @@ async def process_plan_shared(message: types.Message, state: FSMContext):
 🏷️ Категория: {data['category']}
 👥 Статус: {shared_text}
 """
+    if data.get('recurrence'):
+        response += f"🔁 Повтор: {recurrence.describe(data['recurrence'])}\n"
     if data['description']:
         response += f"📋 Описание: {data['description']}\n"
     
@@ -503,10 +944,10 @@ async def process_plan_shared(message: types.Message, state: FSMContext):
 
 # ========== ОБРАБОТЧИКИ ДОБАВЛЕНИЯ ПОКУПОК ==========
 
-@dp.message_handler(lambda message: message.text == '🛒 Добавить покупку')
+@router.text('🛒 Добавить покупку')
 async def add_purchase_start(message: types.Message):
     """Начало добавления покупки"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await AddPurchase.waiting_for_name.set()
@@ -535,10 +976,10 @@ async def process_purchase_cost(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("❌ Пожалуйста, введите корректную сумму")
 
-@dp.callback_query_handler(lambda c: c.data.startswith('priority_'), state=AddPurchase.waiting_for_priority)
-async def process_purchase_priority(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('priority_', state=AddPurchase.waiting_for_priority)
+async def process_purchase_priority(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Обработка приоритета покупки"""
-    priority = callback_query.data[9:]  # Убираем 'priority_'
+    priority = payload
     await state.update_data(priority=priority)
     await AddPurchase.next()
     
@@ -568,7 +1009,7 @@ async def process_purchase_notes(message: types.Message, state: FSMContext):
     data = await state.get_data()
     notes = message.text if message.text != '-' else None
     
-    purchase_id = add_planned_purchase(
+    purchase_id = await db.add_planned_purchase(
         user_id=message.from_user.id,
         item_name=data['name'],
         estimated_cost=data['cost'],
@@ -600,13 +1041,13 @@ async def process_purchase_notes(message: types.Message, state: FSMContext):
 
 # ========== ОБРАБОТЧИКИ ПРОСМОТРА ==========
 
-@dp.message_handler(lambda message: message.text == '📝 Мои планы')
+@router.text('📝 Мои планы')
 async def show_plans(message: types.Message):
     """Показать планы на сегодня"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
-    plans = get_user_plans(message.from_user.id)
+    plans = await db.get_user_plans(message.from_user.id)
     
     if not plans:
         await message.answer("📭 На сегодня планов нет!")
@@ -619,13 +1060,13 @@ async def show_plans(message: types.Message):
     
     await message.answer(response, parse_mode='Markdown')
 
-@dp.message_handler(lambda message: message.text == '📋 Мои покупки')
+@router.text('📋 Мои покупки')
 async def show_purchases(message: types.Message):
     """Показать планируемые покупки"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
-    purchases = get_user_purchases(message.from_user.id)
+    purchases = await db.get_user_purchases(message.from_user.id)
     
     if not purchases:
         await message.answer("🛍️ Список планируемых покупок пуст!")
@@ -636,7 +1077,7 @@ async def show_purchases(message: types.Message):
     
     for purchase in purchases:
         response += format_purchase(purchase, include_id=True) + "\n"
-        total += purchase[2]  # estimated_cost
+        total += purchase.estimated_cost
     
     response += f"\n💰 *Общая сумма: {total:.2f} руб.*"
     
@@ -644,39 +1085,44 @@ async def show_purchases(message: types.Message):
 
 # ========== ОБРАБОТЧИКИ СТАТИСТИКИ ==========
 
-@dp.message_handler(lambda message: message.text == '📊 Статистика')
+@router.text('📊 Статистика')
 async def show_statistics_menu(message: types.Message):
     """Показать меню статистики"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await message.answer("📊 Выберите тип статистики:", reply_markup=get_statistics_menu_keyboard())
 
-@dp.callback_query_handler(lambda c: c.data.startswith('stats_'))
-async def process_stats_menu(callback_query: types.CallbackQuery):
+@router.callback('stats_')
+async def process_stats_menu(callback_query: types.CallbackQuery, payload: str):
     """Обработка меню статистики"""
-    action = callback_query.data[6:]
+    action = payload
     user_id = callback_query.from_user.id
+    household_id = await get_household_id(user_id)
+    if household_id is None:
+        await callback_query.answer()
+        return
     
+    # Подменю и отчеты открываются в том же сообщении, из отчета можно вернуться назад
     if action == 'my':
-        await bot.send_message(user_id, 
-                              "📊 Выберите период для статистики:", 
+        await navigation.show(callback_query,
+                              "📊 Выберите период для статистики:",
                               reply_markup=get_period_selection_keyboard())
     
     elif action == 'partner':
-        await bot.send_message(user_id, 
-                              "👤 *Данные партнера:*", 
-                              parse_mode='Markdown', 
+        await navigation.show(callback_query,
+                              "👤 *Данные партнера:*",
+                              parse_mode='Markdown',
                               reply_markup=get_partner_view_keyboard())
     
     elif action == 'combined':
-        await bot.send_message(user_id, 
-                              "👫 *Общая статистика:*", 
-                              parse_mode='Markdown', 
+        await navigation.show(callback_query,
+                              "👫 *Общая статистика:*",
+                              parse_mode='Markdown',
                               reply_markup=get_combined_stats_keyboard())
     
     elif action == 'comparison':
-        comparison = get_monthly_comparison()
+        comparison = await db.get_monthly_comparison(household_id)
         
         if comparison:
             response = "📊 *Сравнение за месяц:*\n\n"
@@ -706,10 +1152,11 @@ async def process_stats_menu(callback_query: types.CallbackQuery):
         else:
             response = "📊 Данных для сравнения нет"
         
-        await bot.send_message(user_id, response, parse_mode='Markdown')
+        await navigation.show(callback_query, response, parse_mode='Markdown',
+                              reply_markup=get_back_keyboard('back_to_stats'))
     
     elif action == 'categories':
-        categories_stats = get_common_categories_statistics()
+        categories_stats = await db.get_common_categories_statistics(household_id)
         
         if categories_stats:
             response = "📂 *Топ категорий по расходам за месяц:*\n\n"
@@ -725,10 +1172,11 @@ async def process_stats_menu(callback_query: types.CallbackQuery):
         else:
             response = "📊 Данных по категориям нет"
         
-        await bot.send_message(user_id, response, parse_mode='Markdown')
+        await navigation.show(callback_query, response, parse_mode='Markdown',
+                              reply_markup=get_back_keyboard('back_to_stats'))
     
     elif action == 'today':
-        today_expenses = get_daily_combined_expenses()
+        today_expenses = await db.get_daily_combined_expenses(household_id)
         
         if today_expenses:
             response = "📅 *Расходы за сегодня:*\n\n"
@@ -761,16 +1209,17 @@ async def process_stats_menu(callback_query: types.CallbackQuery):
         else:
             response = "💸 *Сегодня еще не было расходов*"
         
-        await bot.send_message(user_id, response, parse_mode='Markdown')
+        await navigation.show(callback_query, response, parse_mode='Markdown',
+                              reply_markup=get_back_keyboard('back_to_stats'))
     
     await callback_query.answer()
 
 # ========== ОБРАБОТЧИКИ ПЕРИОДОВ СТАТИСТИКИ ==========
 
-@dp.callback_query_handler(lambda c: c.data.startswith('period_'))
-async def process_period_statistics(callback_query: types.CallbackQuery):
+@router.callback('period_')
+async def process_period_statistics(callback_query: types.CallbackQuery, payload: str):
     """Обработка статистики по периодам"""
-    action = callback_query.data[7:]  # Убираем 'period_'
+    action = payload
     user_id = callback_query.from_user.id
     
     period_texts = {
@@ -781,7 +1230,7 @@ async def process_period_statistics(callback_query: types.CallbackQuery):
     }
     period_text = period_texts.get(action, action)
     
-    stats = get_period_statistics(user_id, action)
+    stats = await db.get_period_statistics(user_id, action)
     
     if stats and (stats[0] or stats[1]):
         total_income = stats[0] or 0
@@ -798,25 +1247,24 @@ async def process_period_statistics(callback_query: types.CallbackQuery):
 📋 *Количество операций:* {count}
         """
         
-        transactions = get_user_transactions(user_id, action)
+        transactions = await db.get_user_transactions(user_id, action)
+        today = (await db.get_user_today(user_id)).isoformat()
         
         if transactions:
             response += "\n\n📝 *Детали операций:*\n\n"
             
             if action == 'today':
                 for trans in transactions:
-                    response += format_transaction(trans) + "\n"
+                    response += format_transaction(trans, today=today) + "\n"
             
             else:
                 current_date = None
                 for trans in transactions:
-                    trans_date = trans[5] if len(trans) > 5 else "Сегодня"
+                    if trans.date != current_date:
+                        current_date = trans.date
+                        response += f"\n📅 *{trans.date}:*\n"
                     
-                    if trans_date != current_date:
-                        current_date = trans_date
-                        response += f"\n📅 *{trans_date}:*\n"
-                    
-                    response += "  " + format_transaction(trans)
+                    response += "  " + format_transaction(trans, today=today)
     
     else:
         response = f"📊 *Нет данных за {period_text}*"
@@ -826,10 +1274,10 @@ async def process_period_statistics(callback_query: types.CallbackQuery):
 
 # ========== ОБРАБОТЧИКИ УПРАВЛЕНИЯ ЗАПИСЯМИ ==========
 
-@dp.message_handler(lambda message: message.text == '🔧 Управление')
+@router.text('🔧 Управление')
 async def show_management(message: types.Message):
     """Показать меню управления"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await message.answer("🔧 **Управление записями:**\n\n"
@@ -838,12 +1286,12 @@ async def show_management(message: types.Message):
                         reply_markup=get_management_keyboard())
 
 # УПРАВЛЕНИЕ РАСХОДАМИ
-@dp.callback_query_handler(lambda c: c.data == 'manage_expense')
+@router.callback('manage_expense')
 async def manage_expense_start(callback_query: types.CallbackQuery):
     """Начало управления расходами"""
     user_id = callback_query.from_user.id
     
-    expenses = get_user_transactions(user_id, 'month', 'expense')
+    expenses, has_prev, has_next = await db.get_transactions_page(user_id, 'expense', period='month')
     
     if not expenses:
         await bot.send_message(user_id, "📭 У вас нет расходов для редактирования")
@@ -853,38 +1301,84 @@ async def manage_expense_start(callback_query: types.CallbackQuery):
                           "💰 **Ваши расходы за месяц:**\n\n"
                           "Выберите расход для редактирования:",
                           parse_mode='Markdown',
-                          reply_markup=create_transactions_keyboard(expenses, 'expense'))
+                          reply_markup=create_transactions_keyboard(expenses, 'expense', has_prev, has_next))
     
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('select_expense_'))
-async def select_expense_for_edit(callback_query: types.CallbackQuery):
+@router.callback('page_expense_')
+async def page_expenses(callback_query: types.CallbackQuery, payload: str):
+    """Переход по страницам списка расходов"""
+    trans_type = 'expense'
+    direction, cursor_id = payload.split('_')
+    cursor_id = int(cursor_id)
+    
+    if direction == 'next':
+        page = await db.get_transactions_page(callback_query.from_user.id, trans_type,
+                                              period='month', after_id=cursor_id)
+    else:
+        page = await db.get_transactions_page(callback_query.from_user.id, trans_type,
+                                              period='month', before_id=cursor_id)
+    expenses, has_prev, has_next = page
+    
+    if expenses:
+        await callback_query.message.edit_reply_markup(
+            create_transactions_keyboard(expenses, trans_type, has_prev, has_next)
+        )
+    
+    await callback_query.answer()
+
+async def own_transaction(user_id, transaction_id):
+    """Транзакция пользователя или None (чужая, удаленная, несуществующая)
+
+    id приходит из callback_data или из состояния диалога, и их можно
+    подделать, поэтому владелец проверяется перед каждым изменением.
+    Изменять запись нужно по transaction.id: после переноса домохозяйства
+    в другой шард он отличается от прежнего id.
+    """
+    transaction = await db.get_transaction(int(transaction_id))
+    if transaction is None or transaction.user_id != user_id:
+        return None
+    return transaction
+
+async def expense_not_found(callback_query, state=None):
+    """Ответ на действие с чужим или удаленным расходом"""
+    if state is not None:
+        await state.finish()
+    await bot.send_message(callback_query.from_user.id, "❌ Расход не найден")
+    await callback_query.answer()
+
+@router.callback('select_expense_')
+async def select_expense_for_edit(callback_query: types.CallbackQuery, payload: str):
     """Выбор расхода для редактирования"""
-    expense_id = int(callback_query.data[15:])
-    expense = get_transaction(expense_id)
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
     
     if not expense:
-        await bot.send_message(callback_query.from_user.id, "❌ Расход не найден")
-        await callback_query.answer()
+        await expense_not_found(callback_query)
         return
     
-    response = format_transaction((expense_id, *expense[2:7]), include_id=True)
+    today = (await db.get_user_today(callback_query.from_user.id)).isoformat()
+    response = format_transaction(expense, include_id=True, today=today)
     response = "✏️ **Редактирование расхода:**\n\n" + response
     
     await bot.send_message(callback_query.from_user.id,
                           response,
                           parse_mode='Markdown',
-                          reply_markup=get_edit_transaction_keyboard(expense_id, 'expense'))
+                          reply_markup=get_edit_transaction_keyboard(expense.id, 'expense'))
     
     await callback_query.answer()
 
 # РЕДАКТИРОВАНИЕ СУММЫ РАСХОДА
-@dp.callback_query_handler(lambda c: c.data.startswith('edit_amount_expense_'))
-async def edit_expense_amount(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('edit_amount_expense_')
+async def edit_expense_amount(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Редактирование суммы расхода"""
-    expense_id = int(callback_query.data[20:])
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
+    if not expense:
+        await expense_not_found(callback_query)
+        return
     await EditExpense.waiting_for_amount.set()
-    await state.update_data(expense_id=expense_id)
+    await state.update_data(expense_id=expense.id)
     await bot.send_message(callback_query.from_user.id, "💵 Введите новую сумму расхода:")
     await callback_query.answer()
 
@@ -899,8 +1393,13 @@ async def process_edit_expense_amount(message: types.Message, state: FSMContext)
         
         data = await state.get_data()
         expense_id = data['expense_id']
+        expense = await own_transaction(message.from_user.id, expense_id)
+        if not expense:
+            await state.finish()
+            await message.answer("❌ Расход не найден", reply_markup=get_main_keyboard())
+            return
         
-        update_transaction(expense_id, amount=amount)
+        await db.update_transaction(expense.id, amount=amount)
         
         await state.finish()
         await message.answer(f"✅ Сумма расхода обновлена: {amount} руб.", 
@@ -910,25 +1409,33 @@ async def process_edit_expense_amount(message: types.Message, state: FSMContext)
         await message.answer("❌ Пожалуйста, введите корректную сумму")
 
 # РЕДАКТИРОВАНИЕ КАТЕГОРИИ РАСХОДА
-@dp.callback_query_handler(lambda c: c.data.startswith('edit_category_expense_'))
-async def edit_expense_category(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('edit_category_expense_')
+async def edit_expense_category(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Редактирование категории расхода"""
-    expense_id = int(callback_query.data[23:])
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
+    if not expense:
+        await expense_not_found(callback_query)
+        return
     await EditExpense.waiting_for_category.set()
-    await state.update_data(expense_id=expense_id)
+    await state.update_data(expense_id=expense.id)
     await bot.send_message(callback_query.from_user.id,
                          "📂 Выберите новую категорию:",
                          reply_markup=get_expense_categories_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('expense_cat_'), state=EditExpense.waiting_for_category)
-async def process_edit_expense_category(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('expense_cat_', state=EditExpense.waiting_for_category)
+async def process_edit_expense_category(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Обработка новой категории расхода"""
-    category = callback_query.data[11:]
+    category = payload
     data = await state.get_data()
     expense_id = data['expense_id']
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
+    if not expense:
+        await expense_not_found(callback_query, state)
+        return
     
-    update_transaction(expense_id, category=category)
+    await db.update_transaction(expense.id, category=category)
     
     await state.finish()
     await bot.send_message(callback_query.from_user.id,
@@ -937,12 +1444,16 @@ async def process_edit_expense_category(callback_query: types.CallbackQuery, sta
     await callback_query.answer()
 
 # РЕДАКТИРОВАНИЕ ОПИСАНИЯ РАСХОДА
-@dp.callback_query_handler(lambda c: c.data.startswith('edit_desc_expense_'))
-async def edit_expense_description(callback_query: types.CallbackQuery, state: FSMContext):
+@router.callback('edit_desc_expense_')
+async def edit_expense_description(callback_query: types.CallbackQuery, state: FSMContext, payload: str):
     """Редактирование описания расхода"""
-    expense_id = int(callback_query.data[20:])
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
+    if not expense:
+        await expense_not_found(callback_query)
+        return
     await EditExpense.waiting_for_description.set()
-    await state.update_data(expense_id=expense_id)
+    await state.update_data(expense_id=expense.id)
     await bot.send_message(callback_query.from_user.id,
                           "📝 Введите новое описание (или '-' чтобы удалить описание):")
     await callback_query.answer()
@@ -953,45 +1464,54 @@ async def process_edit_expense_description(message: types.Message, state: FSMCon
     data = await state.get_data()
     expense_id = data['expense_id']
     description = message.text if message.text != '-' else None
+    expense = await own_transaction(message.from_user.id, expense_id)
+    if not expense:
+        await state.finish()
+        await message.answer("❌ Расход не найден", reply_markup=get_main_keyboard())
+        return
     
-    update_transaction(expense_id, description=description)
+    await db.update_transaction(expense.id, description=description)
     
     await state.finish()
     response = "✅ Описание расхода удалено" if description is None else f"✅ Описание расхода обновлено: {description}"
     await message.answer(response, reply_markup=get_main_keyboard())
 
 # УДАЛЕНИЕ РАСХОДА С ПОДТВЕРЖДЕНИЕМ
-@dp.callback_query_handler(lambda c: c.data.startswith('delete_confirm_expense_'))
-async def confirm_delete_expense(callback_query: types.CallbackQuery):
+@router.callback('delete_confirm_expense_')
+async def confirm_delete_expense(callback_query: types.CallbackQuery, payload: str):
     """Подтверждение удаления расхода"""
-    expense_id = int(callback_query.data[24:])
-    expense = get_transaction(expense_id)
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
     
     if not expense:
-        await bot.send_message(callback_query.from_user.id, "❌ Расход не найден")
-        await callback_query.answer()
+        await expense_not_found(callback_query)
         return
     
-    response = format_transaction((expense_id, *expense[2:7]), include_id=True)
+    today = (await db.get_user_today(callback_query.from_user.id)).isoformat()
+    response = format_transaction(expense, include_id=True, today=today)
     response = "🗑️ **Подтверждение удаления расхода:**\n\n" + response + "\n\n❓ Вы уверены, что хотите удалить этот расход?"
     
     await bot.send_message(callback_query.from_user.id,
                           response,
                           parse_mode='Markdown',
-                          reply_markup=get_delete_confirmation_keyboard('expense', expense_id))
+                          reply_markup=get_delete_confirmation_keyboard('expense', expense.id))
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('delete_expense_yes_'))
-async def delete_expense_yes(callback_query: types.CallbackQuery):
+@router.callback('delete_expense_yes_')
+async def delete_expense_yes(callback_query: types.CallbackQuery, payload: str):
     """Подтверждение удаления расхода"""
-    expense_id = int(callback_query.data[20:])
-    soft_delete_transaction(expense_id)
+    expense_id = int(payload)
+    expense = await own_transaction(callback_query.from_user.id, expense_id)
+    if not expense:
+        await expense_not_found(callback_query)
+        return
+    await db.soft_delete_transaction(expense.id)
     await bot.send_message(callback_query.from_user.id,
                           "✅ Расход успешно удален",
                           reply_markup=get_main_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data.startswith('delete_expense_no_'))
+@router.callback('delete_expense_no_')
 async def delete_expense_no(callback_query: types.CallbackQuery):
     """Отмена удаления расхода"""
     await bot.send_message(callback_query.from_user.id,
@@ -1004,7 +1524,7 @@ async def delete_expense_no(callback_query: types.CallbackQuery):
 
 # ========== ОБРАБОТЧИКИ ОБЩИХ ПЛАНОВ ==========
 
-@dp.callback_query_handler(lambda c: c.data == 'shared_plans')
+@router.callback('shared_plans')
 async def show_shared_plans_menu(callback_query: types.CallbackQuery):
     """Меню общих планов"""
     await bot.send_message(callback_query.from_user.id,
@@ -1013,10 +1533,15 @@ async def show_shared_plans_menu(callback_query: types.CallbackQuery):
                           reply_markup=get_shared_plans_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'show_shared_plans')
+@router.callback('show_shared_plans')
 async def show_shared_plans(callback_query: types.CallbackQuery):
     """Показать общие планы"""
-    shared_plans = get_shared_plans()
+    household_id = await get_household_id(callback_query.from_user.id)
+    if household_id is None:
+        await callback_query.answer()
+        return
+    
+    shared_plans = await db.get_shared_plans(household_id)
     
     if not shared_plans:
         await bot.send_message(callback_query.from_user.id,
@@ -1026,18 +1551,16 @@ async def show_shared_plans(callback_query: types.CallbackQuery):
     response = "👥 **Общие планы:**\n\n"
     
     for plan in shared_plans:
-        plan_id, user_id, title, description, plan_date, time, category, is_shared, *_ = plan[:9]
-        username = plan[12]  # full_name из join
-        time_str = f" в {time}" if time else ""
+        time_str = f" в {plan.time}" if plan.time else ""
         
-        response += f"📅 **{title}** ({username})\n"
-        response += f"   📅 {plan_date}{time_str}\n"
-        response += f"   🏷️ {category}\n"
+        response += f"📅 **{plan.title}** ({plan.author})\n"
+        response += f"   📅 {plan.date}{time_str}\n"
+        response += f"   🏷️ {plan.category}\n"
         
-        if description:
-            response += f"   📋 {description}\n"
+        if plan.description:
+            response += f"   📋 {plan.description}\n"
         
-        response += f"   🆔 ID: {plan_id}\n\n"
+        response += f"   🆔 ID: {plan.id}\n\n"
     
     await bot.send_message(callback_query.from_user.id,
                           response,
@@ -1046,10 +1569,10 @@ async def show_shared_plans(callback_query: types.CallbackQuery):
 
 # ========== ОБРАБОТЧИКИ ПОИСКА ==========
 
-@dp.message_handler(lambda message: message.text == '🔍 Поиск')
+@router.text('🔍 Поиск')
 async def show_search_menu(message: types.Message):
     """Показать меню поиска"""
-    if not is_authorized_user(message.from_user.id):
+    if not await is_authorized_user(message.from_user.id):
         return
     
     await message.answer("🔍 **Поиск записей:**\n\n"
@@ -1057,7 +1580,7 @@ async def show_search_menu(message: types.Message):
                         parse_mode='Markdown',
                         reply_markup=get_search_keyboard())
 
-@dp.callback_query_handler(lambda c: c.data == 'search_expenses')
+@router.callback('search_expenses')
 async def search_expenses_start(callback_query: types.CallbackQuery):
     """Начало поиска расходов"""
     await bot.send_message(callback_query.from_user.id,
@@ -1069,7 +1592,7 @@ async def search_expenses_start(callback_query: types.CallbackQuery):
 
 # ========== ОБРАБОТЧИКИ КНОПОК НАЗАД ==========
 
-@dp.callback_query_handler(lambda c: c.data == 'cancel_edit')
+@router.callback('cancel_edit')
 async def cancel_edit(callback_query: types.CallbackQuery):
     """Отмена редактирования"""
     await bot.send_message(callback_query.from_user.id,
@@ -1077,35 +1600,33 @@ async def cancel_edit(callback_query: types.CallbackQuery):
                           reply_markup=get_main_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'back_to_main')
+@router.callback('back_to_main')
 async def back_to_main(callback_query: types.CallbackQuery):
-    """Возврат в главное меню"""
-    await bot.send_message(callback_query.from_user.id,
-                          "Главное меню:",
-                          reply_markup=get_main_keyboard())
+    """Возврат в главное меню (клавиатура главного меню уже открыта под полем ввода)"""
+    await navigation.show(callback_query, "Главное меню:")
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'back_to_stats')
+@router.callback('back_to_stats')
 async def back_to_stats(callback_query: types.CallbackQuery):
     """Возврат в меню статистики"""
-    await bot.send_message(callback_query.from_user.id,
+    await navigation.show(callback_query,
                           "📊 Выберите тип статистики:",
                           reply_markup=get_statistics_menu_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'back_to_management')
+@router.callback('back_to_management')
 async def back_to_management(callback_query: types.CallbackQuery):
     """Возврат в меню управления"""
-    await bot.send_message(callback_query.from_user.id,
+    await navigation.show(callback_query,
                           "🔧 **Управление записями:**",
                           parse_mode='Markdown',
                           reply_markup=get_management_keyboard())
     await callback_query.answer()
 
-@dp.callback_query_handler(lambda c: c.data == 'back_to_search')
+@router.callback('back_to_search')
 async def back_to_search(callback_query: types.CallbackQuery):
     """Возврат в меню поиска"""
-    await bot.send_message(callback_query.from_user.id,
+    await navigation.show(callback_query,
                           "🔍 **Поиск записей:**",
                           parse_mode='Markdown',
                           reply_markup=get_search_keyboard())
@@ -1122,6 +1643,14 @@ async def on_startup(dp):
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске планировщика: {e}")
 
+async def on_shutdown(dp):
+    """Действия при остановке бота"""
+    await bot.outbox.close()
+    stop_reminders()
+    db.shutdown()
+    close_db()
+    logger.info("✅ Подключения к базе данных закрыты")
+
 if __name__ == '__main__':
     # Запускаем миграцию базы данных
     try:
@@ -1131,4 +1660,10 @@ if __name__ == '__main__':
         logger.warning(f"⚠️ Ошибка при миграции базы данных: {e}")
     
     # Запускаем бота
-    executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
\ No newline at end of file
+    if BOT_MODE == 'webhook':
+        import webhook
+        webhook.run(dp, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET or secrets.token_urlsafe(32),
+                    host=WEBHOOK_HOST, port=WEBHOOK_PORT, workers=WEBHOOK_WORKERS,
+                    max_pending=WEBHOOK_MAX_PENDING, on_startup=on_startup, on_shutdown=on_shutdown)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
\ No newline at end of file
@@ -1,9 +1,59 @@
 import os
 from dotenv import load_dotenv
+from tzlocal import get_localzone_name
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-MY_USER_ID = int(os.getenv('MY_USER_ID'))
-GIRLFRIEND_USER_ID = int(os.getenv('GIRLFRIEND_USER_ID'))
-DB_PATH = 'finance_planner.db'
\ No newline at end of file
+# Пара из первой версии бота: при запуске объединяется в общее домохозяйство (0 - не задан)
+MY_USER_ID = int(os.getenv('MY_USER_ID', 0))
+GIRLFRIEND_USER_ID = int(os.getenv('GIRLFRIEND_USER_ID', 0))
+# Разрешить новым пользователям создавать свои домохозяйства через /start
+ALLOW_REGISTRATION = os.getenv('ALLOW_REGISTRATION', '0') == '1'
+HOUSEHOLD_MAX_MEMBERS = int(os.getenv('HOUSEHOLD_MAX_MEMBERS', 2))
+DB_PATH = os.getenv('DB_PATH', 'finance_planner.db')
+# Файлы шардов через запятую; первым идет файл с уже существующими данными
+DB_SHARDS = [path.strip() for path in os.getenv('DB_SHARDS', DB_PATH).split(',') if path.strip()]
+# Справочник "домохозяйство -> шард" (нужен только при нескольких шардах)
+DB_SHARD_DIRECTORY = os.getenv('DB_SHARD_DIRECTORY', 'shards_directory.db')
+DB_MAX_READERS = int(os.getenv('DB_MAX_READERS', 4))
+DB_MAX_PENDING = int(os.getenv('DB_MAX_PENDING', 64))
+DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', 10))
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 8))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_COMMIT_WINDOW_MS = float(os.getenv('DB_COMMIT_WINDOW_MS', 2))
+ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', MY_USER_ID))
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 100))
+DB_SLOW_LOG = os.getenv('DB_SLOW_LOG', 'slow_queries.log')
+# Состояния незаконченных диалогов: файл, срок жизни брошенного диалога, размер кэша, задержка записи
+FSM_DB_PATH = os.getenv('FSM_DB_PATH', 'fsm_states.db')
+FSM_TTL_HOURS = float(os.getenv('FSM_TTL_HOURS', 24))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+FSM_FLUSH_MS = float(os.getenv('FSM_FLUSH_MS', 500))
+# Способ получения обновлений: polling или webhook (webhook - для развертывания за прокси,
+# а не для пропускной способности: HTTP-запрос на каждое обновление дороже пачки getUpdates)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Внешний адрес сервера для Telegram (https://example.com) и локальный адрес aiohttp
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token (пусто - новый при каждом запуске)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Параллельных обработчиков и предел очереди принятых, но не обработанных обновлений
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 32))
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', 1000))
+# Темп исходящих сообщений (лимиты Telegram): в секунду на бота, в секунду и запас на чат
+OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', 30))
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', 1))
+OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', 3))
+# Импорт выписок: файл с профилями колонок (JSON) и строк в одной записи в базу
+IMPORT_PROFILES_PATH = os.getenv('IMPORT_PROFILES_PATH', 'import_profiles.json')
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+# Рассылки напоминаний и сводок: чатов одновременно и попыток доставки одного сообщения
+DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', 64))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 4))
+# Часовой пояс пользователей, которые не выбрали свой командой /timezone (по умолчанию - пояс сервера)
+DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE') or get_localzone_name() or 'UTC'
+# Напоминание, опоздавшее из-за простоя бота больше чем на столько часов, не отправляется
+REMINDER_MISFIRE_GRACE_HOURS = float(os.getenv('REMINDER_MISFIRE_GRACE_HOURS', 12))
@@ -1,14 +1,168 @@
+import functools
+import inspect
+import secrets
 import sqlite3
-from datetime import datetime, date, timedelta
-from config import DB_PATH, MY_USER_ID, GIRLFRIEND_USER_ID
+from datetime import datetime, date, timedelta, timezone
+from config import (DB_SHARDS, DB_SHARD_DIRECTORY, DB_MAX_READERS, DB_SYNCHRONOUS, DB_COMMIT_WINDOW_MS,
+                    MY_USER_ID, GIRLFRIEND_USER_ID, PAGE_SIZE, HOUSEHOLD_MAX_MEMBERS)
+import query_stats
+import recurrence
+from periods import UTC_FORMAT, period_bounds, period_conditions, local_today, to_utc
+import rollups
+import search_index
+import shards
+from records import TRANSACTION_ROW, PLAN_ROW, PURCHASE_ROW, REMINDER_ROW, RECURRING_ROW
+
+# Шарды базы (по умолчанию один файл DB_PATH): у каждого свой поток-писатель
+# с групповой фиксацией и несколько читателей
+# SQL перехватывается только когда включен журнал медленных запросов
+router = shards.ShardRouter(DB_SHARDS, DB_SHARD_DIRECTORY, max_readers=DB_MAX_READERS,
+                            synchronous=DB_SYNCHRONOUS, commit_window=DB_COMMIT_WINDOW_MS / 1000,
+                            trace_callback=query_stats.trace if query_stats.slow_threshold else None,
+                            functions=(('recurrence_count', 5, recurrence.count_occurrences),))
+
+# Колонки, из которых строятся записи records.*; {t} - префикс таблицы
+TRANSACTION_COLUMNS = ("{t}id, {t}user_id, {t}type, {t}amount, {t}category, {t}description, {t}date, "
+                       "strftime('%H:%M', {t}created_at) as time")
+PLAN_COLUMNS = ("{t}id, {t}user_id, {t}title, {t}description, {t}date, {t}time, {t}category, "
+                "{t}is_shared, {t}notification_enabled, {t}notification_time, {t}recurrence")
+RECURRING_COLUMNS = ("{t}id, {t}user_id, {t}type, {t}amount, {t}category, {t}description, {t}recurrence, "
+                     "{t}start_date, {t}end_date")
+PURCHASE_COLUMNS = ("{t}id, {t}user_id, {t}item_name, {t}estimated_cost, {t}priority, "
+                    "{t}target_date, {t}notes, {t}status")
+
+# Домохозяйство пользователя (для подстановки в WHERE, параметр - user_id)
+HOUSEHOLD_OF_USER = "(SELECT household_id FROM household_members WHERE user_id = ?)"
+
+# Таблицы с данными, строки которых принадлежат домохозяйству автора
+HOUSEHOLD_TABLES = ('transactions', 'plans', 'planned_purchases', 'recurring_transactions')
+
+# Сколько хешей импорта проверять одним запросом (предел параметров SQLite)
+IMPORT_HASH_BATCH = 500
+
+# Подписчики на изменения планов: listener(plan_id) вызывается потоком-писателем
+# после commit add_plan, update_plan и soft_delete_plan
+plan_listeners = []
+
+def _columns(template, prefix=''):
+    """Список колонок записи с префиксом таблицы"""
+    return template.format(t=prefix)
+
+def _write_operation(route, committed=None):
+    """Функция записи, которая выполняется потоком-писателем шарда
+
+    route - как выбирается шард по первому аргументу вызова: 'user'
+    (user_id), 'household' (household_id), имя таблицы (id записи в ней),
+    'shard' (номер шарда; в func он не передается) или 'all' (на всех
+    шардах, результат - список по шардам).
+
+    Первый аргумент func - курсор писателя, его передает пул. Вызов
+    блокируется до commit пачки, в которую попала операция; submit(...)
+    возвращает Future без ожидания. Время вызова в query_stats
+    считается от постановки в очередь до commit.
+
+    Если к моменту выполнения домохозяйство начали переносить в другой
+    шард, Future из submit(...) завершается shards.HouseholdMovedError,
+    а вызов функции сам выбирает шард заново.
+
+    committed(результат, *аргументы вызова), если задан, вызывается
+    потоком-писателем после успешного commit операции.
+    """
+    def decorator(func):
+        name = func.__name__
+
+        def submit(*args, **kwargs):
+            call = query_stats.begin(name)
+            func_args = args[1:] if route == 'shard' else args
+
+            def operation(cursor):
+                with query_stats.bound(call):
+                    return func(cursor, *func_args, **kwargs)
+
+            def done(future):
+                error = future.cancelled() or future.exception() is not None
+                query_stats.finish(call, None if error else future.result(), error=error, explain=_explain)
+                if committed is not None and not error:
+                    committed(future.result(), *args, **kwargs)
+
+            future = _submit_routed(route, args, operation)
+            future.add_done_callback(done)
+            return future
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            while True:
+                try:
+                    return submit(*args, **kwargs).result()
+                except shards.HouseholdMovedError:
+                    # Шард выбран до переноса; новый выбор дождется его окончания
+                    continue
+
+        parameters = list(inspect.signature(func).parameters.values())[1:]
+        if route == 'shard':
+            parameters.insert(0, inspect.Parameter('shard', inspect.Parameter.POSITIONAL_OR_KEYWORD))
+        wrapper.__signature__ = inspect.signature(func).replace(parameters=parameters)
+        wrapper.submit = submit
+        return wrapper
+
+    return decorator
+
+def _submit_routed(route, args, operation):
+    """Поставить операцию в очередь писателя шарда, выбранного по route"""
+    if route == 'all':
+        return router.submit_write_all(operation)
+    key = args[0]
+    if route == 'shard':
+        return router.pools[key].submit_write(operation)
+    if route == 'user':
+        pool = router.for_user(key, write=True)
+        household_of = lambda cursor: router.user_household(key)
+    elif route == 'household':
+        pool = router.for_household(key, write=True)
+        household_of = lambda cursor: key
+    else:
+        pool = router.for_record(route, key, write=True)
+        household_of = lambda cursor: _record_household(cursor, route, key)
+    return pool.submit_write(router.fenced(pool, household_of, operation))
+
+def _record_household(cursor, table, record_id):
+    row = cursor.execute(f'SELECT household_id FROM {table} WHERE id = ?', (record_id,)).fetchone()
+    return row[0] if row else None
+
+def _fan_out(func):
+    """Выполнить func(pool) на всех шардах параллельно; SQL попадает в текущий замер query_stats"""
+    call = query_stats.current()
+
+    def run(pool):
+        with query_stats.bound(call):
+            return func(pool)
+
+    return router.fan_out(run)
+
+def _explain(sql):
+    """EXPLAIN QUERY PLAN для текста запроса из журнала медленных запросов"""
+    try:
+        with router.pools[0].reader() as conn:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    except sqlite3.Error as e:
+        return f"не удалось построить план: {e}"
+    return "; ".join(row[-1] for row in rows)
+
+def close_db():
+    """Закрыть все подключения к базе данных"""
+    router.close()
 
 # ========== ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ ==========
 
 def init_db():
-    """Инициализация базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    """Инициализация базы данных (всех шардов и справочника)"""
+    router.submit_write_all(_create_schema).result()
+    router.init_directory()
+    _bootstrap_legacy_household()
+    print("✅ База данных инициализирована")
+
+def _create_schema(cursor):
+    """Создать таблицы и индексы шарда, перенести данные старых версий"""
     # Таблица пользователей
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -19,6 +173,30 @@ def init_db():
         )
     ''')
     
+    # Домохозяйства (пары) и их участники; пользователь состоит в одном домохозяйстве
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS households (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            invite_code TEXT UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS household_members (
+            user_id INTEGER PRIMARY KEY,
+            household_id INTEGER NOT NULL,
+            role TEXT DEFAULT 'member' CHECK(role IN ('owner', 'member')),
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (household_id) REFERENCES households (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_household_members_household
+        ON household_members (household_id, user_id)
+    ''')
+    
     # Таблица транзакций (расходы/доходы)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS transactions (
@@ -29,6 +207,7 @@ def init_db():
             category TEXT,
             description TEXT,
             date DATE DEFAULT CURRENT_DATE,
+            household_id INTEGER REFERENCES households (id),
             is_deleted BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -36,6 +215,18 @@ def init_db():
         )
     ''')
     
+    # Индексы для выборок транзакций по диапазону дат
+    # created_at в индексе - для постраничного вывода по ключу (date, created_at, id)
+    cursor.execute('DROP INDEX IF EXISTS idx_transactions_user_date')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date_created
+        ON transactions (user_id, is_deleted, date, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_type_date
+        ON transactions (is_deleted, type, date, category)
+    ''')
+    
     # Таблица планов
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS plans (
@@ -49,6 +240,7 @@ def init_db():
             is_shared BOOLEAN DEFAULT 0,
             notification_enabled BOOLEAN DEFAULT 1,
             notification_time TEXT,
+            household_id INTEGER REFERENCES households (id),
             is_deleted BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -67,6 +259,7 @@ def init_db():
             target_date DATE,
             notes TEXT,
             status TEXT DEFAULT 'planned',
+            household_id INTEGER REFERENCES households (id),
             is_deleted BOOLEAN DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -74,60 +267,453 @@ def init_db():
         )
     ''')
     
-    conn.commit()
-    conn.close()
-    print("✅ База данных инициализирована")
+    # Повторяющиеся транзакции: правило хранится один раз, повторы
+    # разворачиваются при чтении (recurrence.py); end_date - последний день
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT CHECK(type IN ('expense', 'income')),
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            recurrence TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE,
+            household_id INTEGER REFERENCES households (id),
+            is_deleted BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_recurring_transactions_user
+        ON recurring_transactions (user_id, start_date) WHERE is_deleted = 0
+    ''')
+    
+    # Базы первой версии: колонка домохозяйства
+    for table in HOUSEHOLD_TABLES:
+        _add_column_if_missing(cursor, table, 'household_id', 'INTEGER REFERENCES households (id)')
+    
+    # Индексы по домохозяйству: запросы пары читают только свои строки,
+    # сколько бы домохозяйств ни было в базе
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_household_date
+        ON transactions (household_id, is_deleted, date, type)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_household_date
+        ON plans (household_id, is_deleted, date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_purchases_household_user
+        ON planned_purchases (household_id, user_id, is_deleted, status)
+    ''')
+    _backfill_household_ids(cursor)
+    
+    # Часовой пояс пользователя (имя IANA; NULL - DEFAULT_TIMEZONE)
+    _add_column_if_missing(cursor, 'users', 'timezone', 'TEXT')
+    
+    # Повторяющиеся планы: правило повтора, date - дата начала
+    _add_column_if_missing(cursor, 'plans', 'recurrence', 'TEXT')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_recurring ON plans (household_id, date)
+        WHERE recurrence IS NOT NULL AND is_deleted = 0
+    ''')
+    
+    # Напоминания о планах: момент срабатывания в UTC, время отправки (не больше
+    # одного раза) и индекс неотправленных по моменту срабатывания
+    _add_column_if_missing(cursor, 'plans', 'sent_at', 'TIMESTAMP')
+    reminders_added = _add_column_if_missing(cursor, 'plans', 'remind_at', 'TEXT')
+    cursor.execute('DROP INDEX IF EXISTS idx_plans_reminders')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_plans_remind_at ON plans (remind_at)
+        WHERE notification_enabled = 1 AND is_deleted = 0 AND remind_at IS NOT NULL AND sent_at IS NULL
+    ''')
+    if reminders_added:
+        # Раньше время напоминания не заполнялось: будущие планы со временем напоминают
+        # в это время. Только при переходе - дальше пустое время значит "без напоминания"
+        cursor.execute('''
+            UPDATE plans SET notification_time = time
+            WHERE notification_time IS NULL AND time IS NOT NULL AND date >= DATE('now')
+        ''')
+    cursor.execute('''
+        SELECT id FROM plans
+        WHERE remind_at IS NULL AND notification_time IS NOT NULL AND sent_at IS NULL AND date >= DATE('now', '-1 day')
+    ''')
+    for plan_id, in cursor.fetchall():
+        _update_remind_at(cursor, plan_id)
+    
+    # Хеш строки банковской выписки: повторный импорт не создает дублей
+    _add_column_if_missing(cursor, 'transactions', 'import_hash', 'TEXT')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_import_hash
+        ON transactions (user_id, import_hash) WHERE import_hash IS NOT NULL
+    ''')
+    
+    # Агрегаты по дням и месяцам для статистики
+    rollups.create_tables(cursor)
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM monthly_totals)')
+    if not cursor.fetchone()[0]:
+        rollups.rebuild(cursor)
+    
+    # Полнотекстовый поиск по транзакциям, планам и покупкам
+    search_index.create_tables(cursor)
+    
+    # Сообщения рассылок, которые не удалось доставить после всех попыток
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _add_column_if_missing(cursor, table, column, declaration):
+    """Добавить колонку в существующую таблицу (миграция старых баз); True - колонка добавлена"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column in {row[1] for row in cursor.fetchall()}:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+def _bootstrap_legacy_household():
+    """Объединить MY_USER_ID и GIRLFRIEND_USER_ID в общее домохозяйство
+
+    Выполняется, если id заданы и ни один из них еще не состоит
+    в домохозяйстве. Данные первой версии лежат в первом шарде.
+    """
+    legacy_ids = [user_id for user_id in (MY_USER_ID, GIRLFRIEND_USER_ID) if user_id]
+    if not legacy_ids or any(get_household_id(user_id) for user_id in legacy_ids):
+        return
+
+    household_id = None if router.single else router.allocate_household_id()
+    household_id = _create_legacy_household(0, legacy_ids, household_id)
+    if household_id is not None and not router.single:
+        router.register_household(household_id, 0, members=legacy_ids)
+
+@_write_operation('shard')
+def _create_legacy_household(cursor, legacy_ids, household_id=None):
+    """Создать общее домохозяйство пары в шарде, вернуть его id (None - пара уже в домохозяйстве)"""
+    placeholders = ', '.join('?' * len(legacy_ids))
+    cursor.execute(f'SELECT 1 FROM household_members WHERE user_id IN ({placeholders})', legacy_ids)
+    if cursor.fetchone():
+        return None
+
+    household_id = _create_household(cursor, 'Общий бюджет', household_id)
+    for role, user_id in zip(('owner', 'member'), legacy_ids):
+        cursor.execute(
+            'INSERT INTO household_members (user_id, household_id, role) VALUES (?, ?, ?)',
+            (user_id, household_id, role)
+        )
+    _backfill_household_ids(cursor)
+    return household_id
+
+def _backfill_household_ids(cursor):
+    """Проставить household_id строкам, созданным до появления домохозяйств"""
+    for table in HOUSEHOLD_TABLES:
+        cursor.execute(f'''
+            UPDATE {table}
+            SET household_id = (SELECT household_id FROM household_members m WHERE m.user_id = {table}.user_id)
+            WHERE household_id IS NULL
+            AND user_id IN (SELECT user_id FROM household_members)
+        ''')
+
+def _create_household(cursor, name, household_id=None):
+    """Создать домохозяйство с новым кодом приглашения, вернуть id
+
+    household_id задается, когда id выдает справочник шардов.
+    """
+    cursor.execute(
+        'INSERT INTO households (id, name, invite_code) VALUES (?, ?, ?)',
+        (household_id, name, secrets.token_urlsafe(6))
+    )
+    return cursor.lastrowid
+
+def _move_user_to_household(cursor, user_id, household_id, role):
+    """Сделать пользователя участником домохозяйства вместе с его записями
+
+    Прежнее домохозяйство, в котором никого не осталось, удаляется;
+    возвращает его id (или None).
+    """
+    cursor.execute('SELECT household_id FROM household_members WHERE user_id = ?', (user_id,))
+    previous = cursor.fetchone()
+    cursor.execute(
+        'INSERT OR REPLACE INTO household_members (user_id, household_id, role) VALUES (?, ?, ?)',
+        (user_id, household_id, role)
+    )
+    for table in HOUSEHOLD_TABLES:
+        cursor.execute(f'UPDATE {table} SET household_id = ? WHERE user_id = ?', (household_id, user_id))
+
+    if previous and previous[0] != household_id:
+        cursor.execute('''
+            DELETE FROM households
+            WHERE id = ? AND NOT EXISTS (SELECT 1 FROM household_members WHERE household_id = ?)
+        ''', (previous[0], previous[0]))
+        if cursor.rowcount:
+            return previous[0]
+    return None
 
 # ========== ФУНКЦИИ ДЛЯ ПОЛЬЗОВАТЕЛЕЙ ==========
 
-def add_user(user_id, username, full_name):
+@_write_operation('user')
+def add_user(cursor, user_id, username, full_name):
     """Добавить пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     cursor.execute(
         'INSERT OR IGNORE INTO users (id, username, full_name) VALUES (?, ?, ?)',
         (user_id, username, full_name)
     )
-    conn.commit()
-    conn.close()
 
 def get_user(user_id):
     """Получить пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        result = cursor.fetchone()
     return result
 
-# ========== ФУНКЦИИ ДЛЯ ТРАНЗАКЦИЙ ==========
+def _user_zone(cursor, user_id):
+    row = cursor.execute('SELECT timezone FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+def _user_today(cursor, user_id):
+    """Сегодняшняя дата в поясе пользователя"""
+    return local_today(_user_zone(cursor, user_id))
+
+def _household_today(cursor, household_id):
+    """Сегодняшняя дата в поясе владельца домохозяйства"""
+    row = cursor.execute('''
+        SELECT u.timezone FROM household_members m JOIN users u ON u.id = m.user_id
+        WHERE m.household_id = ? ORDER BY m.role = 'owner' DESC, m.joined_at LIMIT 1
+    ''', (household_id,)).fetchone()
+    return local_today(row[0] if row else None)
+
+def get_user_timezone(user_id):
+    """Часовой пояс пользователя (None - не выбран, действует DEFAULT_TIMEZONE)"""
+    with router.for_user(user_id).reader() as conn:
+        return _user_zone(conn.cursor(), user_id)
+
+def get_user_today(user_id):
+    """Сегодняшняя дата пользователя (date) в его часовом поясе"""
+    with router.for_user(user_id).reader() as conn:
+        return _user_today(conn.cursor(), user_id)
 
-def add_transaction(user_id, trans_type, amount, category, description=None):
-    """Добавить транзакцию (расход/доход)"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+@_write_operation('user', committed=lambda plan_ids, *args, **kwargs: [_plan_committed(plan_id)
+                                                                       for plan_id in plan_ids])
+def set_user_timezone(cursor, user_id, zone_name):
+    """Сменить часовой пояс пользователя и пересчитать моменты его напоминаний
+
+    Возвращает id планов, у которых сдвинулось напоминание.
+    """
+    cursor.execute('UPDATE users SET timezone = ? WHERE id = ?', (zone_name, user_id))
     cursor.execute('''
-        INSERT INTO transactions (user_id, type, amount, category, description, date)
-        VALUES (?, ?, ?, ?, ?, DATE('now'))
-    ''', (user_id, trans_type, amount, category, description))
-    conn.commit()
-    conn.close()
+        SELECT id FROM plans
+        WHERE user_id = ? AND notification_time IS NOT NULL AND sent_at IS NULL AND is_deleted = 0
+    ''', (user_id,))
+    plan_ids = [plan_id for plan_id, in cursor.fetchall()]
+    for plan_id in plan_ids:
+        _update_remind_at(cursor, plan_id)
+    return plan_ids
+
+# ========== ФУНКЦИИ ДЛЯ ДОМОХОЗЯЙСТВ ==========
+
+# Домохозяйство по коду приглашения и число его участников, кроме пользователя
+INVITE_QUERY = '''
+    SELECT h.id, COUNT(m.user_id)
+    FROM households h
+    LEFT JOIN household_members m ON m.household_id = h.id AND m.user_id != ?
+    WHERE h.invite_code = ?
+    GROUP BY h.id
+'''
+
+def create_household(owner_id, name):
+    """Создать домохозяйство и сделать пользователя его владельцем
+
+    Возвращает (household_id, invite_code).
+    """
+    shard = router.user_shard(owner_id, write=True)
+    household_id = None if router.single else router.allocate_household_id()
+    household_id, invite_code, removed = _create_household_in(shard, owner_id, name, household_id)
+    if not router.single:
+        router.register_household(household_id, shard, members=[owner_id], removed=removed)
+    return household_id, invite_code
+
+@_write_operation('shard')
+def _create_household_in(cursor, owner_id, name, household_id=None):
+    """Создать домохозяйство в шарде: (household_id, invite_code, удаленное прежнее домохозяйство)"""
+    household_id = _create_household(cursor, name, household_id)
+    removed = _move_user_to_household(cursor, owner_id, household_id, 'owner')
+    cursor.execute('SELECT invite_code FROM households WHERE id = ?', (household_id,))
+    return household_id, cursor.fetchone()[0], removed
+
+def join_household(user_id, invite_code):
+    """Вступить в домохозяйство по коду приглашения
+
+    Возвращает id домохозяйства или None, если код неверный
+    или в домохозяйстве уже HOUSEHOLD_MAX_MEMBERS участников.
+    Если домохозяйство в другом шарде, записи пользователя
+    сначала переносятся туда.
+    """
+    if router.single:
+        return _join_household_in(0, user_id, invite_code)[0]
+
+    def find(pool):
+        with pool.reader() as conn:
+            return conn.execute(INVITE_QUERY, (user_id, invite_code)).fetchone()
+
+    found = [row for row in _fan_out(find) if row is not None]
+    if not found or found[0][1] >= HOUSEHOLD_MAX_MEMBERS:
+        return None
+
+    shard = router.household_shard(found[0][0], write=True)
+    shards.move_user(router, user_id, shard)
+    household_id, removed = _join_household_in(shard, user_id, invite_code)
+    if household_id is not None:
+        router.register_household(household_id, shard, members=[user_id], removed=removed)
+    return household_id
+
+@_write_operation('shard')
+def _join_household_in(cursor, user_id, invite_code):
+    """Вступить в домохозяйство шарда: (household_id, удаленное прежнее домохозяйство)"""
+    cursor.execute(INVITE_QUERY, (user_id, invite_code))
+    row = cursor.fetchone()
+    if row is None or row[1] >= HOUSEHOLD_MAX_MEMBERS:
+        return None, None
+
+    household_id = row[0]
+    return household_id, _move_user_to_household(cursor, user_id, household_id, 'member')
+
+def get_household_id(user_id):
+    """Получить id домохозяйства пользователя (None, если он не состоит ни в одном)"""
+    if not router.single:
+        return router.user_household(user_id)
+    with router.pools[0].reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT household_id FROM household_members WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+def get_household(household_id):
+    """Получить домохозяйство: (id, name, invite_code)"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, invite_code FROM households WHERE id = ?', (household_id,))
+        result = cursor.fetchone()
+    return result
+
+def get_household_members(household_id):
+    """Участники домохозяйства: (user_id, full_name, role)"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT m.user_id, u.full_name, m.role
+            FROM household_members m
+            LEFT JOIN users u ON u.id = m.user_id
+            WHERE m.household_id = ?
+            ORDER BY m.joined_at, m.user_id
+        ''', (household_id,))
+        results = cursor.fetchall()
+    return results
+
+# ========== ФУНКЦИИ ДЛЯ ТРАНЗАКЦИЙ ==========
+
+@_write_operation('user')
+def add_transaction(cursor, user_id, trans_type, amount, category, description=None):
+    """Добавить транзакцию (расход/доход) датой пользователя"""
+    trans_date = _user_today(cursor, user_id).isoformat()
+
+    cursor.execute(f'''
+        INSERT INTO transactions (user_id, type, amount, category, description, date, household_id)
+        VALUES (?, ?, ?, ?, ?, ?, {HOUSEHOLD_OF_USER})
+    ''', (user_id, trans_type, amount, category, description, trans_date, user_id))
+    rollups.apply(cursor, user_id, trans_type, amount, category, trans_date)
     return cursor.lastrowid
 
+@_write_operation('user')
+def add_transactions(cursor, user_id, entries):
+    """Добавить пачку транзакций (type, amount, category, description) одной транзакцией БД
+
+    Возвращает id добавленных записей в порядке entries.
+    """
+    if not entries:
+        return []
+    trans_date = _user_today(cursor, user_id).isoformat()
+    household_id = cursor.execute(
+        'SELECT household_id FROM household_members WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    household_id = household_id[0] if household_id else None
+
+    cursor.executemany('''
+        INSERT INTO transactions (user_id, type, amount, category, description, date, household_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(user_id, trans_type, amount, category, description, trans_date, household_id)
+          for trans_type, amount, category, description in entries])
+    # Писатель один, поэтому id пачки идут подряд и заканчиваются последним вставленным
+    last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+    rollups.apply_many(cursor, [(user_id, trans_type, amount, category, trans_date)
+                                for trans_type, amount, category, _ in entries])
+    return list(range(last_id - len(entries) + 1, last_id + 1))
+
+@_write_operation('user')
+def import_transactions(cursor, user_id, rows):
+    """Добавить пачку строк выписки (date, created_at, type, amount, category, description, import_hash)
+
+    Строки с хешем, который уже есть у пользователя, пропускаются.
+    Возвращает (добавлено, дублей).
+    """
+    known = set()
+    hashes = list({row[6] for row in rows})
+    for start in range(0, len(hashes), IMPORT_HASH_BATCH):
+        batch = hashes[start:start + IMPORT_HASH_BATCH]
+        cursor.execute(f'''
+            SELECT import_hash FROM transactions
+            WHERE user_id = ? AND import_hash IN ({', '.join('?' * len(batch))})
+        ''', (user_id, *batch))
+        known.update(import_hash for import_hash, in cursor.fetchall())
+
+    fresh = []
+    for row in rows:
+        if row[6] not in known:
+            known.add(row[6])
+            fresh.append(row)
+    if not fresh:
+        return 0, len(rows)
+
+    household_id = cursor.execute(
+        'SELECT household_id FROM household_members WHERE user_id = ?', (user_id,)
+    ).fetchone()
+    household_id = household_id[0] if household_id else None
+    cursor.executemany('''
+        INSERT INTO transactions (user_id, date, created_at, type, amount, category, description,
+                                  import_hash, household_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(user_id, *row, household_id) for row in fresh])
+    rollups.apply_many(cursor, [(user_id, trans_type, amount, category, trans_date)
+                                for trans_date, _, trans_type, amount, category, _, _ in fresh])
+    return len(fresh), len(rows) - len(fresh)
+
 def get_transaction(transaction_id):
     """Получить конкретную транзакцию"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
-    result = cursor.fetchone()
-    conn.close()
+    with router.for_record('transactions', transaction_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = TRANSACTION_ROW
+        cursor.execute(f'SELECT {_columns(TRANSACTION_COLUMNS)} FROM transactions WHERE id = ?',
+                       (transaction_id,))
+        result = cursor.fetchone()
+    if result is None:
+        # Запись могла переехать в другой шард вместе с домохозяйством
+        moved = router.resolve_record('transactions', transaction_id)
+        if moved is not None:
+            return get_transaction(moved)
     return result
 
-def update_transaction(transaction_id, amount=None, category=None, description=None):
+@_write_operation('transactions')
+def update_transaction(cursor, transaction_id, amount=None, category=None, description=None):
     """Обновить транзакцию"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     updates = []
     params = []
     
@@ -144,145 +730,365 @@ def update_transaction(transaction_id, amount=None, category=None, description=N
         params.append(description)
     
     if updates:
+        cursor.execute('''
+            SELECT user_id, type, amount, category, date, is_deleted
+            FROM transactions WHERE id = ?
+        ''', (transaction_id,))
+        old = cursor.fetchone()
+
         updates.append("updated_at = CURRENT_TIMESTAMP")
         query = f"UPDATE transactions SET {', '.join(updates)} WHERE id = ?"
         params.append(transaction_id)
         cursor.execute(query, params)
-    
-    conn.commit()
-    conn.close()
 
-def soft_delete_transaction(transaction_id):
+        # Переносим сумму в агрегатах, если изменились сумма или категория
+        if old and not old[5] and (amount is not None or category is not None):
+            user_id, trans_type, old_amount, old_category, trans_date, _ = old
+            rollups.apply(cursor, user_id, trans_type, old_amount, old_category, trans_date, sign=-1)
+            rollups.apply(cursor, user_id, trans_type,
+                          amount if amount is not None else old_amount,
+                          category if category is not None else old_category,
+                          trans_date)
+
+@_write_operation('transactions')
+def soft_delete_transaction(cursor, transaction_id):
     """Мягкое удаление транзакции"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT user_id, type, amount, category, date
+        FROM transactions WHERE id = ? AND is_deleted = 0
+    ''', (transaction_id,))
+    old = cursor.fetchone()
+
     cursor.execute('''
         UPDATE transactions 
         SET is_deleted = 1, updated_at = CURRENT_TIMESTAMP 
         WHERE id = ?
     ''', (transaction_id,))
-    conn.commit()
-    conn.close()
+
+    if old:
+        rollups.apply(cursor, *old, sign=-1)
 
 def get_user_transactions(user_id, period='today', trans_type=None):
-    """Получить транзакции пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    type_filter = f"AND type = '{trans_type}'" if trans_type else ""
+    """Получить транзакции пользователя (период - в его часовом поясе)"""
+    conditions = ["user_id = ?", "is_deleted = 0"]
+    params = [user_id]
+
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
     
-    if period == 'today':
-        query = f"""
-            SELECT id, type, amount, category, description, 
-                   strftime('%H:%M', created_at) as time
-            FROM transactions 
-            WHERE user_id = ? AND date = DATE('now') 
-            AND is_deleted = 0 {type_filter}
-            ORDER BY created_at DESC
-        """
-        cursor.execute(query, (user_id,))
-    elif period == 'week':
-        query = f"""
-            SELECT id, type, amount, category, description, date,
-                   strftime('%H:%M', created_at) as time
-            FROM transactions 
-            WHERE user_id = ? AND date >= DATE('now', '-7 days') 
-            AND is_deleted = 0 {type_filter}
-            ORDER BY date DESC, created_at DESC
-        """
-        cursor.execute(query, (user_id,))
-    elif period == 'month':
-        query = f"""
-            SELECT id, type, amount, category, description, date,
-                   strftime('%H:%M', created_at) as time
-            FROM transactions 
-            WHERE user_id = ? AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now') 
-            AND is_deleted = 0 {type_filter}
-            ORDER BY date DESC, created_at DESC
-        """
-        cursor.execute(query, (user_id,))
-    elif period == 'all':
-        query = f"""
-            SELECT id, type, amount, category, description, date,
-                   strftime('%Y-%m-%d %H:%M', created_at) as datetime
+        period_conds, period_params = period_conditions(period, today=_user_today(cursor, user_id))
+        conditions.extend(period_conds)
+        params.extend(period_params)
+
+        if trans_type:
+            conditions.append("type = ?")
+            params.append(trans_type)
+
+        where_clause = " AND ".join(conditions)
+
+        cursor.row_factory = TRANSACTION_ROW
+        order = "created_at DESC" if period == 'today' else "date DESC, created_at DESC"
+        limit = "LIMIT 100" if period == 'all' else ""
+        cursor.execute(f"""
+            SELECT {_columns(TRANSACTION_COLUMNS)}
             FROM transactions 
-            WHERE user_id = ? AND is_deleted = 0 {type_filter}
-            ORDER BY date DESC, created_at DESC
-            LIMIT 100
-        """
-        cursor.execute(query, (user_id,))
+            WHERE {where_clause}
+            ORDER BY {order}
+            {limit}
+        """, params)
     
-    results = cursor.fetchall()
-    conn.close()
+        results = cursor.fetchall()
     return results
 
-def search_transactions(user_id, search_text=None, category=None, min_amount=None, max_amount=None):
-    """Поиск транзакций"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+def _text_search(fts, table, search_text, like_columns):
+    """Источник строк и условия текстового поиска
+
+    При наличии FTS5 ищет через MATCH с ранжированием bm25,
+    иначе - через LIKE по колонкам like_columns.
+    Возвращает (from_clause, conditions, params, rank_order).
+    """
+    match = search_index.match_query(search_text) if search_index.available else None
+    if match:
+        from_clause = f"{fts} JOIN {table} t ON t.id = {fts}.rowid"
+        return from_clause, [f"{fts} MATCH ?"], [match], f"bm25({fts}), "
+
+    conditions = []
+    params = []
+    if search_text:
+        conditions.append("(" + " OR ".join(f"t.{col} LIKE ?" for col in like_columns) + ")")
+        params.extend([f'%{search_text}%'] * len(like_columns))
+    return f"{table} t", conditions, params, ""
+
+def get_transactions_page(user_id, trans_type=None, period='all', after_id=None, before_id=None,
+                          limit=PAGE_SIZE):
+    """Страница транзакций пользователя, новые сначала
+
+    Постраничный вывод по ключу (date, created_at, id): after_id - id последней
+    строки предыдущей страницы (листаем дальше), before_id - id первой строки
+    текущей страницы (листаем назад). Каждая страница - одно чтение диапазона
+    индекса независимо от глубины.
+    Возвращает (rows, has_prev, has_next).
+    """
     conditions = ["user_id = ?", "is_deleted = 0"]
     params = [user_id]
+
+    if trans_type:
+        conditions.append("type = ?")
+        params.append(trans_type)
+
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        start, end = period_bounds(period, _user_today(cursor, user_id))
+
+        boundary_id = after_id if after_id is not None else before_id
+        if boundary_id is not None:
+            # Только своя строка: id границы приходит из callback_data
+            cursor.execute('SELECT date, created_at, id FROM transactions WHERE id = ? AND user_id = ?',
+                           (boundary_id, user_id))
+            key = cursor.fetchone()
+            if key is None:
+                after_id = before_id = None
+
+        if after_id is not None:
+            conditions.append("(date, created_at, id) < (?, ?, ?)")
+            params.extend(key)
+        elif before_id is not None:
+            conditions.append("(date, created_at, id) > (?, ?, ?)")
+            params.extend(key)
+
+        # Вторую границу периода задает сам ключ страницы
+        if start is not None and before_id is None:
+            conditions.append("date >= ?")
+            params.append(start)
+        if end is not None and after_id is None:
+            conditions.append("date < ?")
+            params.append(end)
+
+        order = "ASC" if before_id is not None else "DESC"
+        params.append(limit + 1)
+        cursor.row_factory = TRANSACTION_ROW
+        cursor.execute(f'''
+            SELECT {_columns(TRANSACTION_COLUMNS)}
+            FROM transactions
+            WHERE {" AND ".join(conditions)}
+            ORDER BY date {order}, created_at {order}, id {order}
+            LIMIT ?
+        ''', params)
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before_id is not None:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, after_id is not None, has_more
+
+def search_transactions(user_id, search_text=None, category=None, min_amount=None, max_amount=None,
+                        date_from=None, date_to=None):
+    """Поиск транзакций"""
+    from_clause, conditions, params, rank_order = _text_search(
+        'transactions_fts', 'transactions', search_text, ('description', 'category')
+    )
     
-    if search_text:
-        conditions.append("(description LIKE ? OR category LIKE ?)")
-        params.extend([f'%{search_text}%', f'%{search_text}%'])
+    conditions += ["t.user_id = ?", "t.is_deleted = 0"]
+    params.append(user_id)
     
     if category:
-        conditions.append("category = ?")
+        conditions.append("t.category = ?")
         params.append(category)
     
     if min_amount is not None:
-        conditions.append("amount >= ?")
+        conditions.append("t.amount >= ?")
         params.append(min_amount)
     
     if max_amount is not None:
-        conditions.append("amount <= ?")
+        conditions.append("t.amount <= ?")
         params.append(max_amount)
     
-    where_clause = " AND ".join(conditions)
+    if date_from:
+        conditions.append("t.date >= ?")
+        params.append(date_from)
     
+    if date_to:
+        conditions.append("t.date <= ?")
+        params.append(date_to)
+    
+    where_clause = " AND ".join(conditions)
+
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = TRANSACTION_ROW
+        cursor.execute(f'''
+            SELECT {_columns(TRANSACTION_COLUMNS, 't.')}
+            FROM {from_clause}
+            WHERE {where_clause}
+            ORDER BY {rank_order}t.date DESC, t.created_at DESC
+            LIMIT 50
+        ''', params)
+    
+        results = cursor.fetchall()
+    return results
+
+# ========== ПОВТОРЯЮЩИЕСЯ ТРАНЗАКЦИИ ==========
+#
+# Аренда, подписки, зарплата: правило хранится одной строкой, отдельные
+# транзакции не создаются. Статистика добавляет к агрегатам повторы из
+# запрошенного периода (_recurring_totals), но только прошедшие - по
+# сегодняшний день пользователя включительно.
+
+@_write_operation('user')
+def add_recurring_transaction(cursor, user_id, trans_type, amount, category, description, rule, start_date=None):
+    """Добавить повторяющуюся транзакцию; start_date по умолчанию - сегодня пользователя"""
+    rule = recurrence.format_rule(recurrence.parse_rule(rule))
+    start_date = start_date or _user_today(cursor, user_id).isoformat()
     cursor.execute(f'''
-        SELECT id, type, amount, category, description, date,
-               strftime('%H:%M', created_at) as time
-        FROM transactions 
-        WHERE {where_clause}
-        ORDER BY date DESC, created_at DESC
-        LIMIT 50
-    ''', params)
-    
-    results = cursor.fetchall()
-    conn.close()
+        INSERT INTO recurring_transactions (user_id, type, amount, category, description, recurrence, start_date,
+                                            household_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, {HOUSEHOLD_OF_USER})
+    ''', (user_id, trans_type, amount, category, description, rule, start_date, user_id))
+    return cursor.lastrowid
+
+def get_recurring_transaction(rule_id):
+    """Получить повторяющуюся транзакцию"""
+    with router.for_record('recurring_transactions', rule_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = RECURRING_ROW
+        cursor.execute(f'''
+            SELECT {_columns(RECURRING_COLUMNS)} FROM recurring_transactions WHERE id = ? AND is_deleted = 0
+        ''', (rule_id,))
+        result = cursor.fetchone()
+    if result is None:
+        moved = router.resolve_record('recurring_transactions', rule_id)
+        if moved is not None:
+            return get_recurring_transaction(moved)
+    return result
+
+def get_recurring_transactions(user_id):
+    """Действующие повторяющиеся транзакции пользователя"""
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _user_today(cursor, user_id).isoformat()
+        cursor.row_factory = RECURRING_ROW
+        cursor.execute(f'''
+            SELECT {_columns(RECURRING_COLUMNS)}
+            FROM recurring_transactions
+            WHERE user_id = ? AND is_deleted = 0 AND (end_date IS NULL OR end_date >= ?)
+            ORDER BY start_date, id
+        ''', (user_id, today))
+        results = cursor.fetchall()
     return results
 
+@_write_operation('recurring_transactions')
+def stop_recurring_transaction(cursor, rule_id):
+    """Прекратить повторы после сегодняшнего дня; прошедшие остаются в статистике"""
+    row = cursor.execute('SELECT user_id FROM recurring_transactions WHERE id = ?', (rule_id,)).fetchone()
+    if row is None:
+        return False
+    today = _user_today(cursor, row[0]).isoformat()
+    cursor.execute('''
+        UPDATE recurring_transactions SET end_date = ?
+        WHERE id = ? AND is_deleted = 0 AND (end_date IS NULL OR end_date > ?)
+    ''', (today, rule_id, today))
+    return cursor.rowcount == 1
+
+@_write_operation('recurring_transactions')
+def soft_delete_recurring_transaction(cursor, rule_id):
+    """Мягкое удаление повторяющейся транзакции вместе со всеми ее повторами"""
+    cursor.execute('UPDATE recurring_transactions SET is_deleted = 1 WHERE id = ?', (rule_id,))
+
+def _recurring_totals(user_condition, user_params, start, end, today):
+    """Подзапрос (user_id, type, category, total, count) повторов за [start, end)
+
+    Границы - даты ISO (None - без границы); окно обрезается по today
+    включительно. recurrence_count разворачивает правило только на окно.
+    """
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    end = min(end, tomorrow) if end else tomorrow
+    sql = f'''
+        SELECT user_id, type, category, amount * n AS total, n AS count FROM (
+            SELECT user_id, type, category, amount,
+                   recurrence_count(recurrence, start_date, end_date, ?, ?) AS n
+            FROM recurring_transactions
+            WHERE {user_condition} AND is_deleted = 0 AND start_date < ?
+            AND (end_date IS NULL OR end_date >= ?)
+        ) WHERE n > 0
+    '''
+    return sql, [start, end, *user_params, end, start or '']
+
+# Участники домохозяйства (параметр - household_id)
+HOUSEHOLD_MEMBERS = "user_id IN (SELECT user_id FROM household_members WHERE household_id = ?)"
+
+def _household_recurring(household_id, today):
+    """Повторы участников домохозяйства за текущий месяц (по сегодняшний день)"""
+    return _recurring_totals(HOUSEHOLD_MEMBERS, [household_id], *period_bounds('month', today), today)
+
 # ========== ФУНКЦИИ ДЛЯ ПЛАНОВ ==========
 
-def add_plan(user_id, title, description, plan_date, time=None, category='личные', is_shared=False):
-    """Добавить план"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO plans (user_id, title, description, date, time, category, is_shared)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, title, description, plan_date, time, category, int(is_shared)))
-    conn.commit()
-    conn.close()
-    return cursor.lastrowid
+def _plan_committed(plan_id):
+    for listener in plan_listeners:
+        listener(plan_id)
+
+@_write_operation('user', committed=lambda plan_id, *args, **kwargs: _plan_committed(plan_id))
+def add_plan(cursor, user_id, title, description, plan_date, time=None, category='личные', is_shared=False,
+             recurrence=None):
+    """Добавить план; напоминание о нем приходит во время плана
+
+    recurrence - правило повтора (recurrence.py), plan_date - дата начала.
+    """
+    cursor.execute(f'''
+        INSERT INTO plans (user_id, title, description, date, time, notification_time, category, is_shared,
+                           recurrence, household_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {HOUSEHOLD_OF_USER})
+    ''', (user_id, title, description, plan_date, time, time, category, int(is_shared), recurrence or None,
+          user_id))
+    plan_id = cursor.lastrowid
+    _update_remind_at(cursor, plan_id)
+    return plan_id
+
+def _update_remind_at(cursor, plan_id):
+    """Пересчитать момент напоминания (UTC) по дате, времени и поясу автора плана
+
+    У повторяющегося плана это ближайший будущий повтор.
+    """
+    row = cursor.execute('''
+        SELECT p.date, p.notification_time, p.recurrence, u.timezone
+        FROM plans p LEFT JOIN users u ON u.id = p.user_id
+        WHERE p.id = ?
+    ''', (plan_id,)).fetchone()
+    if row is None:
+        return
+    plan_date, clock, rule, zone_name = row
+    if not plan_date or not clock:
+        remind_at = None
+    elif rule:
+        remind_at = recurrence.next_remind_at(rule, plan_date, clock, zone_name, _utc_now())
+    else:
+        remind_at = to_utc(plan_date, clock, zone_name)
+    cursor.execute('UPDATE plans SET remind_at = ? WHERE id = ?', (remind_at, plan_id))
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime(UTC_FORMAT)
 
 def get_plan(plan_id):
     """Получить конкретный план"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM plans WHERE id = ?', (plan_id,))
-    result = cursor.fetchone()
-    conn.close()
+    with router.for_record('plans', plan_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = PLAN_ROW
+        cursor.execute(f'SELECT {_columns(PLAN_COLUMNS)}, NULL as author FROM plans WHERE id = ?', (plan_id,))
+        result = cursor.fetchone()
+    if result is None:
+        moved = router.resolve_record('plans', plan_id)
+        if moved is not None:
+            return get_plan(moved)
     return result
 
-def update_plan(plan_id, title=None, description=None, date=None, time=None, category=None, is_shared=None):
-    """Обновить план"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+@_write_operation('plans', committed=lambda _, plan_id, *args, **kwargs: _plan_committed(plan_id))
+def update_plan(cursor, plan_id, title=None, description=None, date=None, time=None, category=None, is_shared=None,
+                recurrence=None):
+    """Обновить план; при новой дате, времени или повторе напоминание придет заново
+
+    recurrence='' убирает повтор.
+    """
     updates = []
     params = []
     
@@ -299,8 +1105,15 @@ def update_plan(plan_id, title=None, description=None, date=None, time=None, cat
         params.append(date)
     
     if time is not None:
-        updates.append("time = ?")
-        params.append(time)
+        updates.append("time = ?, notification_time = ?")
+        params += [time, time]
+    
+    if recurrence is not None:
+        updates.append("recurrence = ?")
+        params.append(recurrence or None)
+    
+    if date is not None or time is not None or recurrence is not None:
+        updates.append("sent_at = NULL")
     
     if category is not None:
         updates.append("category = ?")
@@ -315,137 +1128,136 @@ def update_plan(plan_id, title=None, description=None, date=None, time=None, cat
         query = f"UPDATE plans SET {', '.join(updates)} WHERE id = ?"
         params.append(plan_id)
         cursor.execute(query, params)
-    
-    conn.commit()
-    conn.close()
+        if date is not None or time is not None or recurrence is not None:
+            _update_remind_at(cursor, plan_id)
 
-def soft_delete_plan(plan_id):
+@_write_operation('plans', committed=lambda _, plan_id: _plan_committed(plan_id))
+def soft_delete_plan(cursor, plan_id):
     """Мягкое удаление плана"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     cursor.execute('''
         UPDATE plans 
         SET is_deleted = 1, updated_at = CURRENT_TIMESTAMP 
         WHERE id = ?
     ''', (plan_id,))
-    conn.commit()
-    conn.close()
 
 def get_user_plans(user_id, target_date=None, include_shared=True):
-    """Получить планы пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    if not target_date:
-        target_date = date.today().isoformat()
-    
-    if include_shared:
-        query = '''
-            SELECT id, title, description, time, category, is_shared
-            FROM plans 
-            WHERE ((user_id = ? AND is_shared = 0) OR is_shared = 1)
-            AND date = ? 
-            AND is_deleted = 0
-            ORDER BY time NULLS FIRST, created_at
-        '''
-        cursor.execute(query, (user_id, target_date))
-    else:
-        query = '''
-            SELECT id, title, description, time, category, is_shared
-            FROM plans 
-            WHERE user_id = ? AND date = ? AND is_deleted = 0
+    """Получить планы пользователя на день (с повторами повторяющихся планов)
+
+    У повтора date - дата этого дня, а не дата начала правила.
+    """
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+    
+        if not target_date:
+            target_date = _user_today(cursor, user_id).isoformat()
+        next_day = (date.fromisoformat(target_date) + timedelta(days=1)).isoformat()
+    
+        cursor.row_factory = PLAN_ROW
+        # Свои планы и общие планы домохозяйства; повторяющиеся - по частичному
+        # индексу idx_plans_recurring, повтор в этот день проверяет recurrence_count
+        owner_condition = "(user_id = ? OR is_shared = 1)" if include_shared else "user_id = ?"
+        cursor.execute(f'''
+            SELECT {_columns(PLAN_COLUMNS)}, NULL as author
+            FROM (
+                SELECT * FROM plans
+                WHERE household_id = {HOUSEHOLD_OF_USER} AND is_deleted = 0 AND date = ? AND recurrence IS NULL
+                UNION ALL
+                SELECT * FROM plans
+                WHERE household_id = {HOUSEHOLD_OF_USER} AND is_deleted = 0 AND date <= ?
+                AND recurrence IS NOT NULL AND recurrence_count(recurrence, date, NULL, ?, ?) > 0
+            )
+            WHERE {owner_condition}
             ORDER BY time NULLS FIRST, created_at
-        '''
-        cursor.execute(query, (user_id, target_date))
+        ''', (user_id, target_date, user_id, target_date, target_date, next_day, user_id))
     
-    results = cursor.fetchall()
-    conn.close()
+        results = [plan._replace(date=target_date) if plan.recurrence else plan for plan in cursor.fetchall()]
     return results
 
-def get_shared_plans():
-    """Получить все общие планы"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT p.*, u.full_name 
-        FROM plans p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.is_shared = 1 AND p.is_deleted = 0
-        ORDER BY p.date, p.time NULLS FIRST
-    ''')
-    
-    results = cursor.fetchall()
-    conn.close()
+def get_shared_plans(household_id):
+    """Получить общие планы домохозяйства"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+    
+        cursor.row_factory = PLAN_ROW
+        cursor.execute(f'''
+            SELECT {_columns(PLAN_COLUMNS, 'p.')}, u.full_name as author
+            FROM plans p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.household_id = ? AND p.is_deleted = 0 AND p.is_shared = 1
+            ORDER BY p.date, p.time NULLS FIRST
+        ''', (household_id,))
+    
+        results = cursor.fetchall()
     return results
 
 def search_plans(user_id, search_text=None, category=None, date_from=None, date_to=None):
     """Поиск планов"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    conditions = ["(user_id = ? OR is_shared = 1)", "is_deleted = 0"]
-    params = [user_id]
+    from_clause, conditions, params, rank_order = _text_search(
+        'plans_fts', 'plans', search_text, ('title', 'description')
+    )
     
-    if search_text:
-        conditions.append("(title LIKE ? OR description LIKE ?)")
-        params.extend([f'%{search_text}%', f'%{search_text}%'])
+    conditions += [f"t.household_id = {HOUSEHOLD_OF_USER}", "(t.user_id = ? OR t.is_shared = 1)",
+                   "t.is_deleted = 0"]
+    params += [user_id, user_id]
     
     if category:
-        conditions.append("category = ?")
+        conditions.append("t.category = ?")
         params.append(category)
     
     if date_from:
-        conditions.append("date >= ?")
+        conditions.append("t.date >= ?")
         params.append(date_from)
     
     if date_to:
-        conditions.append("date <= ?")
+        conditions.append("t.date <= ?")
         params.append(date_to)
     
     where_clause = " AND ".join(conditions)
-    
-    cursor.execute(f'''
-        SELECT id, title, description, date, time, category, is_shared
-        FROM plans 
-        WHERE {where_clause}
-        ORDER BY date DESC, time NULLS FIRST
-        LIMIT 50
-    ''', params)
-    
-    results = cursor.fetchall()
-    conn.close()
+
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = PLAN_ROW
+        cursor.execute(f'''
+            SELECT {_columns(PLAN_COLUMNS, 't.')}, NULL as author
+            FROM {from_clause}
+            WHERE {where_clause}
+            ORDER BY {rank_order}t.date DESC, t.time NULLS FIRST
+            LIMIT 50
+        ''', params)
+    
+        results = cursor.fetchall()
     return results
 
 # ========== ФУНКЦИИ ДЛЯ ПОКУПОК ==========
 
-def add_planned_purchase(user_id, item_name, estimated_cost, priority, target_date=None, notes=None):
+@_write_operation('user')
+def add_planned_purchase(cursor, user_id, item_name, estimated_cost, priority, target_date=None, notes=None):
     """Добавить планируемую покупку"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO planned_purchases (user_id, item_name, estimated_cost, priority, target_date, notes)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (user_id, item_name, estimated_cost, priority, target_date, notes))
-    conn.commit()
-    conn.close()
+    cursor.execute(f'''
+        INSERT INTO planned_purchases (user_id, item_name, estimated_cost, priority, target_date, notes,
+                                       household_id)
+        VALUES (?, ?, ?, ?, ?, ?, {HOUSEHOLD_OF_USER})
+    ''', (user_id, item_name, estimated_cost, priority, target_date, notes, user_id))
     return cursor.lastrowid
 
 def get_purchase(purchase_id):
     """Получить конкретную покупку"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM planned_purchases WHERE id = ?', (purchase_id,))
-    result = cursor.fetchone()
-    conn.close()
+    with router.for_record('planned_purchases', purchase_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = PURCHASE_ROW
+        cursor.execute(f'SELECT {_columns(PURCHASE_COLUMNS)} FROM planned_purchases WHERE id = ?',
+                       (purchase_id,))
+        result = cursor.fetchone()
+    if result is None:
+        moved = router.resolve_record('planned_purchases', purchase_id)
+        if moved is not None:
+            return get_purchase(moved)
     return result
 
-def update_purchase(purchase_id, item_name=None, estimated_cost=None, priority=None, 
-                   target_date=None, notes=None, status=None):
+@_write_operation('planned_purchases')
+def update_purchase(cursor, purchase_id, item_name=None, estimated_cost=None, priority=None, 
+                    target_date=None, notes=None, status=None):
     """Обновить покупку"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     updates = []
     params = []
     
@@ -478,307 +1290,462 @@ def update_purchase(purchase_id, item_name=None, estimated_cost=None, priority=N
         query = f"UPDATE planned_purchases SET {', '.join(updates)} WHERE id = ?"
         params.append(purchase_id)
         cursor.execute(query, params)
-    
-    conn.commit()
-    conn.close()
 
-def soft_delete_purchase(purchase_id):
+@_write_operation('planned_purchases')
+def soft_delete_purchase(cursor, purchase_id):
     """Мягкое удаление покупки"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     cursor.execute('''
         UPDATE planned_purchases 
         SET is_deleted = 1, updated_at = CURRENT_TIMESTAMP 
         WHERE id = ?
     ''', (purchase_id,))
-    conn.commit()
-    conn.close()
 
 def get_user_purchases(user_id, status='planned'):
     """Получить покупки пользователя"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, item_name, estimated_cost, priority, target_date, notes, status
-        FROM planned_purchases 
-        WHERE user_id = ? AND status = ? AND is_deleted = 0
-        ORDER BY 
-            CASE priority 
-                WHEN 'high' THEN 1
-                WHEN 'medium' THEN 2
-                WHEN 'low' THEN 3
-            END,
-            target_date NULLS LAST
-    ''', (user_id, status))
-    
-    results = cursor.fetchall()
-    conn.close()
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+    
+        cursor.row_factory = PURCHASE_ROW
+        cursor.execute(f'''
+            SELECT {_columns(PURCHASE_COLUMNS)}
+            FROM planned_purchases 
+            WHERE household_id = {HOUSEHOLD_OF_USER} AND user_id = ? AND is_deleted = 0 AND status = ?
+            ORDER BY 
+                CASE priority 
+                    WHEN 'high' THEN 1
+                    WHEN 'medium' THEN 2
+                    WHEN 'low' THEN 3
+                END,
+                target_date NULLS LAST
+        ''', (user_id, user_id, status))
+    
+        results = cursor.fetchall()
     return results
 
 def search_purchases(user_id, search_text=None, priority=None, min_cost=None, max_cost=None):
     """Поиск покупок"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    conditions = ["user_id = ?", "is_deleted = 0"]
-    params = [user_id]
+    from_clause, conditions, params, rank_order = _text_search(
+        'purchases_fts', 'planned_purchases', search_text, ('item_name', 'notes')
+    )
     
-    if search_text:
-        conditions.append("(item_name LIKE ? OR notes LIKE ?)")
-        params.extend([f'%{search_text}%', f'%{search_text}%'])
+    conditions += [f"t.household_id = {HOUSEHOLD_OF_USER}", "t.user_id = ?", "t.is_deleted = 0"]
+    params += [user_id, user_id]
     
     if priority:
-        conditions.append("priority = ?")
+        conditions.append("t.priority = ?")
         params.append(priority)
     
     if min_cost is not None:
-        conditions.append("estimated_cost >= ?")
+        conditions.append("t.estimated_cost >= ?")
         params.append(min_cost)
     
     if max_cost is not None:
-        conditions.append("estimated_cost <= ?")
+        conditions.append("t.estimated_cost <= ?")
         params.append(max_cost)
     
     where_clause = " AND ".join(conditions)
-    
-    cursor.execute(f'''
-        SELECT id, item_name, estimated_cost, priority, target_date, notes, status
-        FROM planned_purchases 
-        WHERE {where_clause}
-        ORDER BY 
-            CASE priority 
-                WHEN 'high' THEN 1
-                WHEN 'medium' THEN 2
-                WHEN 'low' THEN 3
-            END,
-            target_date NULLS LAST
-        LIMIT 50
-    ''', params)
-    
-    results = cursor.fetchall()
-    conn.close()
+
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = PURCHASE_ROW
+        cursor.execute(f'''
+            SELECT {_columns(PURCHASE_COLUMNS, 't.')}
+            FROM {from_clause}
+            WHERE {where_clause}
+            ORDER BY {rank_order}
+                CASE t.priority 
+                    WHEN 'high' THEN 1
+                    WHEN 'medium' THEN 2
+                    WHEN 'low' THEN 3
+                END,
+                t.target_date NULLS LAST
+            LIMIT 50
+        ''', params)
+    
+        results = cursor.fetchall()
     return results
 
 # ========== СТАТИСТИКА ==========
 
+def _rollup_source(period, today=None):
+    """Таблица агрегатов и условия для периода
+
+    Периоды из целых месяцев (и 'all') читаются из monthly_totals,
+    остальные - из daily_totals.
+    """
+    start, end = period_bounds(period, today)
+
+    whole_months = all(bound is None or bound.endswith('-01') for bound in (start, end))
+    if whole_months:
+        table, column, length = 'monthly_totals', 'month', 7
+    else:
+        table, column, length = 'daily_totals', 'day', 10
+
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(start[:length])
+    if end is not None:
+        conditions.append(f"{column} < ?")
+        params.append(end[:length])
+    return table, conditions, params
+
 def get_period_statistics(user_id, period='month'):
-    """Получить статистику за период"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    if period == 'today':
-        cursor.execute('''
-            SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
-                COUNT(*) as count
-            FROM transactions 
-            WHERE user_id = ? AND date = DATE('now') AND is_deleted = 0
-        ''', (user_id,))
-    elif period == 'week':
-        cursor.execute('''
-            SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
-                COUNT(*) as count
-            FROM transactions 
-            WHERE user_id = ? AND date >= DATE('now', '-7 days') AND is_deleted = 0
-        ''', (user_id,))
-    elif period == 'month':
-        cursor.execute('''
-            SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
-                COUNT(*) as count
-            FROM transactions 
-            WHERE user_id = ? AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now') AND is_deleted = 0
-        ''', (user_id,))
-    elif period == 'all':
-        cursor.execute('''
+    """Получить статистику за период (в часовом поясе пользователя, с повторяющимися транзакциями)"""
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _user_today(cursor, user_id)
+        table, period_conds, period_params = _rollup_source(period, today)
+        conditions = ["user_id = ?"] + period_conds
+        params = [user_id] + period_params
+        recurring, recurring_params = _recurring_totals("user_id = ?", [user_id], *period_bounds(period, today), today)
+
+        cursor.execute(f'''
             SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
-                COUNT(*) as count
-            FROM transactions 
-            WHERE user_id = ? AND is_deleted = 0
-        ''', (user_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
+                SUM(CASE WHEN type = 'income' THEN total ELSE 0 END) as total_income,
+                SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END) as total_expense,
+                COALESCE(SUM(count), 0) as count
+            FROM (
+                SELECT type, total, count FROM {table} WHERE {" AND ".join(conditions)}
+                UNION ALL
+                SELECT type, total, count FROM ({recurring})
+            )
+        ''', params + recurring_params)
+    
+        result = cursor.fetchone()
     return result
 
-def get_common_categories_statistics():
-    """Статистика по общим категориям"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            category,
-            SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
-            COUNT(*) as transaction_count
-        FROM transactions 
-        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-        AND user_id IN (?, ?) AND is_deleted = 0
-        GROUP BY category
-        ORDER BY total_expense DESC
-        LIMIT 10
-    ''', (MY_USER_ID, GIRLFRIEND_USER_ID))
-    
-    results = cursor.fetchall()
-    conn.close()
+def get_common_categories_statistics(household_id):
+    """Статистика по общим категориям домохозяйства"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _household_today(cursor, household_id)
+        month = period_bounds('month', today)[0][:7]
+        recurring, recurring_params = _household_recurring(household_id, today)
+    
+        cursor.execute(f'''
+            SELECT 
+                category,
+                SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END) as total_expense,
+                SUM(count) as transaction_count
+            FROM (
+                SELECT type, category, total, count FROM monthly_totals 
+                WHERE {HOUSEHOLD_MEMBERS} AND month = ?
+                UNION ALL
+                SELECT type, category, total, count FROM ({recurring})
+            )
+            GROUP BY category
+            ORDER BY total_expense DESC
+            LIMIT 10
+        ''', [household_id, month] + recurring_params)
+    
+        results = cursor.fetchall()
     return results
 
-def get_daily_combined_expenses(target_date=None):
-    """Получить ежедневные расходы обоих пользователей"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_daily_combined_expenses(household_id, target_date=None):
+    """Получить расходы всех участников домохозяйства за день"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
     
-    if not target_date:
-        target_date = date.today().isoformat()
+        if not target_date:
+            target_date = _household_today(cursor, household_id).isoformat()
     
-    cursor.execute('''
-        SELECT 
-            u.full_name,
-            t.category,
-            t.amount,
-            t.description,
-            t.created_at
-        FROM transactions t
-        JOIN users u ON t.user_id = u.id
-        WHERE t.date = ? 
-        AND t.type = 'expense'
-        AND t.user_id IN (?, ?)
-        AND t.is_deleted = 0
-        ORDER BY u.full_name, t.created_at DESC
-    ''', (target_date, MY_USER_ID, GIRLFRIEND_USER_ID))
-    
-    results = cursor.fetchall()
-    conn.close()
+        cursor.execute('''
+            SELECT 
+                u.full_name,
+                t.category,
+                t.amount,
+                t.description,
+                t.created_at
+            FROM transactions t
+            JOIN users u ON t.user_id = u.id
+            WHERE t.household_id = ?
+            AND t.is_deleted = 0
+            AND t.date = ? 
+            AND t.type = 'expense'
+            ORDER BY u.full_name, t.created_at DESC
+        ''', (household_id, target_date))
+    
+        results = cursor.fetchall()
     return results
 
-def get_monthly_comparison():
-    """Сравнение месячных расходов обоих пользователей"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            u.full_name,
-            SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE 0 END) as total_income,
-            SUM(CASE WHEN t.type = 'expense' THEN t.amount ELSE 0 END) as total_expense,
-            (SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE 0 END) - 
-             SUM(CASE WHEN t.type = 'expense' THEN t.amount ELSE 0 END)) as balance
-        FROM transactions t
-        JOIN users u ON t.user_id = u.id
-        WHERE strftime('%Y-%m', t.date) = strftime('%Y-%m', 'now')
-        AND t.user_id IN (?, ?) AND t.is_deleted = 0
-        GROUP BY u.full_name
-    ''', (MY_USER_ID, GIRLFRIEND_USER_ID))
-    
-    results = cursor.fetchall()
-    conn.close()
+def get_monthly_comparison(household_id):
+    """Сравнение месячных расходов участников домохозяйства"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _household_today(cursor, household_id)
+        month = period_bounds('month', today)[0][:7]
+        recurring, recurring_params = _household_recurring(household_id, today)
+    
+        cursor.execute(f'''
+            SELECT 
+                u.full_name,
+                SUM(CASE WHEN m.type = 'income' THEN m.total ELSE 0 END) as total_income,
+                SUM(CASE WHEN m.type = 'expense' THEN m.total ELSE 0 END) as total_expense,
+                (SUM(CASE WHEN m.type = 'income' THEN m.total ELSE 0 END) - 
+                 SUM(CASE WHEN m.type = 'expense' THEN m.total ELSE 0 END)) as balance
+            FROM (
+                SELECT user_id, type, total FROM monthly_totals WHERE {HOUSEHOLD_MEMBERS} AND month = ?
+                UNION ALL
+                SELECT user_id, type, total FROM ({recurring})
+            ) m
+            JOIN users u ON m.user_id = u.id
+            GROUP BY u.full_name
+        ''', [household_id, month] + recurring_params)
+    
+        results = cursor.fetchall()
     return results
 
-def get_shared_expenses_by_category():
-    """Получить расходы по категориям для обоих пользователей"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT 
-            t.category,
-            SUM(CASE WHEN t.user_id = ? THEN t.amount ELSE 0 END) as user1_expenses,
-            SUM(CASE WHEN t.user_id = ? THEN t.amount ELSE 0 END) as user2_expenses,
-            SUM(t.amount) as total
-        FROM transactions t
-        WHERE strftime('%Y-%m', t.date) = strftime('%Y-%m', 'now')
-        AND t.type = 'expense' AND t.is_deleted = 0
-        GROUP BY t.category
-        ORDER BY total DESC
-    ''', (MY_USER_ID, GIRLFRIEND_USER_ID))
-    
-    results = cursor.fetchall()
-    conn.close()
+def get_shared_expenses_by_category(household_id):
+    """Получить расходы по категориям для каждого участника домохозяйства
+
+    Строки (category, full_name, expenses) по убыванию общей суммы категории.
+    """
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _household_today(cursor, household_id)
+        month = period_bounds('month', today)[0][:7]
+        recurring, recurring_params = _household_recurring(household_id, today)
+    
+        cursor.execute(f'''
+            SELECT 
+                m.category,
+                u.full_name,
+                SUM(m.total) as expenses
+            FROM (
+                SELECT user_id, type, category, total FROM monthly_totals WHERE {HOUSEHOLD_MEMBERS} AND month = ?
+                UNION ALL
+                SELECT user_id, type, category, total FROM ({recurring})
+            ) m
+            JOIN users u ON m.user_id = u.id
+            WHERE m.type = 'expense'
+            GROUP BY m.category, m.user_id
+            ORDER BY SUM(SUM(m.total)) OVER (PARTITION BY m.category) DESC, m.category, expenses DESC
+        ''', [household_id, month] + recurring_params)
+    
+        results = cursor.fetchall()
     return results
 
-def get_combined_statistics(period='month'):
-    """Получить объединенную статистику"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_combined_statistics(household_id, period='month'):
+    """Получить объединенную статистику домохозяйства"""
+    if period != 'month':
+        return []
+
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        today = _household_today(cursor, household_id)
+        month = period_bounds(period, today)[0][:7]
+        recurring, recurring_params = _household_recurring(household_id, today)
     
-    if period == 'month':
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
-                SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) as total_expense,
+                SUM(CASE WHEN type = 'income' THEN total ELSE 0 END) as total_income,
+                SUM(CASE WHEN type = 'expense' THEN total ELSE 0 END) as total_expense,
                 user_id
-            FROM transactions 
-            WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now') AND is_deleted = 0
+            FROM (
+                SELECT user_id, type, total FROM monthly_totals WHERE {HOUSEHOLD_MEMBERS} AND month = ?
+                UNION ALL
+                SELECT user_id, type, total FROM ({recurring})
+            )
             GROUP BY user_id
-        ''')
+        ''', [household_id, month] + recurring_params)
     
-    results = cursor.fetchall()
-    conn.close()
+        results = cursor.fetchall()
     return results
 
 def get_recent_transactions(user_id, limit=10):
     """Получить последние транзакции"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT type, amount, category, description, 
-               strftime('%Y-%m-%d %H:%M', created_at) as datetime
-        FROM transactions 
-        WHERE user_id = ? AND is_deleted = 0
-        ORDER BY created_at DESC
-        LIMIT ?
-    ''', (user_id, limit))
-    
-    results = cursor.fetchall()
-    conn.close()
+    with router.for_user(user_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = TRANSACTION_ROW
+        cursor.execute(f'''
+            SELECT {_columns(TRANSACTION_COLUMNS)}
+            FROM transactions 
+            WHERE user_id = ? AND is_deleted = 0
+            ORDER BY date DESC, created_at DESC
+            LIMIT ?
+        ''', (user_id, limit))
+    
+        results = cursor.fetchall()
     return results
 
-def get_weekly_summary():
-    """Еженедельная сводка"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def get_weekly_summary(household_id):
+    """Еженедельная сводка домохозяйства"""
+    with router.for_household(household_id).reader() as conn:
+        cursor = conn.cursor()
+        since = (_household_today(cursor, household_id) - timedelta(days=30)).isoformat()
     
-    cursor.execute('''
-        SELECT 
-            u.full_name,
-            DATE(t.date, 'weekday 0', '-6 days') as week_start,
-            SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE 0 END) as weekly_income,
-            SUM(CASE WHEN t.type = 'expense' THEN t.amount ELSE 0 END) as weekly_expense
-        FROM transactions t
-        JOIN users u ON t.user_id = u.id
-        WHERE t.date >= DATE('now', '-30 days')
-        AND u.id IN (?, ?) AND t.is_deleted = 0
-        GROUP BY u.full_name, week_start
-        ORDER BY week_start DESC
-        LIMIT 4
-    ''', (MY_USER_ID, GIRLFRIEND_USER_ID))
-    
-    results = cursor.fetchall()
-    conn.close()
+        cursor.execute('''
+            SELECT 
+                u.full_name,
+                DATE(d.day, 'weekday 0', '-6 days') as week_start,
+                SUM(CASE WHEN d.type = 'income' THEN d.total ELSE 0 END) as weekly_income,
+                SUM(CASE WHEN d.type = 'expense' THEN d.total ELSE 0 END) as weekly_expense
+            FROM daily_totals d
+            JOIN users u ON d.user_id = u.id
+            WHERE d.user_id IN (SELECT user_id FROM household_members WHERE household_id = ?)
+            AND d.day >= ?
+            GROUP BY u.full_name, week_start
+            ORDER BY week_start DESC
+            LIMIT 4
+        ''', (household_id, since))
+    
+        results = cursor.fetchall()
     return results
 
-def get_today_reminders():
-    """Получить сегодняшние напоминания"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+# Неотправленные напоминания (условия частичного индекса idx_plans_remind_at)
+PENDING_REMINDER = ("p.notification_enabled = 1 AND p.is_deleted = 0 "
+                    "AND p.remind_at IS NOT NULL AND p.sent_at IS NULL")
+REMINDER_COLUMNS = ("p.id, p.user_id, p.title, p.description, p.date, p.time, p.notification_time, u.username, "
+                    "p.remind_at, p.recurrence")
+
+def get_pending_reminders(since, until):
+    """Неотправленные напоминания с моментом в [since, until) по UTC (со всех шардов)
+
+    since, until - строки 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (periods.UTC_FORMAT).
+    """
+    return [reminder for reminders in _fan_out(lambda pool: _pending_reminders(pool, since, until))
+            for reminder in reminders]
+
+def _pending_reminders(pool, since, until):
+    """Неотправленные напоминания одного шарда: один проход диапазона индекса remind_at"""
+    with pool.reader() as conn:
+        cursor = conn.cursor()
+    
+        cursor.row_factory = REMINDER_ROW
+        cursor.execute(f'''
+            SELECT {REMINDER_COLUMNS}
+            FROM plans p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.remind_at >= ? AND p.remind_at < ? AND {PENDING_REMINDER}
+            ORDER BY p.remind_at
+        ''', (since, until))
+    
+        results = cursor.fetchall()
+    return results
+
+def get_pending_reminder(plan_id):
+    """Напоминание о плане, если оно включено и еще не отправлено, иначе None"""
+    with router.for_record('plans', plan_id).reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = REMINDER_ROW
+        cursor.execute(f'''
+            SELECT {REMINDER_COLUMNS}
+            FROM plans p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.id = ? AND {PENDING_REMINDER}
+        ''', (plan_id,))
+        result = cursor.fetchone()
+    if result is None:
+        moved = router.resolve_record('plans', plan_id)
+        if moved is not None:
+            return get_pending_reminder(moved)
+    return result
+
+@_write_operation('plans')
+def mark_reminder_sent(cursor, plan_id, remind_at):
+    """Отметить напоминание отправленным; True - отметка сделана этим вызовом
+
+    Отметка ставится до отправки и только если напоминание еще ждет
+    отправки в момент remind_at, поэтому одно напоминание не уходит
+    дважды (даже при двух процессах бота). У повторяющегося плана
+    remind_at переходит на следующий будущий повтор (пропущенные
+    повторы не догоняются), sent_at ставится, когда повторы кончились.
+    """
+    row = cursor.execute('''
+        SELECT p.date, p.notification_time, p.recurrence, u.timezone
+        FROM plans p LEFT JOIN users u ON u.id = p.user_id
+        WHERE p.id = ?
+    ''', (plan_id,)).fetchone()
+    next_remind_at = None
+    if row is not None and row[2]:
+        plan_date, clock, rule, zone_name = row
+        next_remind_at = recurrence.next_remind_at(rule, plan_date, clock, zone_name, max(remind_at, _utc_now()))
+    
+    if next_remind_at is not None:
+        cursor.execute(f'''
+            UPDATE plans AS p SET remind_at = ?
+            WHERE p.id = ? AND p.remind_at = ? AND {PENDING_REMINDER}
+        ''', (next_remind_at, plan_id, remind_at))
+    else:
+        cursor.execute(f'''
+            UPDATE plans AS p SET sent_at = CURRENT_TIMESTAMP
+            WHERE p.id = ? AND p.remind_at = ? AND {PENDING_REMINDER}
+        ''', (plan_id, remind_at))
+    return cursor.rowcount == 1
+
+@_write_operation('all')
+def advance_recurring_reminders(cursor, before):
+    """Перевести напоминания повторяющихся планов с моментом раньше before на следующий повтор
+
+    Для запуска после долгого простоя: такие напоминания уже не
+    отправляются, а без сдвига план больше не напоминал бы о себе.
+    Возвращает число сдвинутых напоминаний (на шард).
+    """
+    cursor.execute(f'''
+        SELECT p.id, p.remind_at, p.date, p.notification_time, p.recurrence, u.timezone
+        FROM plans p LEFT JOIN users u ON u.id = p.user_id
+        WHERE p.remind_at < ? AND p.recurrence IS NOT NULL AND {PENDING_REMINDER}
+    ''', (before,))
+    rows = cursor.fetchall()
+    
+    for plan_id, remind_at, plan_date, clock, rule, zone_name in rows:
+        next_remind_at = recurrence.next_remind_at(rule, plan_date, clock, zone_name, before)
+        if next_remind_at is None:
+            cursor.execute('UPDATE plans SET sent_at = CURRENT_TIMESTAMP WHERE id = ?', (plan_id,))
+        else:
+            cursor.execute('UPDATE plans SET remind_at = ? WHERE id = ?', (next_remind_at, plan_id))
+    return len(rows)
+
+# ========== НЕДОСТАВЛЕННЫЕ СООБЩЕНИЯ ==========
+
+@_write_operation('user')
+def add_dead_letter(cursor, user_id, kind, text, error, attempts):
+    """Сохранить сообщение рассылки, которое не удалось доставить пользователю"""
     cursor.execute('''
-        SELECT p.*, u.username 
-        FROM plans p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.date = DATE('now') 
-        AND p.notification_enabled = 1
-        AND p.is_deleted = 0
-        AND p.notification_time IS NOT NULL
-    ''')
-    
-    results = cursor.fetchall()
-    conn.close()
-    return results
\ No newline at end of file
+        INSERT INTO delivery_dead_letters (user_id, kind, text, error, attempts)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, kind, text, error, attempts))
+    return cursor.lastrowid
+
+def get_dead_letters(limit=10):
+    """Последние недоставленные сообщения (со всех шардов): (user_id, kind, error, attempts, created_at)"""
+    def recent(pool):
+        with pool.reader() as conn:
+            return conn.execute('''
+                SELECT user_id, kind, error, attempts, created_at FROM delivery_dead_letters
+                ORDER BY id DESC LIMIT ?
+            ''', (limit,)).fetchall()
+
+    rows = [row for rows in _fan_out(recent) for row in rows]
+    return sorted(rows, key=lambda row: row[4], reverse=True)[:limit]
+
+# ========== ОБСЛУЖИВАНИЕ АГРЕГАТОВ ==========
+
+@_write_operation('all')
+def rebuild_rollups(cursor):
+    """Пересчитать агрегаты статистики из транзакций"""
+    rollups.rebuild(cursor)
+
+def verify_rollups():
+    """Проверить агрегаты статистики по транзакциям (во всех шардах)"""
+    def verify(pool):
+        with pool.reader() as conn:
+            return rollups.verify(conn.cursor())
+    return [mismatch for mismatches in _fan_out(verify) for mismatch in mismatches]
+
+# ========== ШАРДЫ ==========
+
+def get_shard_report():
+    """Сводка по шардам: (шард, файл, домохозяйств, пользователей, транзакций, МБ)"""
+    return shards.report(router)
+
+# ========== ИНСТРУМЕНТАЦИЯ ==========
+
+# Функции чтения оборачиваются счетчиками query_stats здесь,
+# функции записи - в _write_operation
+for _name, _func in list(globals().items()):
+    if (inspect.isfunction(_func) and _func.__module__ == __name__ and not _name.startswith('_')
+            and not hasattr(_func, 'submit') and _name != 'close_db'):
+        globals()[_name] = query_stats.instrument(_func, explain=_explain)
@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from shards import HouseholdMovedError
+from config import DB_MAX_READERS, DB_MAX_PENDING, DB_QUERY_TIMEOUT
+
+# ========== АСИНХРОННЫЙ ДОСТУП К БАЗЕ ДАННЫХ ==========
+#
+# Синхронные функции database.py выполняются в ограниченном пуле потоков,
+# чтобы обработчики aiogram только ожидали результат и не блокировали
+# цикл событий. Число одновременно ожидающих запросов ограничено
+# (backpressure), а каждый запрос имеет таймаут, по истечении которого
+# запрос отменяется или прерывается (см. run).
+
+# Потоки пула закреплены за читающими подключениями шардов database.router;
+# запись выполняет отдельный поток-писатель пула шарда
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_READERS, thread_name_prefix='db')
+_pending = None
+
+
+class DatabaseTimeoutError(Exception):
+    """Запрос к базе данных не уложился в таймаут
+
+    may_complete - запись уже выполнялась, когда истек таймаут, и еще
+    может зафиксироваться; False - работа отменена или чтение прервано.
+    """
+
+    def __init__(self, message, may_complete=False):
+        super().__init__(message)
+        self.may_complete = may_complete
+
+
+def _get_pending_semaphore():
+    """Семафор очереди запросов (создается в работающем цикле событий)"""
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(DB_MAX_PENDING)
+    return _pending
+
+
+async def _read(func, args, kwargs, timeout):
+    """Чтение в пуле потоков; по таймауту запрос снимается с очереди или прерывается"""
+    # Поток, выполняющий именно этот вызов; None - вызов не начат или закончился
+    owner = [None]
+    owner_lock = threading.Lock()
+
+    def call():
+        with owner_lock:
+            owner[0] = threading.get_ident()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with owner_lock:
+                owner[0] = None
+
+    future = _executor.submit(call)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        if not future.cancel():
+            # Пока блокировка взята, поток не может закончить этот вызов и взять
+            # чужой: interrupt() останавливает только его оператор SQLite
+            with owner_lock:
+                if owner[0] is not None:
+                    database.router.interrupt(owner[0])
+        raise DatabaseTimeoutError(f"{func.__name__}: превышен таймаут {timeout} с, запрос прерван") from None
+
+
+def _cancel_routed_write(routing):
+    """Отменить запись, поставленную в очередь после истечения таймаута"""
+    if routing.exception() is None:
+        routing.result().cancel()
+
+
+async def _write(func, args, kwargs, timeout):
+    """Запись через очередь писателя; по таймауту еще не начатая запись отменяется"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        try:
+            return await _write_once(func, args, kwargs, timeout, deadline)
+        except HouseholdMovedError:
+            # Домохозяйство начали переносить после выбора шарда - выбираем заново
+            continue
+
+
+async def _write_once(func, args, kwargs, timeout, deadline):
+    loop = asyncio.get_running_loop()
+    if database.router.single:
+        write = func.submit(*args, **kwargs)
+    else:
+        # Выбор шарда читает справочник, поэтому выполняется в пуле потоков
+        routing = _executor.submit(func.submit, *args, **kwargs)
+        try:
+            write = await asyncio.wait_for(asyncio.wrap_future(routing), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            if not routing.cancel():
+                # Шард уже выбирается: запись отменяется, как только попадет в очередь
+                routing.add_done_callback(_cancel_routed_write)
+            raise DatabaseTimeoutError(f"{func.__name__}: превышен таймаут {timeout} с, запись отменена") from None
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(write), max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        # Писатель пропускает отмененные Future; начатую запись отменить нельзя
+        if write.cancel():
+            raise DatabaseTimeoutError(f"{func.__name__}: превышен таймаут {timeout} с, запись отменена") from None
+        raise DatabaseTimeoutError(f"{func.__name__}: превышен таймаут {timeout} с, "
+                                   f"запись еще выполняется и может завершиться", may_complete=True) from None
+
+
+async def run(func, *args, timeout=DB_QUERY_TIMEOUT, **kwargs):
+    """Выполнить синхронную функцию БД в пуле потоков
+
+    Операции записи (database._write_operation) не занимают поток пула:
+    они сразу ставятся в очередь писателя, и ожидается их Future.
+    При нескольких шардах выбор шарда читает справочник, поэтому
+    он выполняется в пуле потоков.
+
+    По таймауту работа останавливается, а не только перестает ожидаться:
+    запрос, еще стоящий в очереди, отменяется, выполняемое чтение
+    прерывается через sqlite3.Connection.interrupt(). Запись, которую
+    писатель уже начал, прервать нельзя - она может зафиксироваться,
+    и DatabaseTimeoutError.may_complete тогда True. Чтение на нескольких
+    шардах сразу (router.fan_out) идет в потоках роутера и не прерывается.
+    """
+    async with _get_pending_semaphore():
+        if getattr(func, 'submit', None) is not None:
+            return await _write(func, args, kwargs, timeout)
+        return await _read(func, args, kwargs, timeout)
+
+
+def _make_async(func):
+    """Асинхронная обертка над функцией database.py"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    """Дождаться завершения запросов и остановить пул потоков"""
+    _executor.shutdown(wait=True)
+
+
+# Асинхронные версии всех публичных функций database.py под теми же именами
+__all__ = ['run', 'shutdown', 'DatabaseTimeoutError']
+for _name, _func in inspect.getmembers(database, inspect.isfunction):
+    if _name.startswith('_') or _func.__module__ != database.__name__:
+        continue
+    globals()[_name] = _make_async(_func)
+    __all__.append(_name)
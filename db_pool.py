@@ -0,0 +1,223 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# ========== ПУЛ ПОДКЛЮЧЕНИЙ К SQLITE ==========
+
+# Прагмы, которые применяются один раз при открытии каждого подключения
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'WAL'),  # читатели не блокируются писателем
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),   # ~16 МБ кэша страниц на подключение
+    ('temp_store', 'MEMORY'),
+)
+
+# Уровни надежности записи: NORMAL в WAL может потерять последние
+# транзакции при сбое питания, FULL делает fsync на каждый commit
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+class ConnectionPool:
+    """Пул постоянных подключений: один писатель и до N читателей
+
+    Писатель - отдельный поток с собственным подключением. Операции записи
+    попадают в очередь; всё, что пришло в пределах commit_window секунд
+    (но не больше max_batch операций), выполняется в одной транзакции
+    с одним commit (групповая фиксация). Каждая операция изолирована
+    точкой сохранения, поэтому ошибка в одной не откатывает остальные.
+
+    Читатели привязаны к потоку: каждый поток держит своё подключение
+    и переиспользует его, одновременно читать могут не более max_readers потоков.
+
+    trace_callback, если задан, устанавливается на каждое подключение
+    (sqlite3.Connection.set_trace_callback) и получает текст выполняемого SQL.
+    functions - функции SQL (имя, число аргументов, функция Python),
+    которые регистрируются на каждом подключении.
+    """
+
+    def __init__(self, db_path, max_readers=4, pragmas=DEFAULT_PRAGMAS,
+                 synchronous='NORMAL', commit_window=0.002, max_batch=256, trace_callback=None, functions=()):
+        if synchronous.upper() not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Неизвестный уровень synchronous: {synchronous}")
+
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self.pragmas = tuple(pragmas) + (('synchronous', synchronous.upper()),)
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.trace_callback = trace_callback
+        self.functions = tuple(functions)
+
+        self._write_queue = queue.Queue()
+        self._writer_thread = None
+        self._writer_start_lock = threading.Lock()
+        self._readers_slots = threading.BoundedSemaphore(max_readers)
+        self._local = threading.local()
+        self._active = {}  # поток -> подключение, пока поток внутри reader()
+        self._all_connections = []
+        self._registry_lock = threading.Lock()
+        self._closed = False
+
+    def _open(self, isolation_level=''):
+        """Открыть подключение и применить прагмы"""
+        if self._closed:
+            raise RuntimeError("Пул подключений закрыт")
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=isolation_level)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.trace_callback is not None:
+            conn.set_trace_callback(self.trace_callback)
+        for name, arity, function in self.functions:
+            conn.create_function(name, arity, function, deterministic=True)
+        with self._registry_lock:
+            self._all_connections.append(conn)
+        return conn
+
+    # ---------- Запись ----------
+
+    def submit_write(self, operation):
+        """Поставить операцию записи в очередь, вернуть Future с ее результатом
+
+        operation(cursor) выполняется в потоке-писателе; Future завершается
+        только после commit транзакции, в которую попала операция.
+        """
+        if self._closed:
+            raise RuntimeError("Пул подключений закрыт")
+        self._ensure_writer()
+        future = Future()
+        self._write_queue.put((operation, future))
+        return future
+
+    def write(self, operation):
+        """Выполнить операцию записи и дождаться commit"""
+        return self.submit_write(operation).result()
+
+    def _ensure_writer(self):
+        """Запустить поток-писатель при первой записи"""
+        if self._writer_thread is not None:
+            return
+        with self._writer_start_lock:
+            if self._writer_thread is None:
+                conn = self._open(isolation_level=None)
+                self._writer_thread = threading.Thread(
+                    target=self._writer_loop, args=(conn,), name='db-writer', daemon=True
+                )
+                self._writer_thread.start()
+
+    def _writer_loop(self, conn):
+        """Цикл потока-писателя: собрать пачку операций и зафиксировать ее"""
+        stopping = False
+        while not stopping:
+            item = self._write_queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.commit_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._write_queue.get(timeout=timeout) if timeout > 0 else self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        """Выполнить пачку операций в одной транзакции"""
+        outcomes = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute('SAVEPOINT operation')
+                try:
+                    result = operation(cursor)
+                except BaseException as e:
+                    cursor.execute('ROLLBACK TO operation')
+                    cursor.execute('RELEASE operation')
+                    outcomes.append((future, None, e))
+                else:
+                    cursor.execute('RELEASE operation')
+                    outcomes.append((future, result, None))
+            cursor.execute('COMMIT')
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for operation, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # ---------- Чтение ----------
+
+    @contextmanager
+    def reader(self):
+        """Подключение для чтения, закреплённое за текущим потоком"""
+        conn = getattr(self._local, 'conn', None)
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            # Вложенное чтение в том же потоке - слот уже занят
+            self._local.depth = depth + 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        with self._readers_slots:
+            if conn is None:
+                conn = self._open()
+                self._local.conn = conn
+            self._local.depth = 1
+            thread_id = threading.get_ident()
+            self._active[thread_id] = conn
+            try:
+                yield conn
+            finally:
+                self._active.pop(thread_id, None)
+                self._local.depth = 0
+
+    def interrupt(self, thread_id):
+        """Прервать чтение, которое сейчас выполняет поток thread_id
+
+        Выполняемый запрос завершается sqlite3.OperationalError('interrupted'),
+        поток освобождает слот читателя. Если поток не читает, ничего не происходит.
+        """
+        conn = self._active.get(thread_id)
+        if conn is not None:
+            conn.interrupt()
+
+    def close(self):
+        """Дождаться записи из очереди и закрыть все подключения пула"""
+        with self._writer_start_lock:
+            writer_thread, self._writer_thread = self._writer_thread, None
+            self._closed = True
+        if writer_thread is not None:
+            self._write_queue.put(None)
+            writer_thread.join()
+
+        with self._registry_lock:
+            connections, self._all_connections = self._all_connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+        self._active = {}
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from aiogram.utils.exceptions import BadRequest, NotFound, RetryAfter, Unauthorized
+
+import db_async as db
+import outbox
+from config import DELIVERY_CONCURRENCY, DELIVERY_MAX_ATTEMPTS
+
+# ========== РАССЫЛКА НАПОМИНАНИЙ И СВОДОК ==========
+#
+# Рассылка (run) - пачка сообщений, которые нужно доставить сейчас:
+# напоминания, сработавшие в одну минуту, или сводки всем домохозяйствам.
+# Сообщения группируются по чатам; не больше DELIVERY_CONCURRENCY чатов
+# обслуживается одновременно, сообщения одного чата уходят по порядку.
+# Временные ошибки (сеть, 5xx, 429) повторяются с экспоненциальной
+# паузой и разбросом, постоянные (бот заблокирован, чат не найден,
+# ошибка разметки) не повторяются. Недоставленное сообщение сохраняется
+# в таблицу delivery_dead_letters. По каждой рассылке считаются скорость
+# и задержка доставки от начала рассылки.
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повтор бессмыслен
+PERMANENT_ERRORS = (BadRequest, Unauthorized, NotFound)
+# Пауза перед повтором: BACKOFF_BASE * 2^(попытка - 1) с разбросом, не больше BACKOFF_MAX секунд
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# Сколько последних отчетов о рассылках хранить
+REPORTS_KEPT = 20
+
+
+class Delivery(namedtuple('Delivery', 'chat_id text kind parse_mode')):
+    """Сообщение рассылки; kind - что это (reminder, digest) для отчета и мертвых писем"""
+    __slots__ = ()
+
+    def __new__(cls, chat_id, text, kind, parse_mode=None):
+        return super().__new__(cls, chat_id, text, kind, parse_mode)
+
+
+class DeliveryReport(namedtuple('DeliveryReport', 'name at messages chats sent failed retried seconds '
+                                                  'p50_ms p99_ms max_ms')):
+    """Итог одной рассылки; задержки - от начала рассылки до доставки сообщения"""
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        return self.sent / self.seconds if self.seconds else 0.0
+
+
+recent_reports = deque(maxlen=REPORTS_KEPT)
+
+
+def backoff(attempt, rnd=random):
+    """Пауза перед повтором номер attempt (с 1)"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + rnd.uniform(0, delay / 2)
+
+
+async def _send_with_retries(bot, delivery, counters):
+    """Отправить сообщение; возвращает (None или последняя ошибка, число попыток)"""
+    for attempt in range(1, DELIVERY_MAX_ATTEMPTS + 1):
+        try:
+            await bot.send_message(delivery.chat_id, delivery.text, parse_mode=delivery.parse_mode)
+            return None, attempt
+        except PERMANENT_ERRORS as e:
+            return e, attempt
+        except RetryAfter as e:
+            error, pause = e, e.timeout  # QueuedBot повторяет 429 сам; сюда попадает, когда повторы кончились
+        except Exception as e:
+            error, pause = e, backoff(attempt)
+        if attempt < DELIVERY_MAX_ATTEMPTS:
+            counters['retried'] += 1
+            await asyncio.sleep(pause)
+    return error, DELIVERY_MAX_ATTEMPTS
+
+
+async def deliver(bot, deliveries, name, level=outbox.DIGEST, concurrency=DELIVERY_CONCURRENCY):
+    """Доставить пачку сообщений Delivery; возвращает DeliveryReport
+
+    level - приоритет в очереди бота (outbox.REMINDER, outbox.DIGEST).
+    """
+    chats = OrderedDict()
+    for delivery in deliveries:
+        chats.setdefault(delivery.chat_id, []).append(delivery)
+
+    started = time.perf_counter()
+    latencies = []
+    counters = {'failed': 0, 'retried': 0}
+    pending = deque(chats.values())
+
+    async def worker():
+        while pending:
+            for delivery in pending.popleft():
+                error, attempts = await _send_with_retries(bot, delivery, counters)
+                if error is None:
+                    latencies.append(time.perf_counter() - started)
+                    continue
+                counters['failed'] += 1
+                logger.warning(f"📭 Не доставлено ({delivery.kind}) в чат {delivery.chat_id}: {error}")
+                try:
+                    await db.add_dead_letter(delivery.chat_id, delivery.kind, delivery.text,
+                                             f"{type(error).__name__}: {error}", attempts)
+                except Exception as e:
+                    logger.error(f"❌ Не удалось сохранить недоставленное сообщение: {e}")
+
+    with outbox.priority(level):
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(chats)))))
+
+    latencies.sort()
+    report = DeliveryReport(
+        name=name,
+        at=time.strftime('%Y-%m-%d %H:%M:%S'),
+        messages=len(deliveries),
+        chats=len(chats),
+        sent=len(latencies),
+        failed=counters['failed'],
+        retried=counters['retried'],
+        seconds=time.perf_counter() - started,
+        p50_ms=latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        p99_ms=latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+        max_ms=latencies[-1] * 1000 if latencies else 0.0,
+    )
+    recent_reports.append(report)
+    logger.info(f"📬 Рассылка '{name}': {report.sent}/{report.messages} за {report.seconds:.2f} с "
+                f"({report.rate:.0f}/с), повторов {report.retried}, не доставлено {report.failed}, "
+                f"p50 {report.p50_ms:.0f} мс, p99 {report.p99_ms:.0f} мс")
+    return report
@@ -0,0 +1,245 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from db_pool import ConnectionPool
+
+# ========== ХРАНИЛИЩЕ СОСТОЯНИЙ FSM В SQLITE ==========
+#
+# Незаконченные диалоги (AddExpense, EditPlan, ...) переживают перезапуск
+# бота. Перед таблицей стоит LRU-кэш: обычное сообщение читает состояние
+# из памяти, без обращения к диску. Изменения копятся в памяти и через
+# flush_interval секунд записываются одной транзакцией, поэтому несколько
+# изменений одного диалога в обработчике дают одну запись строки.
+# Диалоги, которые не менялись дольше ttl секунд, считаются брошенными.
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять из таблицы брошенные диалоги, секунды
+PURGE_INTERVAL = 3600
+
+
+class _Entry:
+    """Состояние одного диалога (чат, пользователь)"""
+    __slots__ = ('state', 'data', 'bucket', 'updated')
+
+    def __init__(self, state=None, data=None, bucket=None, updated=0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.bucket = bucket if bucket is not None else {}
+        self.updated = updated
+
+    def is_empty(self):
+        return self.state is None and not self.data and not self.bucket
+
+    def clear(self):
+        self.state = None
+        self.data = {}
+        self.bucket = {}
+
+
+def _create_table(cursor):
+    """Таблица состояний: пустые data/bucket хранятся как NULL"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT,
+            data TEXT,
+            bucket TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)')
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')) if value else None
+
+
+def _loads(value):
+    return json.loads(value) if value else {}
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM aiogram: таблица SQLite, LRU-кэш и отложенная пакетная запись
+
+    ttl - через сколько секунд без изменений диалог сбрасывается,
+    cache_size - сколько диалогов держать в памяти, flush_interval -
+    задержка записи изменений на диск. Изменения, не успевшие
+    записаться, теряются только при аварийном завершении процесса:
+    close() записывает их перед выходом.
+    """
+
+    def __init__(self, db_path, ttl=24 * 3600, cache_size=10_000, flush_interval=0.5, **pool_kwargs):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.pool = ConnectionPool(db_path, **pool_kwargs)
+        self.pool.write(_create_table)
+
+        self._cache = OrderedDict()  # (chat_id, user_id) -> _Entry, последние использованные в конце
+        self._dirty = {}             # измененные, но еще не записанные
+        self._flusher = None
+        self._last_purge = 0.0
+
+    # ---------- Кэш и запись ----------
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _load(self, key):
+        """Прочитать диалог из таблицы (выполняется в пуле потоков)"""
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                'SELECT state, data, bucket, updated_at FROM fsm_states WHERE chat_id = ? AND user_id = ?', key
+            ).fetchone()
+        if row is None:
+            return _Entry()
+        state, data, bucket, updated = row
+        return _Entry(state, _loads(data), _loads(bucket), updated)
+
+    async def _entry(self, key):
+        """Диалог из кэша, а при промахе - из таблицы"""
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+        else:
+            entry = self._dirty.get(key)
+            if entry is None:
+                loaded = await asyncio.get_running_loop().run_in_executor(None, self._load, key)
+                # Пока шло чтение, диалог мог загрузить или изменить другой обработчик
+                entry = self._cache.get(key) or self._dirty.get(key) or loaded
+            self._cache[key] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)  # измененные остаются в _dirty до записи
+
+        if entry.updated and time.time() - entry.updated > self.ttl and not entry.is_empty():
+            entry.clear()
+            self._touch(key, entry)
+        return entry
+
+    def _touch(self, key, entry):
+        """Отметить диалог измененным и запланировать запись"""
+        entry.updated = time.time()
+        self._dirty[key] = entry
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._flusher = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"❌ Не удалось записать состояния FSM: {e}")
+
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        now = time.time()
+        purge_before = now - self.ttl if now - self._last_purge > PURGE_INTERVAL else None
+        if not self._dirty and purge_before is None:
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        upserts = []
+        deletes = []
+        for (chat_id, user_id), entry in dirty.items():
+            if entry.is_empty():
+                deletes.append((chat_id, user_id))
+            else:
+                upserts.append((chat_id, user_id, entry.state, _dumps(entry.data), _dumps(entry.bucket),
+                                entry.updated))
+
+        def operation(cursor):
+            cursor.executemany('''
+                INSERT OR REPLACE INTO fsm_states (chat_id, user_id, state, data, bucket, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', upserts)
+            cursor.executemany('DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?', deletes)
+            if purge_before is not None:
+                cursor.execute('DELETE FROM fsm_states WHERE updated_at < ?', (purge_before,))
+
+        try:
+            await asyncio.wrap_future(self.pool.submit_write(operation))
+        except BaseException:
+            # Вернуть в очередь то, что не успели изменить заново
+            for key, entry in dirty.items():
+                self._dirty.setdefault(key, entry)
+            raise
+        if purge_before is not None:
+            self._last_purge = now
+
+    # ---------- Интерфейс BaseStorage ----------
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        entry = await self._entry(self._key(chat, user))
+        return entry.state if entry.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        entry = await self._entry(self._key(chat, user))
+        return copy.deepcopy(entry.data)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.state = self.resolve_state(state)
+        self._touch(key, entry)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.data = copy.deepcopy(data) if data else {}
+        self._touch(key, entry)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.data.update(data or {}, **kwargs)
+        self._touch(key, entry)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.state = None
+        if with_data:
+            entry.data = {}
+        self._touch(key, entry)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        entry = await self._entry(self._key(chat, user))
+        return copy.deepcopy(entry.bucket)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.bucket = copy.deepcopy(bucket) if bucket else {}
+        self._touch(key, entry)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        key = self._key(chat, user)
+        entry = await self._entry(key)
+        entry.bucket.update(bucket or {}, **kwargs)
+        self._touch(key, entry)
+
+    async def close(self):
+        """Записать несохраненные изменения и закрыть подключения"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        self.pool.close()
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
@@ -0,0 +1,302 @@
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import quick_entry
+from config import IMPORT_CHUNK_SIZE, IMPORT_PROFILES_PATH
+
+# ========== ИМПОРТ БАНКОВСКИХ ВЫПИСОК ==========
+#
+# Выписка (CSV или JSONL) читается потоково: генератор отдает по одной
+# строке, строки копятся в пачки по chunk_size и записываются одной
+# операцией писателя. Пока пишется одна пачка, собирается следующая,
+# поэтому память не зависит от размера файла. Колонки выписки переводятся
+# в поля транзакции профилем (встроенным или из IMPORT_PROFILES_PATH).
+# Каждая строка получает хеш содержимого; хеши уже загруженных строк
+# лежат в transactions.import_hash, и повторный импорт той же или
+# пересекающейся выписки не создает дублей.
+
+# Поля профиля и значения по умолчанию
+DEFAULT_PROFILE = {
+    'format': 'csv',              # csv или jsonl
+    'encoding': 'utf-8-sig',
+    'delimiter': ';',
+    'date': 'date',               # колонка даты (можно с временем)
+    'date_formats': ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d.%m.%Y', '%d.%m.%Y %H:%M:%S',
+                     '%d.%m.%Y %H:%M'],
+    'amount': 'amount',           # сумма со знаком: отрицательная - расход
+    'debit': None,                # или отдельные колонки расхода и прихода
+    'credit': None,
+    'category': 'category',       # категория банка (необязательно)
+    'categories': {},             # категория банка -> категория бота
+    'description': 'description', # колонка или список колонок
+    'include': {},                # колонка -> допустимые значения (например, статус операции)
+}
+
+BUILTIN_PROFILES = {
+    'generic': {},
+    'jsonl': {'format': 'jsonl'},
+    'tinkoff': {
+        'encoding': 'cp1251',
+        'date': 'Дата операции',
+        'amount': 'Сумма операции',
+        'category': 'Категория',
+        'description': 'Описание',
+        'include': {'Статус': ['OK']},
+        'categories': {
+            'Супермаркеты': 'Еда', 'Рестораны': 'Еда', 'Фастфуд': 'Еда', 'Кафе': 'Еда',
+            'Такси': 'Транспорт', 'Транспорт': 'Транспорт', 'Местный транспорт': 'Транспорт',
+            'Топливо': 'Транспорт', 'Автоуслуги': 'Транспорт',
+            'Развлечения': 'Развлечения', 'Кино': 'Развлечения', 'Путешествия': 'Развлечения',
+            'Одежда и обувь': 'Одежда', 'ЖКХ': 'Жилье', 'Связь': 'Жилье', 'Дом и ремонт': 'Жилье',
+            'Аптеки': 'Здоровье', 'Медицина': 'Здоровье', 'Спорттовары': 'Здоровье',
+            'Цветы': 'Подарки', 'Подарки': 'Подарки',
+        },
+    },
+}
+
+# Сколько последних хешей помнить для нумерации одинаковых строк в файле
+# (одинаковые строки выписки обычно идут подряд)
+OCCURRENCE_MEMORY = 10_000
+# Сколько ошибок разбора показывать
+ERROR_SAMPLES = 10
+
+
+def load_profiles(path=IMPORT_PROFILES_PATH):
+    """Встроенные профили и профили из JSON-файла path (если он есть), с полями по умолчанию"""
+    profiles = dict(BUILTIN_PROFILES)
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            profiles.update(json.load(f))
+    return {name: {'name': name, **DEFAULT_PROFILE, **fields} for name, fields in profiles.items()}
+
+
+class ImportStats:
+    """Счетчики импорта; bytes_read/total_bytes - для прогресса"""
+    __slots__ = ('read', 'inserted', 'duplicates', 'skipped', 'errors', 'error_samples',
+                 'bytes_read', 'total_bytes', 'started')
+
+    def __init__(self, total_bytes=0):
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.errors = 0
+        self.error_samples = []
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.started = time.perf_counter()
+
+    def error(self, line, message):
+        self.errors += 1
+        if len(self.error_samples) < ERROR_SAMPLES:
+            self.error_samples.append((line, message))
+
+    def percent(self):
+        return 100.0 * self.bytes_read / self.total_bytes if self.total_bytes else 0.0
+
+    def rate(self):
+        return self.read / max(time.perf_counter() - self.started, 1e-9)
+
+
+# ---------- Чтение и разбор ----------
+
+def _raw_rows(stream, profile):
+    """(номер строки, поля, исходное содержимое) из двоичного потока"""
+    text = io.TextIOWrapper(stream, encoding=profile['encoding'], newline='')
+    try:
+        if profile['format'] == 'jsonl':
+            for number, line in enumerate(text, 1):
+                line = line.strip()
+                if line:
+                    yield number, json.loads(line), line
+            return
+
+        reader = csv.reader(text, delimiter=profile['delimiter'])
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.strip() for column in header]
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                yield reader.line_num, dict(zip(header, row)), '\x1f'.join(row)
+    finally:
+        text.detach()  # иначе обертка закроет файл вызывающего
+
+
+def parse_amount(value):
+    """Сумма из числа или строки вида '-1 234,56'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    cleaned = str(value).strip().replace('−', '-').replace(' ', '').replace('\xa0', '').replace(',', '.')
+    return float(cleaned) if cleaned else 0.0
+
+
+def _parse_datetime(value, formats):
+    """Дата по первому подходящему формату; подошедший формат переносится в начало списка formats"""
+    value = str(value).strip()
+    for i, date_format in enumerate(formats):
+        try:
+            moment = datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        if i:
+            formats.insert(0, formats.pop(i))
+        return moment
+    raise ValueError(f"неизвестный формат даты {value!r}")
+
+
+def _field(fields, column):
+    if isinstance(column, list):
+        return ' '.join(str(fields.get(name) or '').strip() for name in column).strip()
+    return str(fields.get(column) or '').strip() if column else ''
+
+
+def to_transaction(fields, profile, date_formats=None):
+    """Поля строки выписки -> (дата, время создания, тип, сумма, категория, описание)"""
+    moment = _parse_datetime(fields.get(profile['date'], ''), date_formats or list(profile['date_formats']))
+    if profile['debit'] or profile['credit']:
+        amount = parse_amount(fields.get(profile['credit']) or 0) - abs(parse_amount(fields.get(profile['debit']) or 0))
+    else:
+        amount = parse_amount(fields.get(profile['amount'], ''))
+    if amount == 0:
+        raise ValueError("нулевая сумма")
+    trans_type = 'income' if amount > 0 else 'expense'
+
+    description = _field(fields, profile['description']) or None
+    bank_category = _field(fields, profile['category'])
+    category = (profile['categories'].get(bank_category)
+                or quick_entry.guess_category(trans_type, f"{bank_category} {description or ''}")
+                or quick_entry.FALLBACK_CATEGORY[trans_type])
+    return (moment.date().isoformat(), moment.strftime('%Y-%m-%d %H:%M:%S'), trans_type, abs(amount),
+            category, description)
+
+
+def read_statement(stream, profile, user_id, stats):
+    """Генератор строк для import_transactions: (дата, создано, тип, сумма, категория, описание, хеш)
+
+    Одинаковые строки в одном файле различаются номером повтора в хеше,
+    поэтому две одинаковые покупки за день не считаются дублем. Хеш
+    начинается с даты: выписка идет по времени, и новые ключи уникального
+    индекса ложатся рядом, а не по всему индексу - иначе каждая пачка
+    меняла бы тем больше страниц, чем больше уже загружено.
+    """
+    include = {column: set(values) for column, values in profile['include'].items()}
+    occurrences = OrderedDict()
+    date_formats = list(profile['date_formats'])
+    for number, fields, raw in _raw_rows(stream, profile):
+        stats.read += 1
+        if include and any(str(fields.get(column, '')).strip() not in values for column, values in include.items()):
+            stats.skipped += 1
+            continue
+        try:
+            transaction = to_transaction(fields, profile, date_formats)
+        except (ValueError, TypeError) as e:
+            stats.error(number, str(e))
+            continue
+
+        content = hashlib.blake2b(f"{user_id}\x1e{raw}".encode(), digest_size=16).hexdigest()
+        occurrence = occurrences.pop(content, 0)
+        occurrences[content] = occurrence + 1
+        if len(occurrences) > OCCURRENCE_MEMORY:
+            occurrences.popitem(last=False)
+        import_hash = f"{transaction[0]}:{content}"
+        yield transaction + (f"{import_hash}:{occurrence}" if occurrence else import_hash,)
+
+
+# ---------- Запись ----------
+
+def import_file(stream, user_id, profile, chunk_size=IMPORT_CHUNK_SIZE, progress=None, dry_run=False,
+                stats=None):
+    """Импортировать выписку из двоичного потока stream; возвращает ImportStats
+
+    progress(stats) вызывается после каждой записанной пачки.
+    dry_run - только разобрать файл, ничего не записывая.
+    stats - ImportStats вызывающего: если импорт прервется исключением,
+    по нему видно, сколько строк из уже записанных пачек осталось в базе.
+    """
+    import database
+
+    try:
+        total = os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        total = len(stream.getbuffer()) if isinstance(stream, io.BytesIO) else 0
+    if stats is None:
+        stats = ImportStats(total)
+    stats.total_bytes = total
+    pending = None
+
+    def finish(future):
+        inserted, duplicates = future.result()
+        stats.inserted += inserted
+        stats.duplicates += duplicates
+        stats.bytes_read = stream.tell()
+        if progress is not None:
+            progress(stats)
+
+    chunk = []
+    try:
+        for row in read_statement(stream, profile, user_id, stats):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                # Следующая пачка собирается, пока пишется предыдущая
+                if pending is not None:
+                    finish(pending)
+                pending = None if dry_run else database.import_transactions.submit(user_id, chunk)
+                chunk = []
+    finally:
+        # Пачка из очереди записывается и при ошибке чтения - учесть ее в stats
+        if pending is not None:
+            finish(pending)
+    if chunk and not dry_run:
+        finish(database.import_transactions.submit(user_id, chunk))
+    stats.bytes_read = stats.total_bytes
+    return stats
+
+
+def summary(stats):
+    """Итог импорта одной строкой"""
+    elapsed = time.perf_counter() - stats.started
+    return (f"прочитано {stats.read}, добавлено {stats.inserted}, дублей {stats.duplicates}, "
+            f"пропущено {stats.skipped}, ошибок {stats.errors} за {elapsed:.1f} с")
+
+
+def main(argv):
+    """Командная строка: python importer.py <файл> --user <id> [--profile имя] [--dry-run]"""
+    profiles = load_profiles()
+    parser = argparse.ArgumentParser(prog='importer.py', description="Импорт банковской выписки в transactions")
+    parser.add_argument('path')
+    parser.add_argument('--user', type=int, required=True, help="id пользователя Telegram")
+    parser.add_argument('--profile', default='generic', choices=sorted(profiles))
+    parser.add_argument('--chunk', type=int, default=IMPORT_CHUNK_SIZE, help="строк в одной записи")
+    parser.add_argument('--dry-run', action='store_true', help="только проверить файл")
+    args = parser.parse_args(argv[1:])
+
+    import database
+    database.init_db()
+
+    def report(stats):
+        print(f"\r⏳ {stats.percent():5.1f}%  строк {stats.read}, добавлено {stats.inserted}, "
+              f"дублей {stats.duplicates}, {stats.rate():,.0f} строк/с", end='', file=sys.stderr, flush=True)
+
+    try:
+        with open(args.path, 'rb') as stream:
+            stats = import_file(stream, args.user, profiles[args.profile], args.chunk, report, args.dry_run)
+        print(file=sys.stderr)
+        print(f"✅ {summary(stats)}")
+        for line, message in stats.error_samples:
+            print(f"❌ строка {line}: {message}")
+        return 0 if not stats.errors else 1
+    finally:
+        database.close_db()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
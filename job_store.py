@@ -0,0 +1,229 @@
+import logging
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+# ========== ХРАНИЛИЩЕ ЗАДАЧ ПЛАНИРОВЩИКА В SQLITE ==========
+#
+# Задачи APScheduler (напоминания, сдвиг окна напоминаний) хранятся в
+# таблице scheduler_jobs основной базы и переживают перезапуск бота:
+# задача, пропущенная во время простоя, после запуска выполняется (или
+# считается пропущенной) по misfire_grace_time и coalesce. Планировщик
+# читает только то, что нужно сейчас: сработавшие задачи и ближайший
+# момент - по индексу next_run_time, отдельную задачу - по id.
+#
+# Запись идет через писателя пула (групповая фиксация) и не ждет commit:
+# пока изменение не записано, оно лежит в памяти (_pending) и учитывается
+# при чтении. Поэтому пачка add_job (загрузка окна напоминаний) дает
+# несколько commit на всю пачку, а не commit на каждую задачу.
+#
+# Планировщик читает хранилище в потоке цикла событий, поэтому чтение идет
+# через собственное подключение хранилища, а не через читателей пула: их
+# слоты делят с db_async, и занятые слоты останавливали бы весь цикл.
+# Ожидание блокировки базы ограничено READ_BUSY_TIMEOUT_MS; при ошибке
+# APScheduler повторяет чтение задач через jobstore_retry_interval.
+
+logger = logging.getLogger(__name__)
+
+_DELETED = object()
+
+# Сколько чтение таблицы задач ждет блокировку базы, мс
+READ_BUSY_TIMEOUT_MS = 100
+
+
+def _create_table(cursor):
+    """Таблица задач: next_run_time - UTC timestamp, NULL у приостановленных"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+            id TEXT PRIMARY KEY,
+            next_run_time REAL,
+            job_state BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduler_jobs_next_run ON scheduler_jobs (next_run_time)')
+
+
+class SQLiteJobStore(BaseJobStore):
+    """Хранилище задач APScheduler в таблице scheduler_jobs пула db_pool.ConnectionPool
+
+    Пул принадлежит вызывающему (обычно это пул основного шарда базы) и
+    хранилищем не закрывается; из пула используются только файл базы и
+    поток-писатель.
+    """
+
+    def __init__(self, pool, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.pool = pool
+        self.pickle_protocol = pickle_protocol
+        self._pending = {}  # id -> (next_run_time, job_state или _DELETED, Future записи)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self.pool.write(_create_table)
+
+    def shutdown(self):
+        self.flush()
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- Запись ----------
+
+    def _submit(self, job_id, next_run_time, job_state, operation):
+        """Поставить запись в очередь писателя; до commit изменение видно через _pending"""
+        with self._lock:
+            future = self.pool.submit_write(operation)
+            self._pending[job_id] = (next_run_time, job_state, future)
+        future.add_done_callback(lambda done: self._written(job_id, done))
+
+    def _written(self, job_id, future):
+        """Вызывается потоком-писателем после commit (или ошибки) записи"""
+        with self._lock:
+            entry = self._pending.get(job_id)
+            if entry is not None and entry[2] is future:
+                del self._pending[job_id]
+        if future.exception() is not None:
+            logger.error(f"❌ Не удалось сохранить задачу планировщика {job_id}: {future.exception()}")
+
+    def _save(self, job):
+        next_run_time = datetime_to_utc_timestamp(job.next_run_time)
+        job_state = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+        def operation(cursor):
+            cursor.execute('INSERT OR REPLACE INTO scheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)',
+                           (job.id, next_run_time, job_state))
+
+        self._submit(job.id, next_run_time, job_state, operation)
+
+    def flush(self):
+        """Дождаться записи всех изменений"""
+        with self._lock:
+            futures = [future for _, _, future in self._pending.values()]
+        for future in futures:
+            future.exception()
+
+    # ---------- Чтение ----------
+
+    @contextmanager
+    def _reader(self):
+        """Собственное подключение хранилища для чтения (не занимает слоты читателей пула)"""
+        with self._conn_lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.pool.db_path, check_same_thread=False)
+                self._conn.execute(f'PRAGMA busy_timeout = {READ_BUSY_TIMEOUT_MS}')
+                self._conn.execute('PRAGMA query_only = 1')
+            yield self._conn
+
+    def _pending_snapshot(self):
+        # Снимок берется до чтения таблицы: изменение, записанное между
+        # снимком и чтением, есть в обоих, и используется версия из снимка
+        with self._lock:
+            return {job_id: (next_run_time, job_state)
+                    for job_id, (next_run_time, job_state, _) in self._pending.items()}
+
+    def _exists(self, job_id):
+        pending = self._pending_snapshot().get(job_id)
+        if pending is not None:
+            return pending[1] is not _DELETED
+        with self._reader() as conn:
+            return conn.execute('SELECT 1 FROM scheduler_jobs WHERE id = ?', (job_id,)).fetchone() is not None
+
+    def _reconstitute(self, job_state):
+        state = pickle.loads(job_state)
+        state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _select(self, condition='', params=()):
+        """Задачи по условию с учетом незаписанных изменений, по возрастанию next_run_time"""
+        pending = self._pending_snapshot()
+        with self._reader() as conn:
+            rows = conn.execute(f'SELECT id, next_run_time, job_state FROM scheduler_jobs {condition}',
+                                params).fetchall()
+
+        candidates = [(next_run_time, job_id, job_state) for job_id, next_run_time, job_state in rows
+                      if job_id not in pending]
+        candidates += [(next_run_time, job_id, job_state) for job_id, (next_run_time, job_state) in pending.items()
+                       if job_state is not _DELETED]
+        candidates.sort(key=lambda item: (item[0] is not None, item[0] or 0.0))
+
+        jobs = []
+        broken = []
+        for _, job_id, job_state in candidates:
+            try:
+                jobs.append(self._reconstitute(job_state))
+            except BaseException:
+                logger.exception(f"❌ Не удалось восстановить задачу {job_id}, она будет удалена")
+                broken.append(job_id)
+        for job_id in broken:
+            self.remove_job(job_id)
+        return jobs
+
+    # ---------- Интерфейс BaseJobStore ----------
+
+    def lookup_job(self, job_id):
+        pending = self._pending_snapshot().get(job_id)
+        if pending is not None:
+            return None if pending[1] is _DELETED else self._reconstitute(pending[1])
+        with self._reader() as conn:
+            row = conn.execute('SELECT job_state FROM scheduler_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._reconstitute(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        timestamp = datetime_to_utc_timestamp(now)
+        jobs = self._select('WHERE next_run_time <= ?', (timestamp,))
+        return [job for job in jobs if job.next_run_time is not None
+                and datetime_to_utc_timestamp(job.next_run_time) <= timestamp]
+
+    def get_next_run_time(self):
+        pending = self._pending_snapshot()
+        times = [next_run_time for next_run_time, job_state in pending.values()
+                 if job_state is not _DELETED and next_run_time is not None]
+        # Ближайшие строки таблицы, пока не встретится задача без незаписанных изменений
+        with self._reader() as conn:
+            rows = conn.execute('''
+                SELECT id, next_run_time FROM scheduler_jobs
+                WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT ?
+            ''', (len(pending) + 1,)).fetchall()
+        times += [next_run_time for job_id, next_run_time in rows if job_id not in pending][:1]
+        return utc_timestamp_to_datetime(min(times)) if times else None
+
+    def get_all_jobs(self):
+        jobs = self._select('ORDER BY next_run_time')
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        if self._exists(job.id):
+            raise ConflictingIdError(job.id)
+        self._save(job)
+
+    def update_job(self, job):
+        if not self._exists(job.id):
+            raise JobLookupError(job.id)
+        self._save(job)
+
+    def remove_job(self, job_id):
+        if not self._exists(job_id):
+            raise JobLookupError(job_id)
+        self._submit(job_id, None, _DELETED,
+                     lambda cursor: cursor.execute('DELETE FROM scheduler_jobs WHERE id = ?', (job_id,)))
+
+    def remove_all_jobs(self):
+        self.flush()
+        self.pool.write(lambda cursor: cursor.execute('DELETE FROM scheduler_jobs'))
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} (path={self.pool.db_path})>'
@@ -27,35 +27,36 @@ def get_main_keyboard():
     )
     return keyboard
 
-def get_back_keyboard():
+def get_back_keyboard(callback_data='back_to_main'):
     """Клавиатура с кнопкой назад"""
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='back_to_main'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=callback_data))
     return keyboard
 
 # ========== КЛАВИАТУРЫ ДЛЯ КАТЕГОРИЙ ==========
 
+EXPENSE_CATEGORIES = ['Еда', 'Транспорт', 'Развлечения', 'Одежда', 'Жилье', 'Здоровье', 'Подарки', 'Другое']
+INCOME_CATEGORIES = ['Зарплата', 'Подработка', 'Инвестиции', 'Подарок', 'Возврат долга', 'Прочее']
+PLAN_CATEGORIES = ['личные', 'работа', 'семья', 'отдых', 'здоровье', 'другое']
+
 def get_expense_categories_keyboard():
     """Категории для расходов"""
     keyboard = InlineKeyboardMarkup(row_width=2)
-    categories = ['Еда', 'Транспорт', 'Развлечения', 'Одежда', 'Жилье', 'Здоровье', 'Подарки', 'Другое']
-    for cat in categories:
+    for cat in EXPENSE_CATEGORIES:
         keyboard.insert(InlineKeyboardButton(cat, callback_data=f'expense_cat_{cat}'))
     return keyboard
 
 def get_income_categories_keyboard():
     """Категории для доходов"""
     keyboard = InlineKeyboardMarkup(row_width=2)
-    categories = ['Зарплата', 'Подработка', 'Инвестиции', 'Подарок', 'Возврат долга', 'Прочее']
-    for cat in categories:
+    for cat in INCOME_CATEGORIES:
         keyboard.insert(InlineKeyboardButton(cat, callback_data=f'income_cat_{cat}'))
     return keyboard
 
 def get_plan_categories_keyboard():
     """Категории для планов"""
     keyboard = InlineKeyboardMarkup(row_width=2)
-    categories = ['личные', 'работа', 'семья', 'отдых', 'здоровье', 'другое']
-    for cat in categories:
+    for cat in PLAN_CATEGORIES:
         keyboard.insert(InlineKeyboardButton(cat, callback_data=f'plan_cat_{cat}'))
     return keyboard
 
@@ -300,23 +301,31 @@ def get_search_filters_keyboard(search_type):
 
 # ========== КЛАВИАТУРЫ ДЛЯ ВЫБОРА ЗАПИСЕЙ ==========
 
-def create_transactions_keyboard(transactions, trans_type):
+def create_transactions_keyboard(transactions, trans_type, has_prev=False, has_next=False):
     """Клавиатура с транзакциями для выбора"""
     keyboard = InlineKeyboardMarkup(row_width=1)
     
     for trans in transactions:
-        trans_id, amount, category, description, trans_date, time = trans[:6]
+        description = trans.description
         desc_short = (description[:20] + "...") if description and len(description) > 20 else (description or "")
-        date_str = trans_date if len(trans) > 5 else "сегодня"
-        time_str = f" ({time})" if time else ""
+        time_str = f" ({trans.time})" if trans.time else ""
         
-        text = f"{amount} руб. - {category} - {date_str}{time_str}"
+        text = f"{trans.amount} руб. - {trans.category} - {trans.date}{time_str}"
         if desc_short:
             text += f" | {desc_short}"
         
-        callback_data = f'select_{trans_type}_{trans_id}'
+        callback_data = f'select_{trans_type}_{trans.id}'
         keyboard.add(InlineKeyboardButton(text, callback_data=callback_data))
     
+    # Курсор страницы - id крайней записи, ключ (date, created_at) берется из БД
+    navigation = []
+    if has_prev and transactions:
+        navigation.append(InlineKeyboardButton('⬅️ Назад', callback_data=f'page_{trans_type}_prev_{transactions[0].id}'))
+    if has_next and transactions:
+        navigation.append(InlineKeyboardButton('Далее ➡️', callback_data=f'page_{trans_type}_next_{transactions[-1].id}'))
+    if navigation:
+        keyboard.row(*navigation)
+    
     keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='back_to_management'))
     return keyboard
 
@@ -325,16 +334,16 @@ def create_plans_keyboard(plans):
     keyboard = InlineKeyboardMarkup(row_width=1)
     
     for plan in plans:
-        plan_id, title, description, plan_date, time, category, is_shared = plan[:7]
-        shared_icon = " 👥" if is_shared else ""
-        time_str = f" в {time}" if time else ""
+        description = plan.description
+        shared_icon = " 👥" if plan.is_shared else ""
+        time_str = f" в {plan.time}" if plan.time else ""
         desc_short = (description[:20] + "...") if description and len(description) > 20 else (description or "")
         
-        text = f"{title}{shared_icon} - {plan_date}{time_str}"
+        text = f"{plan.title}{shared_icon} - {plan.date}{time_str}"
         if desc_short:
             text += f" | {desc_short}"
         
-        keyboard.add(InlineKeyboardButton(text, callback_data=f'select_plan_{plan_id}'))
+        keyboard.add(InlineKeyboardButton(text, callback_data=f'select_plan_{plan.id}'))
     
     keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='back_to_management'))
     return keyboard
@@ -344,16 +353,16 @@ def create_purchases_keyboard(purchases):
     keyboard = InlineKeyboardMarkup(row_width=1)
     
     for purchase in purchases:
-        purchase_id, item_name, cost, priority, target_date, notes, status = purchase[:7]
-        emoji = {'high': '🔴', 'medium': '🟡', 'low': '🟢'}[priority]
-        date_str = f"до {target_date}" if target_date else ""
+        notes = purchase.notes
+        emoji = {'high': '🔴', 'medium': '🟡', 'low': '🟢'}[purchase.priority]
+        date_str = f"до {purchase.target_date}" if purchase.target_date else ""
         notes_short = (notes[:20] + "...") if notes and len(notes) > 20 else (notes or "")
         
-        text = f"{emoji} {item_name} - {cost} руб. {date_str}"
+        text = f"{emoji} {purchase.item_name} - {purchase.estimated_cost} руб. {date_str}"
         if notes_short:
             text += f" | {notes_short}"
         
-        keyboard.add(InlineKeyboardButton(text, callback_data=f'select_purchase_{purchase_id}'))
+        keyboard.add(InlineKeyboardButton(text, callback_data=f'select_purchase_{purchase.id}'))
     
     keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='back_to_management'))
     return keyboard
\ No newline at end of file
@@ -0,0 +1,76 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from aiogram.utils.exceptions import BadRequest, MessageNotModified
+
+# ========== НАВИГАЦИЯ ПО INLINE-МЕНЮ ==========
+#
+# Переходы между меню (статистика, управление, поиск, "Назад") меняют
+# сообщение с нажатой кнопкой вместо отправки нового: в чате остается
+# одно меню, а запрос к Bot API один. Последнее показанное содержимое
+# сообщения запоминается, поэтому повторное нажатие той же кнопки не
+# отправляет ничего, а если поменялась только клавиатура, меняется только
+# она. Старые сообщения и сообщения без текста (фото, документ) Telegram
+# редактировать не дает - тогда меню отправляется новым сообщением.
+
+logger = logging.getLogger(__name__)
+
+# Сообщения старше этого бот не редактирует, а отправляет меню заново
+EDIT_MAX_AGE = timedelta(hours=48)
+# Сколько сообщений-меню помнить
+SHOWN_CACHE_SIZE = 10_000
+
+_shown = OrderedDict()  # (chat_id, message_id) -> (текст, parse_mode, клавиатура в JSON)
+
+
+def _markup_json(markup):
+    return markup.as_json() if markup is not None else None
+
+
+def _remember(message, content):
+    key = (message.chat.id, message.message_id)
+    _shown[key] = content
+    _shown.move_to_end(key)
+    while len(_shown) > SHOWN_CACHE_SIZE:
+        _shown.popitem(last=False)
+
+
+async def show(callback_query, text, reply_markup=None, parse_mode=None):
+    """Показать экран в сообщении, на кнопку которого нажали; возвращает сообщение с экраном
+
+    reply_markup - только InlineKeyboardMarkup (или None - без клавиатуры).
+    """
+    message = callback_query.message
+    content = (text, parse_mode, _markup_json(reply_markup))
+    if message is None or message.text is None or datetime.now() - message.date > EDIT_MAX_AGE:
+        return await _send_new(callback_query, content, reply_markup)
+
+    shown = _shown.get((message.chat.id, message.message_id))
+    if shown is None and parse_mode is None:
+        # Без разметки текст сообщения можно сравнить напрямую
+        shown = (message.text, None, _markup_json(message.reply_markup))
+    if shown == content:
+        return message
+
+    try:
+        if shown is not None and shown[:2] == content[:2]:
+            await message.edit_reply_markup(reply_markup=reply_markup)
+        else:
+            await message.edit_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+    except MessageNotModified:
+        pass
+    except BadRequest as e:
+        # Сообщение нельзя изменить: удалено, слишком старое, без текста и т.п.
+        logger.info(f"Меню отправлено заново: {e}")
+        return await _send_new(callback_query, content, reply_markup)
+    _remember(message, content)
+    return message
+
+
+async def _send_new(callback_query, content, reply_markup):
+    text, parse_mode, _ = content
+    message = await callback_query.bot.send_message(callback_query.from_user.id, text,
+                                                    parse_mode=parse_mode, reply_markup=reply_markup)
+    _remember(message, content)
+    return message
@@ -0,0 +1,337 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from aiogram import Bot, types
+from aiogram.utils.exceptions import RetryAfter
+
+# ========== ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ ==========
+#
+# Telegram ограничивает частоту отправки: около 30 сообщений в секунду
+# на бота и около одного в секунду в один чат, при превышении отвечает
+# 429 с retry_after. Все исходящие сообщения бота проходят через одну
+# очередь: общий и по-чатовые маркерные ведра задают темп, ответ 429
+# откладывает чат на retry_after и повторяет отправку. Сообщения одного
+# чата уходят по порядку, по одному за раз; из готовых чатов первым
+# обслуживается тот, чье сообщение важнее (ответ пользователю раньше
+# напоминания, напоминание раньше рассылки) и раньше поставлено в очередь.
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - важнее
+INTERACTIVE = 0
+REMINDER = 1
+DIGEST = 2
+PRIORITY_NAMES = {INTERACTIVE: 'ответы', REMINDER: 'напоминания', DIGEST: 'рассылки'}
+
+# Методы Bot API, которые отправляют или меняют сообщения в чате
+QUEUED_METHODS = frozenset({
+    'sendMessage', 'forwardMessage', 'copyMessage', 'sendPhoto', 'sendDocument', 'sendMediaGroup',
+    'sendLocation', 'sendPoll', 'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+})
+
+# Сколько раз повторять отправку после 429
+MAX_RETRIES = 5
+# Сколько последних задержек в очереди хранить для перцентилей
+DELAY_SAMPLES = 1000
+# Когда ведер чатов больше, полные (давно молчавшие чаты) удаляются
+PRUNE_BUCKETS = 10_000
+
+_priority = contextvars.ContextVar('outbox_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Отправлять сообщения внутри блока (и созданных в нем задач) с приоритетом level"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Маркерное ведро: rate маркеров в секунду, не больше capacity про запас"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд появится маркер (0 - уже есть)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Message:
+    __slots__ = ('call', 'priority', 'future', 'enqueued', 'retries')
+
+    def __init__(self, call, priority, future, enqueued):
+        self.call = call
+        self.priority = priority
+        self.future = future
+        self.enqueued = enqueued
+        self.retries = 0
+
+
+class _Chat:
+    """Очередь одного чата; key - ключ в куче готовых чатов, None - чата там нет"""
+    __slots__ = ('messages', 'bucket', 'key', 'busy', 'delayed')
+
+    def __init__(self, bucket):
+        self.messages = deque()
+        self.bucket = bucket
+        self.key = None
+        self.busy = False
+        self.delayed = False
+
+
+class _Metrics:
+    """Счетчики и задержки в очереди для одного приоритета"""
+    __slots__ = ('sent', 'retried', 'failed', 'delays', 'max_delay')
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.delays = deque(maxlen=DELAY_SAMPLES)
+        self.max_delay = 0.0
+
+
+class Outbox:
+    """Планировщик исходящих сообщений
+
+    global_rate - сообщений в секунду на бота, chat_rate и chat_burst -
+    темп и запас для одного чата, max_in_flight - сколько запросов
+    к Bot API выполняется одновременно.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, max_in_flight=32):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_in_flight = max_in_flight
+
+        self._chats = {}      # chat_id -> _Chat
+        self._ready = []      # куча (приоритет, порядковый номер, chat_id)
+        self._delayed = []    # куча (когда можно отправлять, порядковый номер, chat_id)
+        self._sequence = itertools.count()
+        self._global = None
+        self._in_flight = set()
+        self._wakeup = None
+        self._runner = None
+        self.metrics = {level: _Metrics() for level in PRIORITY_NAMES}
+
+    # ---------- Постановка в очередь ----------
+
+    def submit(self, chat_id, call, level=None):
+        """Поставить call() - корутину-запрос к Bot API - в очередь чата; возвращает Future с ответом"""
+        loop = asyncio.get_running_loop()
+        if self._runner is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+            self._wakeup = asyncio.Event()
+            self._runner = loop.create_task(self._run())
+
+        level = _priority.get() if level is None else level
+        message = _Message(call, level, loop.create_future(), loop.time())
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst, loop.time()))
+        chat.messages.append(message)
+
+        if not chat.busy and not chat.delayed and (chat.key is None or level < chat.key[0]):
+            self._push_ready(chat_id, chat, level)
+        self._wakeup.set()
+        return message.future
+
+    def _push_ready(self, chat_id, chat, level):
+        chat.key = (level, next(self._sequence))
+        heapq.heappush(self._ready, (*chat.key, chat_id))
+
+    def _reschedule(self, chat_id, chat):
+        """Чат освободился: вернуть в кучу готовых, если в нем остались сообщения"""
+        if chat.messages:
+            self._push_ready(chat_id, chat, min(message.priority for message in chat.messages))
+
+    # ---------- Отправка ----------
+
+    def _dispatch(self, now):
+        """Запустить отправку всего, что можно отправить сейчас; через сколько проверить снова"""
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._delayed)
+            chat = self._chats[chat_id]
+            chat.delayed = False
+            self._reschedule(chat_id, chat)
+
+        while self._ready and len(self._in_flight) < self.max_in_flight:
+            wait = self._global.delay(now)
+            if wait:
+                return wait
+            level, sequence, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.key != (level, sequence):
+                continue  # устаревшая запись: чат переставлен с другим приоритетом
+            chat.key = None
+
+            wait = chat.bucket.delay(now)
+            if wait:
+                chat.delayed = True
+                heapq.heappush(self._delayed, (now + wait, next(self._sequence), chat_id))
+                continue
+
+            self._global.take()
+            chat.bucket.take()
+            chat.busy = True
+            task = asyncio.get_running_loop().create_task(self._send(chat_id, chat, chat.messages.popleft(), now))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+        if len(self._chats) > PRUNE_BUCKETS:
+            self._prune(now)
+        return self._delayed[0][0] - now if self._delayed else None
+
+    def _prune(self, now):
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.messages and not chat.busy and not chat.delayed and chat.key is None \
+                    and chat.bucket.is_full(now):
+                del self._chats[chat_id]
+
+    async def _send(self, chat_id, chat, message, started):
+        metrics = self.metrics[message.priority]
+        delay = started - message.enqueued
+        try:
+            result = await message.call()
+        except RetryAfter as e:
+            message.retries += 1
+            metrics.retried += 1
+            if message.retries <= MAX_RETRIES:
+                logger.warning(f"⏳ Лимит Telegram для чата {chat_id}, повтор через {e.timeout} с")
+                chat.messages.appendleft(message)
+                chat.delayed = True
+                resume = asyncio.get_running_loop().time() + e.timeout
+                heapq.heappush(self._delayed, (resume, next(self._sequence), chat_id))
+            else:
+                metrics.failed += 1
+                if not message.future.cancelled():
+                    message.future.set_exception(e)
+        except Exception as e:
+            metrics.failed += 1
+            if not message.future.cancelled():
+                message.future.set_exception(e)
+        else:
+            metrics.sent += 1
+            metrics.delays.append(delay)
+            metrics.max_delay = max(metrics.max_delay, delay)
+            if not message.future.cancelled():
+                message.future.set_result(result)
+        finally:
+            chat.busy = False
+            if not chat.delayed:
+                self._reschedule(chat_id, chat)
+            self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            wait = self._dispatch(loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    # ---------- Метрики и остановка ----------
+
+    def pending(self):
+        """Сколько сообщений ждет отправки"""
+        return sum(len(chat.messages) for chat in self._chats.values()) + len(self._in_flight)
+
+    def snapshot(self):
+        """Метрики по приоритетам: отправлено, повторов, ошибок, задержка в очереди (мс)"""
+        result = []
+        for level, metrics in self.metrics.items():
+            delays = sorted(metrics.delays)
+            result.append({
+                'priority': PRIORITY_NAMES[level],
+                'sent': metrics.sent,
+                'retried': metrics.retried,
+                'failed': metrics.failed,
+                'p50_ms': delays[len(delays) // 2] * 1000 if delays else 0.0,
+                'p99_ms': delays[min(len(delays) - 1, int(len(delays) * 0.99))] * 1000 if delays else 0.0,
+                'max_ms': metrics.max_delay * 1000,
+            })
+        return result
+
+    async def close(self, timeout=10):
+        """Дождаться отправки очереди (не дольше timeout) и остановить планировщик"""
+        if self._runner is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.pending() and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending():
+            logger.warning(f"⚠️ Не отправлено сообщений: {self.pending()}")
+        self._runner.cancel()
+        await asyncio.gather(self._runner, *self._in_flight, return_exceptions=True)
+        self._runner = None
+
+
+def _upload_streams(files):
+    """[(поток, позиция)] файлов запроса для перемотки перед повтором; None - поток не перематывается"""
+    streams = []
+    for value in (files or {}).values():
+        if isinstance(value, tuple):
+            value = value[1]
+        elif isinstance(value, types.InputFile):
+            value = value.file
+        if isinstance(value, (bytes, bytearray, str)):
+            continue
+        seekable = getattr(value, 'seekable', None)
+        if seekable is None or not seekable():
+            return None
+        streams.append((value, value.tell()))
+    return streams
+
+
+class QueuedBot(Bot):
+    """Bot, который отправляет сообщения в чаты через Outbox
+
+    Остальные запросы (answerCallbackQuery, getMe, ...) идут напрямую.
+    """
+
+    def __init__(self, *args, outbox=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = outbox if outbox is not None else Outbox()
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        chat_id = data.get('chat_id') if data else None
+        if method not in QUEUED_METHODS or chat_id is None:
+            return await super().request(method, data, files, **kwargs)
+
+        # Первая попытка читает файл до конца: повтор после 429 начинает с той же позиции
+        streams = _upload_streams(files)
+        if streams is None:
+            # Файл из неперематываемого потока повтор отправил бы пустым - без очереди
+            return await super().request(method, data, files, **kwargs)
+
+        async def call():
+            for stream, position in streams:
+                stream.seek(position)
+            return await super(QueuedBot, self).request(method, data, files, **kwargs)
+
+        return await self.outbox.submit(chat_id, call)
@@ -0,0 +1,137 @@
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import DEFAULT_TIMEZONE
+
+# ========== ПЕРИОДЫ ДЛЯ ЗАПРОСОВ ==========
+#
+# Периоды превращаются в полуоткрытые границы [start, end), чтобы условие
+# "date >= ? AND date < ?" могло использовать индексы по колонке даты.
+# Выражения вида strftime('%Y-%m', date) индексы не используют.
+#
+# Дата транзакции или плана - календарный день пользователя, поэтому
+# "сегодня" считается в его часовом поясе, а границы периода остаются
+# датами. Моменты срабатывания напоминаний хранятся в UTC как строки
+# 'ГГГГ-ММ-ДД ЧЧ:ММ:СС', которые сравниваются и индексируются как текст.
+
+PERIODS = ('today', 'week', 'month', 'all')
+
+
+def utc_today():
+    """Текущая дата по UTC (как DATE('now') в SQLite)"""
+    return datetime.now(timezone.utc).date()
+
+
+def _to_date(value):
+    """Привести дату или ISO-строку к date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def month_start(day):
+    """Первый день месяца"""
+    return day.replace(day=1)
+
+
+def next_month_start(day):
+    """Первый день следующего месяца"""
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
+
+def period_bounds(period, today=None):
+    """Границы периода [start, end) в виде ISO-строк
+
+    period - 'today', 'week', 'month', 'all' или пара (start, end)
+    с произвольным полуоткрытым диапазоном. Для 'all' возвращает (None, None).
+    """
+    today = _to_date(today) if today is not None else utc_today()
+
+    if isinstance(period, (tuple, list)):
+        start, end = period
+        start = _to_date(start).isoformat() if start is not None else None
+        end = _to_date(end).isoformat() if end is not None else None
+        return start, end
+
+    if period == 'today':
+        start, end = today, today + timedelta(days=1)
+    elif period == 'week':
+        start, end = today - timedelta(days=7), today + timedelta(days=1)
+    elif period == 'month':
+        start, end = month_start(today), next_month_start(today)
+    elif period == 'all':
+        return None, None
+    else:
+        raise ValueError(f"Неизвестный период: {period}")
+
+    return start.isoformat(), end.isoformat()
+
+
+def period_conditions(period, column='date', today=None):
+    """SQL-условия и параметры для фильтра по периоду"""
+    start, end = period_bounds(period, today)
+    conditions = []
+    params = []
+
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(start)
+
+    if end is not None:
+        conditions.append(f"{column} < ?")
+        params.append(end)
+
+    return conditions, params
+
+
+# ---------- Часовые пояса ----------
+
+UTC_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo по имени IANA; None или неизвестное имя - пояс по умолчанию"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def parse_zone(text):
+    """Имя пояса из ввода пользователя: 'Europe/Moscow', 'UTC', '+3', 'UTC-5'; None - не распознано"""
+    text = text.strip()
+    offset = text.upper().removeprefix('UTC').removeprefix('GMT')
+    if offset and offset[0] in '+-' and offset[1:].isdigit():
+        hours = int(offset)
+        # В базе IANA у Etc/GMT знак обратный: Etc/GMT-3 - это UTC+3;
+        # есть только смещения от UTC-12 до UTC+14
+        text = 'UTC' if hours == 0 else f"Etc/GMT{-hours:+d}"
+    elif not offset and text:
+        return 'UTC'
+    try:
+        ZoneInfo(text)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    return text
+
+
+def local_today(zone_name=None):
+    """Текущая дата в поясе zone_name"""
+    return datetime.now(get_zone(zone_name)).date()
+
+
+def to_utc(day, clock, zone_name=None):
+    """Момент 'ЧЧ:ММ' дня day в поясе zone_name -> строка UTC_FORMAT"""
+    local = datetime.combine(_to_date(day), time.fromisoformat(clock), tzinfo=get_zone(zone_name))
+    return local.astimezone(timezone.utc).strftime(UTC_FORMAT)
+
+
+def from_utc(value):
+    """Строка UTC_FORMAT -> datetime с tzinfo=UTC"""
+    return datetime.strptime(value, UTC_FORMAT).replace(tzinfo=timezone.utc)
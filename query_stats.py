@@ -0,0 +1,198 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import DB_SLOW_QUERY_MS, DB_SLOW_LOG
+
+# ========== СТАТИСТИКА ЗАПРОСОВ И ЖУРНАЛ МЕДЛЕННЫХ ==========
+#
+# Для каждой публичной функции database.py считаются вызовы, ошибки,
+# суммарное и максимальное время и число возвращенных строк.
+# SQL, выполненный во время вызова, перехватывается колбэком
+# set_trace_callback подключений пула; вызовы дольше порога попадают
+# в журнал медленных запросов вместе с EXPLAIN QUERY PLAN.
+
+# Порог медленного вызова в секундах (0 - журнал выключен)
+slow_threshold = DB_SLOW_QUERY_MS / 1000
+
+# Последние медленные вызовы для команды администратора
+recent_slow = deque(maxlen=50)
+
+# Сколько разных запросов запоминать за один вызов (пакетные вставки
+# выполняют один и тот же запрос тысячи раз)
+MAX_STATEMENTS = 20
+
+# Запросы, для которых имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_counters = {}
+_lock = threading.Lock()
+_local = threading.local()
+_logger = logging.getLogger('slow_queries')
+_log_file_attached = False
+
+
+class FunctionStats:
+    """Счетчики одной функции"""
+    __slots__ = ('calls', 'errors', 'total', 'max', 'rows')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+
+class Call:
+    """Текущий вызов функции: время начала и выполненный SQL"""
+    __slots__ = ('name', 'started', 'statements')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.statements = []
+
+
+def begin(name):
+    """Начать замер вызова"""
+    return Call(name)
+
+
+def current():
+    """Вызов, привязанный к текущему потоку (None - вне замера)"""
+    return getattr(_local, 'call', None)
+
+
+@contextmanager
+def bound(call):
+    """Привязать вызов к текущему потоку, чтобы trace() собирал его SQL"""
+    previous = getattr(_local, 'call', None)
+    _local.call = call
+    try:
+        yield
+    finally:
+        _local.call = previous
+
+
+def trace(statement):
+    """Колбэк set_trace_callback: запомнить SQL текущего вызова"""
+    call = getattr(_local, 'call', None)
+    if call is None or statement.startswith('--'):
+        return  # "--" - внутренние запросы SQLite (FTS5, триггеры)
+    if len(call.statements) < MAX_STATEMENTS and statement not in call.statements:
+        call.statements.append(statement)
+
+
+def count_rows(result):
+    """Сколько строк вернула функция"""
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])  # get_transactions_page: (rows, has_prev, has_next)
+    return 0 if result is None else 1
+
+
+def finish(call, result=None, error=False, explain=None):
+    """Завершить замер: обновить счетчики и при необходимости записать в журнал"""
+    elapsed = time.perf_counter() - call.started
+    rows = 0 if error else count_rows(result)
+
+    with _lock:
+        stats = _counters.get(call.name)
+        if stats is None:
+            stats = _counters[call.name] = FunctionStats()
+        stats.calls += 1
+        stats.errors += error
+        stats.total += elapsed
+        stats.rows += rows
+        if elapsed > stats.max:
+            stats.max = elapsed
+
+    if slow_threshold and elapsed >= slow_threshold:
+        _log_slow(call, elapsed, rows, explain)
+
+
+def instrument(func, explain=None):
+    """Обернуть функцию счетчиками; explain(sql) строит план для журнала"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        call = begin(name)
+        try:
+            with bound(call):
+                result = func(*args, **kwargs)
+        except BaseException:
+            finish(call, error=True, explain=explain)
+            raise
+        finish(call, result, explain=explain)
+        return result
+
+    return wrapper
+
+
+def _log_slow(call, elapsed, rows, explain):
+    """Записать медленный вызов в журнал"""
+    global _log_file_attached
+    if DB_SLOW_LOG and not _log_file_attached:
+        handler = logging.FileHandler(DB_SLOW_LOG, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        _logger.addHandler(handler)
+        _log_file_attached = True
+
+    queries = []
+    for sql in call.statements:
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        plan = explain(sql) if explain and keyword in EXPLAINABLE else None
+        queries.append((sql, plan))
+
+    recent_slow.append({
+        'name': call.name,
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'ms': elapsed * 1000,
+        'rows': rows,
+        'queries': queries,
+    })
+
+    lines = [f"🐢 {call.name}: {elapsed * 1000:.1f} мс, строк: {rows}"]
+    for sql, plan in queries:
+        lines.append(f"  SQL: {' '.join(sql.split())}")
+        if plan:
+            lines.append(f"  План: {plan}")
+    _logger.warning('\n'.join(lines))
+
+
+def snapshot():
+    """Счетчики всех функций, по убыванию суммарного времени
+
+    Возвращает список словарей с полями name, calls, errors, total_ms,
+    avg_ms, max_ms, rows.
+    """
+    with _lock:
+        items = [(name, stats.calls, stats.errors, stats.total, stats.max, stats.rows)
+                 for name, stats in _counters.items()]
+    items.sort(key=lambda item: item[3], reverse=True)
+    return [
+        {
+            'name': name,
+            'calls': calls,
+            'errors': errors,
+            'total_ms': total * 1000,
+            'avg_ms': total / calls * 1000 if calls else 0.0,
+            'max_ms': max_ * 1000,
+            'rows': rows,
+        }
+        for name, calls, errors, total, max_, rows in items
+    ]
+
+
+def reset():
+    """Обнулить счетчики и список медленных вызовов"""
+    with _lock:
+        _counters.clear()
+    recent_slow.clear()
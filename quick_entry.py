@@ -0,0 +1,232 @@
+import csv
+import difflib
+import re
+from collections import namedtuple
+
+from keyboards import EXPENSE_CATEGORIES, INCOME_CATEGORIES
+
+# ========== БЫСТРЫЙ ВВОД ТРАНЗАКЦИЙ ==========
+#
+# Расход или доход одним сообщением вместо диалога из трех шагов:
+# "450 еда обед в кафе", "1 200,50 такси", "+50000 зарплата", "5к продукты".
+# Знак "+" - доход, "-" или без знака - расход (без знака доход узнается
+# по категории). Категория ищется среди слов сообщения: по названию
+# с клавиатуры, по синониму ("обед" -> Еда, "зп" -> Зарплата), по началу
+# названия ("разв") или с опечаткой ("транспрт"). Если слово было
+# названием категории, оно не попадает в описание; синоним остается
+# в описании как есть.
+
+_AMOUNT_PATTERN = r'''
+    \A\s*(?P<sign>[+-])?\s*
+    (?P<number>\d{1,3}(?:[  ]\d{3})+|\d+)(?P<fraction>[.,]\d{1,2})?
+    \s*(?P<thousands>к|k|тыс\.?)?
+    (?:\s*(?:р|руб|₽)\.?)?
+'''
+_AMOUNT = re.compile(_AMOUNT_PATTERN + r'(?:\s+(?P<text>.*?))?\s*\Z', re.VERBOSE | re.IGNORECASE | re.DOTALL)
+
+# Сообщение быстрого ввода: одна строка из суммы и, через пробел, слов,
+# первое из которых начинается с буквы. Одно число ("500"), даты и время
+# ("12.05.2024 врач", "15:00 кино") сюда не попадают
+TRIGGER = re.compile(_AMOUNT_PATTERN + r'[ \t]+[^\W\d_][^\n]*?\s*\Z', re.VERBOSE | re.IGNORECASE)
+
+EXPENSE_ALIASES = {
+    'Еда': ('продукты', 'обед', 'ужин', 'завтрак', 'кафе', 'ресторан', 'кофе', 'перекус', 'доставка',
+            'магазин', 'пятерочка', 'перекресток'),
+    'Транспорт': ('такси', 'метро', 'автобус', 'бензин', 'заправка', 'парковка', 'проезд', 'электричка'),
+    'Развлечения': ('кино', 'театр', 'концерт', 'бар', 'игры', 'подписка', 'отпуск'),
+    'Одежда': ('обувь', 'куртка', 'джинсы', 'кроссовки'),
+    'Жилье': ('аренда', 'квартплата', 'коммуналка', 'жкх', 'ипотека', 'ремонт', 'интернет'),
+    'Здоровье': ('аптека', 'лекарства', 'врач', 'стоматолог', 'анализы', 'спорт', 'фитнес'),
+    'Подарки': ('подарок', 'цветы'),
+}
+INCOME_ALIASES = {
+    'Зарплата': ('зп', 'аванс', 'премия', 'получка'),
+    'Подработка': ('фриланс', 'халтура', 'шабашка'),
+    'Инвестиции': ('дивиденды', 'проценты', 'вклад', 'купоны'),
+    'Возврат долга': ('долг', 'вернули'),
+}
+FALLBACK_CATEGORY = {'expense': 'Другое', 'income': 'Прочее'}
+
+# Нечеткое сравнение: минимальная похожесть и длина слова
+FUZZY_CUTOFF = 0.8
+FUZZY_MIN_LENGTH = 4
+# Сколько разобранных слов помнить (кэш сбрасывается целиком)
+LOOKUP_CACHE_SIZE = 10_000
+
+
+class QuickEntry(namedtuple('QuickEntry', 'type amount category description')):
+    """Разобранное сообщение; category None - в сообщении только сумма"""
+    __slots__ = ()
+
+
+def _normalize(word):
+    return word.lower().replace('ё', 'е').strip('.,;:!?()"«»')
+
+
+class _Vocabulary:
+    """Названия и синонимы категорий одного типа транзакций"""
+
+    def __init__(self, categories, aliases):
+        self.names = {_normalize(category): category for category in categories}
+        self.aliases = {_normalize(alias): category
+                        for category, words in aliases.items() for alias in words}
+        self._keys = list(self.names) + list(self.aliases)
+        self._cache = {}
+
+    def lookup(self, word):
+        """(категория, было ли слово названием) или None"""
+        if word not in self._cache:
+            if len(self._cache) >= LOOKUP_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[word] = self._lookup(word)
+        return self._cache[word]
+
+    def _lookup(self, word):
+        if word in self.names:
+            return self.names[word], True
+        if word in self.aliases:
+            return self.aliases[word], False
+        if len(word) < FUZZY_MIN_LENGTH:
+            return None
+        for name, category in self.names.items():
+            if name.startswith(word):
+                return category, True
+        close = difflib.get_close_matches(word, self._keys, n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            key = close[0]
+            return (self.names[key], True) if key in self.names else (self.aliases[key], False)
+        return None
+
+    def match(self, words):
+        """Первая категория среди слов: (категория, индекс, число слов, было ли названием) или None"""
+        normalized = [_normalize(word) for word in words]
+        for i in range(len(words)):
+            # Двухсловные названия вроде "возврат долга" - раньше и только точно:
+            # пар слов слишком много для кэша нечеткого поиска
+            pair = ' '.join(normalized[i:i + 2]) if i + 1 < len(words) else None
+            if pair in self.names:
+                return self.names[pair], i, 2, True
+            if pair in self.aliases:
+                return self.aliases[pair], i, 2, False
+            found = self.lookup(normalized[i])
+            if found is not None:
+                return found[0], i, 1, found[1]
+        return None
+
+
+_VOCABULARIES = {
+    'expense': _Vocabulary(EXPENSE_CATEGORIES, EXPENSE_ALIASES),
+    'income': _Vocabulary(INCOME_CATEGORIES, INCOME_ALIASES),
+}
+
+
+def guess_category(trans_type, text):
+    """Категория типа trans_type по словам текста (названия, синонимы, опечатки) или None"""
+    found = _VOCABULARIES[trans_type].match(text.split())
+    return found[0] if found is not None else None
+
+
+def parse_amount(text):
+    """(знак или None, сумма, остаток текста) или None, если сообщение не начинается с суммы"""
+    match = _AMOUNT.match(text)
+    if match is None:
+        return None
+    amount = float(re.sub(r'[  ]', '', match['number']) + (match['fraction'] or '').replace(',', '.'))
+    if match['thousands']:
+        amount *= 1000
+    if amount <= 0:
+        return None
+    return match['sign'], amount, match['text'] or ''
+
+
+def parse(text, fallback=True):
+    """Разобрать сообщение быстрого ввода в QuickEntry или None
+
+    fallback=False - сообщение с текстом, но без названия или синонима
+    категории, не считается транзакцией (None вместо FALLBACK_CATEGORY).
+    """
+    parsed = parse_amount(text)
+    if parsed is None:
+        return None
+    sign, amount, rest = parsed
+    words = rest.split()
+    if not words:
+        return QuickEntry('income' if sign == '+' else 'expense', amount, None, None)
+
+    if sign == '+':
+        candidates = ('income',)
+    elif sign == '-':
+        candidates = ('expense',)
+    else:
+        candidates = ('expense', 'income')
+
+    for trans_type in candidates:
+        found = _VOCABULARIES[trans_type].match(words)
+        if found is not None:
+            category, index, span, is_name = found
+            if is_name:
+                words = words[:index] + words[index + span:]
+            return QuickEntry(trans_type, amount, category, ' '.join(words) or None)
+
+    if not fallback:
+        return None
+    trans_type = candidates[0]
+    return QuickEntry(trans_type, amount, FALLBACK_CATEGORY[trans_type], rest)
+
+
+# ---------- Пакетный ввод ----------
+
+# Несколько строк, первая начинается с суммы
+BULK_TRIGGER = r'\A\s*[+-]?\s*\d[^\n]*\n\s*\S'
+BULK_MAX_LINES = 1000
+BULK_MAX_FILE_SIZE = 512 * 1024
+BULK_EXTENSIONS = ('.txt', '.csv')
+
+
+def parse_lines(lines):
+    """Разобрать строки пакета: список (номер строки, QuickEntry или None, ошибка или None)
+
+    Пустые строки и строки, начинающиеся с '#', пропускаются.
+    """
+    results = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if len(results) >= BULK_MAX_LINES:
+            results.append((number, None, f"больше {BULK_MAX_LINES} строк, остальные пропущены"))
+            break
+        entry = parse(line)
+        if entry is None:
+            results.append((number, None, f"не найдена сумма: {line[:40]}"))
+        elif entry.category is None:
+            results.append((number, None, f"нет категории или описания: {line[:40]}"))
+        else:
+            results.append((number, entry, None))
+    return results
+
+
+class _SemicolonDialect(csv.excel):
+    """CSV из Excel с русской локалью"""
+    delimiter = ';'
+
+
+def document_lines(data, filename):
+    """Строки .txt или .csv файла; ячейки строки CSV склеиваются через пробел"""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = data.decode('cp1251')
+    lines = text.splitlines()
+    if not filename.lower().endswith('.csv'):
+        return lines
+
+    try:
+        dialect = csv.Sniffer().sniff('\n'.join(lines[:20]), delimiters=';,\t')
+    except csv.Error:
+        dialect = _SemicolonDialect
+    rows = [' '.join(cell.strip() for cell in row if cell.strip()) for row in csv.reader(lines, dialect)]
+    # Заголовок (amount;category;...) - первая строка без суммы
+    if rows and parse_amount(rows[0]) is None:
+        rows[0] = ''
+    return rows
@@ -0,0 +1,56 @@
+from collections import namedtuple
+
+# ========== ТИПИЗИРОВАННЫЕ ЗАПИСИ ==========
+#
+# Записи - подклассы namedtuple с пустыми __slots__: доступ к полям
+# по имени, а в памяти это обычный кортеж (без __dict__ на экземпляр).
+# Порядок полей совпадает с порядком колонок в SELECT из database.py.
+
+
+class Transaction(namedtuple('Transaction', 'id user_id type amount category description date time')):
+    """Транзакция (расход/доход); time - время создания ЧЧ:ММ"""
+    __slots__ = ()
+
+
+class Plan(namedtuple('Plan', 'id user_id title description date time category is_shared '
+                              'notification_enabled notification_time recurrence author')):
+    """План; recurrence - правило повтора или None, author - имя владельца (заполняется для общих планов)"""
+    __slots__ = ()
+
+
+class RecurringTransaction(namedtuple('RecurringTransaction', 'id user_id type amount category description '
+                                                              'recurrence start_date end_date')):
+    """Повторяющаяся транзакция: правило повтора, дата начала и последний день (или None)"""
+    __slots__ = ()
+
+
+class Purchase(namedtuple('Purchase', 'id user_id item_name estimated_cost priority target_date notes status')):
+    """Планируемая покупка"""
+    __slots__ = ()
+
+
+class Reminder(namedtuple('Reminder', 'plan_id user_id title description date time notification_time username '
+                                      'remind_at recurrence')):
+    """Напоминание о плане"""
+    __slots__ = ()
+
+
+def row_factory(record_class):
+    """Фабрика строк sqlite3 для курсора, создающая записи record_class
+
+    tuple.__new__ строит запись прямо из кортежа строки без разбора
+    аргументов, поэтому фабрика почти не добавляет накладных расходов.
+    """
+    new = tuple.__new__
+
+    def factory(cursor, row):
+        return new(record_class, row)
+
+    return factory
+
+
+TRANSACTION_ROW = row_factory(Transaction)
+PLAN_ROW = row_factory(Plan)
+PURCHASE_ROW = row_factory(Purchase)
+RECURRING_ROW = row_factory(RecurringTransaction)
+REMINDER_ROW = row_factory(Reminder)
@@ -0,0 +1,358 @@
+import calendar
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+
+from periods import from_utc, get_zone, to_utc
+
+# ========== ПОВТОРЯЮЩИЕСЯ ПЛАНЫ И ТРАНЗАКЦИИ ==========
+#
+# Правило повтора хранится один раз - строкой в духе RRULE (RFC 5545):
+# 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH', 'FREQ=MONTHLY;BYMONTHDAY=5',
+# 'FREQ=MONTHLY;BYDAY=-1FR', необязательно с UNTIL=ГГГГ-ММ-ДД и COUNT=n.
+# Отсчет идет от даты начала (DTSTART) записи. Даты повторов не хранятся:
+# occurrences() выдает их для запрошенного окна, сразу перескакивая к
+# первому периоду окна, поэтому стоимость зависит от длины окна, а не от
+# того, сколько лет правилу. Исключение - правила с COUNT: номер повтора
+# считается от начала.
+#
+# День месяца, которого нет в коротком месяце (31, 30, 29), переносится
+# на последний день месяца - аренда "31 числа" в феврале приходится на 28-е.
+# n-го дня недели, которого нет в месяце (5-й вторник), в этом месяце нет.
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+WEEKDAY_NAMES = ('пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс')
+
+
+class Rule(namedtuple('Rule', 'freq interval weekdays monthday nth until count')):
+    """Разобранное правило повтора
+
+    weekdays - дни недели (0 - понедельник): для WEEKLY - дни повтора, для
+    MONTHLY вместе с nth - n-й такой день месяца (-1 - последний). monthday -
+    день месяца для MONTHLY (-1 - последний). until - последняя дата (date).
+    """
+    __slots__ = ()
+
+
+def _to_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text):
+    """Строка правила -> Rule; ValueError, если правило неверное"""
+    fields = {}
+    for part in text.upper().replace('RRULE:', '').split(';'):
+        if part.strip():
+            key, _, value = part.partition('=')
+            fields[key.strip()] = value.strip()
+
+    freq = fields.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"неизвестная частота повтора: {freq}")
+    interval = int(fields.pop('INTERVAL', 1))
+    if interval < 1:
+        raise ValueError("INTERVAL должен быть положительным")
+
+    weekdays = ()
+    nth = None
+    byday = fields.pop('BYDAY', '')
+    if byday:
+        days = []
+        for item in byday.split(','):
+            match = re.fullmatch(r'([+-]?\d)?(MO|TU|WE|TH|FR|SA|SU)', item.strip())
+            if match is None:
+                raise ValueError(f"неверный день недели: {item}")
+            if match.group(1):
+                if freq != 'MONTHLY' or nth is not None:
+                    raise ValueError("номер дня недели допустим только один и только для FREQ=MONTHLY")
+                nth = int(match.group(1))
+                if nth == 0 or not -5 <= nth <= 5:
+                    raise ValueError(f"неверный номер дня недели: {nth}")
+            days.append(WEEKDAYS.index(match.group(2)))
+        weekdays = tuple(sorted(set(days)))
+        if freq == 'MONTHLY' and (nth is None or len(weekdays) != 1):
+            raise ValueError("для FREQ=MONTHLY BYDAY - один день с номером, например 2TU или -1FR")
+
+    monthday = fields.pop('BYMONTHDAY', None)
+    if monthday is not None:
+        monthday = int(monthday)
+        if freq != 'MONTHLY' or weekdays or not (1 <= monthday <= 31 or monthday == -1):
+            raise ValueError(f"неверный BYMONTHDAY: {monthday}")
+
+    until = fields.pop('UNTIL', None)
+    until = date.fromisoformat(until[:10]) if until else None
+    count = fields.pop('COUNT', None)
+    count = int(count) if count else None
+    if count is not None and count < 1:
+        raise ValueError("COUNT должен быть положительным")
+    if fields:
+        raise ValueError(f"неподдерживаемые поля правила: {', '.join(fields)}")
+    return Rule(freq, interval, weekdays, monthday, nth, until, count)
+
+
+def format_rule(rule):
+    """Rule -> строка правила (канонический вид)"""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.weekdays:
+        prefix = str(rule.nth) if rule.nth is not None else ''
+        parts.append("BYDAY=" + ','.join(prefix + WEEKDAYS[day] for day in rule.weekdays))
+    if rule.monthday is not None:
+        parts.append(f"BYMONTHDAY={rule.monthday}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={rule.until.isoformat()}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    return ';'.join(parts)
+
+
+# ---------- Развертывание ----------
+
+def _month_day(year, month, rule, start):
+    """Дата повтора MONTHLY в месяце или None"""
+    last = calendar.monthrange(year, month)[1]
+    if rule.nth is not None:
+        weekday = rule.weekdays[0]
+        if rule.nth > 0:
+            first = (weekday - date(year, month, 1).weekday()) % 7 + 1
+            day = first + 7 * (rule.nth - 1)
+        else:
+            day = last - (date(year, month, last).weekday() - weekday) % 7 + 7 * (rule.nth + 1)
+        return date(year, month, day) if 1 <= day <= last else None
+    monthday = rule.monthday if rule.monthday is not None else start.day
+    return date(year, month, last if monthday == -1 else min(monthday, last))
+
+
+def _dates(rule, start, since):
+    """Бесконечный ряд дат повтора не раньше since (since >= start)"""
+    if rule.freq == 'DAILY':
+        skip = -(-(since - start).days // rule.interval)
+        day = start + timedelta(days=skip * rule.interval)
+        step = timedelta(days=rule.interval)
+        while True:
+            yield day
+            day += step
+
+    elif rule.freq == 'WEEKLY':
+        weekdays = rule.weekdays or (start.weekday(),)
+        first_monday = start - timedelta(days=start.weekday())
+        weeks = (since - first_monday).days // 7
+        monday = first_monday + timedelta(weeks=weeks - weeks % rule.interval)
+        step = timedelta(weeks=rule.interval)
+        while True:
+            for weekday in weekdays:
+                day = monday + timedelta(days=weekday)
+                if day >= since:
+                    yield day
+            monday += step
+
+    else:
+        months = (since.year - start.year) * 12 + since.month - start.month
+        index = start.year * 12 + start.month - 1 + months - months % rule.interval
+        while True:
+            year, month = divmod(index, 12)
+            if year > 9999:
+                return
+            day = _month_day(year, month + 1, rule, start)
+            if day is not None and day >= since:
+                yield day
+            index += rule.interval
+
+
+def occurrences(rule, start, since=None, until=None):
+    """Даты повтора правила rule (строка или Rule) от start в окне [since, until)
+
+    Без until и без UNTIL/COUNT в правиле ряд бесконечен - берите next()
+    или itertools.islice.
+    """
+    if isinstance(rule, str):
+        rule = parse_rule(rule)
+    start = _to_date(start)
+    since = max(_to_date(since), start) if since is not None else start
+    end = _to_date(until) if until is not None else None
+    if rule.until is not None and (end is None or rule.until < end):
+        end = rule.until + timedelta(days=1)
+
+    if rule.count is None:
+        for day in _dates(rule, start, since):
+            if end is not None and day >= end:
+                return
+            yield day
+        return
+
+    for number, day in enumerate(_dates(rule, start, start)):
+        if number >= rule.count or (end is not None and day >= end):
+            return
+        if day >= since:
+            yield day
+
+
+def next_occurrence(rule, start, since):
+    """Первая дата повтора не раньше since или None"""
+    return next(occurrences(rule, start, since), None)
+
+
+def next_remind_at(rule, start, clock, zone_name, after):
+    """Момент напоминания (строка UTC) первого повтора позже after (строка UTC) или None
+
+    clock - время 'ЧЧ:ММ' в поясе zone_name.
+    """
+    local_day = from_utc(after).astimezone(get_zone(zone_name)).date()
+    for day in occurrences(rule, start, local_day - timedelta(days=1)):
+        remind_at = to_utc(day, clock, zone_name)
+        if remind_at > after:
+            return remind_at
+    return None
+
+
+def count_occurrences(rule, start, end_date, since, until):
+    """Число повторов в [since, until) с учетом последней даты end_date (включительно)
+
+    Функция SQL recurrence_count: аргументы - строки, пустые границы - NULL.
+    Неверное правило дает 0.
+    """
+    if not rule or not start:
+        return 0
+    try:
+        rule = parse_rule(rule)
+    except ValueError:
+        return 0
+    until = _to_date(until) if until else None
+    if end_date:
+        last = _to_date(end_date) + timedelta(days=1)
+        until = last if until is None or last < until else until
+    if until is None:
+        raise ValueError("окно повторов не ограничено")
+    since = max(_to_date(since), _to_date(start)) if since else _to_date(start)
+    if since >= until:
+        return 0
+    if rule.freq != 'MONTHLY' and rule.count is None and rule.until is None:
+        start = _to_date(start)
+        return _count_before(rule, start, until) - _count_before(rule, start, since)
+    return sum(1 for _ in occurrences(rule, start, since, until))
+
+
+def _count_before(rule, start, day):
+    """Число повторов DAILY или WEEKLY (без UNTIL и COUNT) раньше day (day >= start) - без перебора"""
+    if rule.freq == 'DAILY':
+        return -(-(day - start).days // rule.interval)
+    weekdays = rule.weekdays or (start.weekday(),)
+    cycles, rest = divmod((day - start).days + start.weekday(), 7 * rule.interval)
+    skipped = sum(1 for weekday in weekdays if weekday < start.weekday())
+    return cycles * len(weekdays) + sum(1 for weekday in weekdays if weekday < rest) - skipped
+
+
+# ---------- Ввод и вывод ----------
+
+_WEEKDAY_STEMS = ('понедельн', 'вторник', 'сред', 'четверг', 'пятниц', 'суббот', 'воскресен')
+_ORDINALS = {'перв': 1, 'втор': 2, 'трет': 3, 'четверт': 4, 'четвёрт': 4, 'пят': 5, 'последн': -1}
+
+
+def _weekday(word):
+    for index, stem in enumerate(_WEEKDAY_STEMS):
+        if word.startswith(stem):
+            return index
+    return None
+
+
+def _ordinal(word):
+    if word.isdigit():
+        return int(word)
+    for stem, value in _ORDINALS.items():
+        if word.startswith(stem) and _weekday(word) is None:
+            return value
+    return None
+
+
+def parse_phrase(text, today):
+    """Правило из фразы: 'каждый день', 'каждые 2 недели', 'по понедельникам и пятницам',
+    'по будням', 'каждое 5 число', 'в последний день месяца', 'каждый второй вторник',
+    'в последнюю пятницу месяца' или строка FREQ=...
+
+    today - дата начала (для 'каждую неделю' и 'каждый месяц' - день повтора).
+    Возвращает строку правила или None.
+    """
+    text = text.strip()
+    if text.upper().startswith(('FREQ=', 'RRULE:')):
+        try:
+            return format_rule(parse_rule(text))
+        except ValueError:
+            return None
+
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    numbers = [int(word) for word in words if word.isdigit()]
+    weekdays = sorted({day for day in map(_weekday, words) if day is not None})
+    has = lambda *stems: any(word.startswith(stems) for word in words)
+
+    if has('будн'):
+        weekdays = [0, 1, 2, 3, 4]
+    elif has('выходн'):
+        weekdays = [5, 6]
+
+    if has('месяц', 'ежемесячн', 'числ'):
+        if weekdays and len(weekdays) == 1:
+            nth = next((value for value in map(_ordinal, words) if value is not None), None)
+            if nth is None or not -5 <= nth <= 5 or nth == 0:
+                return None
+            return format_rule(Rule('MONTHLY', 1, (weekdays[0],), None, nth, None, None))
+        if has('последн') and has('ден', 'дн', 'числ'):
+            return format_rule(Rule('MONTHLY', 1, (), -1, None, None, None))
+        monthday = numbers[0] if numbers and has('числ') else today.day
+        interval = numbers[0] if numbers and not has('числ') else 1
+        if not 1 <= monthday <= 31:
+            return None
+        return format_rule(Rule('MONTHLY', interval, (), monthday, None, None, None))
+
+    if weekdays:
+        nth = next((value for value in map(_ordinal, words) if value is not None), None)
+        if nth is not None and len(weekdays) == 1 and not has('недел'):
+            # 'каждый второй вторник' - n-й вторник месяца
+            if not -5 <= nth <= 5 or nth == 0:
+                return None
+            return format_rule(Rule('MONTHLY', 1, tuple(weekdays), None, nth, None, None))
+        interval = numbers[0] if numbers and has('недел') else 1
+        return format_rule(Rule('WEEKLY', interval, tuple(weekdays), None, None, None, None))
+
+    if has('недел', 'еженедельн'):
+        return format_rule(Rule('WEEKLY', numbers[0] if numbers else 1, (today.weekday(),), None, None, None, None))
+    if has('день', 'дня', 'дней', 'ежедневн'):
+        return format_rule(Rule('DAILY', numbers[0] if numbers else 1, (), None, None, None, None))
+    return None
+
+
+def describe(rule):
+    """Правило по-русски для показа пользователю"""
+    if isinstance(rule, str):
+        rule = parse_rule(rule)
+    every = f"каждые {rule.interval}" if rule.interval > 1 else None
+    if rule.freq == 'DAILY':
+        text = f"{every} дн." if every else "каждый день"
+    elif rule.freq == 'WEEKLY':
+        days = ', '.join(WEEKDAY_NAMES[day] for day in rule.weekdays)
+        if every:
+            text = f"{every} нед." + (f" ({days})" if days else "")
+        else:
+            text = f"по {days}" if days else "каждую неделю"
+    else:
+        if rule.nth is not None:
+            day = WEEKDAY_NAMES[rule.weekdays[0]]
+            text = f"{'последний' if rule.nth == -1 else f'{rule.nth}-й'} {day} месяца"
+        elif rule.monthday == -1:
+            text = "последний день месяца"
+        elif rule.monthday is not None:
+            text = f"каждое {rule.monthday} число"
+        else:
+            text = "каждый месяц"
+        if every:
+            text += f", {every} мес."
+    if rule.until is not None:
+        text += f" до {rule.until.isoformat()}"
+    if rule.count is not None:
+        text += f", {rule.count} раз"
+    return text
@@ -1,37 +1,220 @@
+import asyncio
+import logging
+from apscheduler.events import EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
-from database import get_today_reminders
+from apscheduler.triggers.date import DateTrigger
+from datetime import datetime, timedelta, timezone
+import database
+import db_async as db
+import delivery
+import outbox
+import periods
+from config import REMINDER_MISFIRE_GRACE_HOURS
+from job_store import SQLiteJobStore
 
-scheduler = AsyncIOScheduler()
+logger = logging.getLogger(__name__)
 
-async def check_and_send_reminders(bot):
-    """Проверка и отправка напоминаний"""
-    reminders = get_today_reminders()
-    
+# ========== НАПОМИНАНИЯ О ПЛАНАХ ==========
+#
+# Каждое неотправленное напоминание - отдельная задача планировщика на
+# момент plans.remind_at: дата и notification_time плана в часовом поясе
+# автора, переведенные в UTC. Планировщик держит задачи по времени
+# срабатывания и просыпается ровно к ближайшей, без периодического опроса
+# базы. Задачи хранятся в базе (job_store.SQLiteJobStore) и переживают
+# перезапуск. Загружены напоминания до WINDOW вперед - одним проходом
+# диапазона индекса idx_plans_remind_at; раз в час окно сдвигается вперед,
+# и конец окна запоминается в аргументах задачи сдвига. Поэтому после
+# перезапуска читаются только напоминания, вошедшие в окно за время
+# простоя. Задача, пропущенная во время простоя, срабатывает один раз
+# (coalesce), если опоздала не больше чем на MISFIRE_GRACE, иначе
+# считается пропущенной. Изменения планов (add_plan, update_plan,
+# soft_delete_plan) приходят от database.py после commit и переставляют
+# только задачу этого плана. Перед отправкой
+# напоминание отмечается в plans.sent_at, и отметка удается только один
+# раз - поэтому напоминание не приходит дважды. У повторяющегося плана
+# вместо отметки remind_at переходит на следующий повтор, и задача
+# ставится заново: в планировщике всегда не больше одной задачи на план,
+# повторы на месяцы вперед не создаются. Напоминания, сработавшие
+# одновременно, отправляются одной рассылкой (delivery.deliver), а
+# опоздавшие напоминания одного пользователя - одним сообщением.
+
+# На сколько опоздавшее напоминание еще отправлять (и насколько назад
+# смотреть при первом запуске)
+MISFIRE_GRACE = timedelta(hours=REMINDER_MISFIRE_GRACE_HOURS)
+
+scheduler = AsyncIOScheduler(job_defaults={'coalesce': True,
+                                           'misfire_grace_time': int(MISFIRE_GRACE.total_seconds())})
+
+# На сколько вперед держать задачи напоминаний
+WINDOW = timedelta(hours=24)
+# Напоминание, сработавшее позже своего момента больше чем на LATE, считается
+# опоздавшим (бот был недоступен)
+LATE = timedelta(minutes=1)
+# Сколько ждать остальные задачи того же момента, прежде чем начать рассылку (секунд)
+BATCH_WINDOW = 0.5
+# id задачи сдвига окна
+HORIZON_JOB = 'reminders:horizon'
+
+_bot = None
+_loop = None
+_horizon = None  # момент UTC, до которого (не включая) напоминания загружены
+_due = []        # сработавшие задачи (plan_id, remind_at) до рассылки
+
+def _job_id(plan_id):
+    return f'reminder:{plan_id}'
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+def _schedule(reminder):
+    """Поставить (или переставить) задачу напоминания"""
+    scheduler.add_job(fire_reminder, DateTrigger(run_date=periods.from_utc(reminder.remind_at)),
+                      args=[reminder.plan_id, reminder.remind_at],
+                      id=_job_id(reminder.plan_id), replace_existing=True)
+
+def _unschedule(plan_id):
+    job = scheduler.get_job(_job_id(plan_id))
+    if job is not None:
+        job.remove()
+
+async def load_reminders(since, until):
+    """Запланировать неотправленные напоминания с моментом в [since, until) (datetime UTC)"""
+    reminders = await db.get_pending_reminders(since.strftime(periods.UTC_FORMAT), until.strftime(periods.UTC_FORMAT))
     for reminder in reminders:
-        user_id = reminder[1]
-        title = reminder[2]
-        description = reminder[3]
-        notification_time = reminder[8]  # notification_time
-        
-        current_time = datetime.now().strftime('%H:%M')
-        
-        if notification_time and notification_time <= current_time:
-            message = f"🔔 Напоминание!\n\n**{title}**"
-            if description:
-                message += f"\n\n{description}"
-            
-            try:
-                await bot.send_message(user_id, message, parse_mode='Markdown')
-            except Exception as e:
-                print(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
+        _schedule(reminder)
+    return len(reminders)
+
+async def extend_horizon(since=None):
+    """Раз в час: загрузить напоминания, вошедшие в окно [сейчас, сейчас + WINDOW)
+
+    since - конец окна, загруженного в прошлый раз (строка UTC), в том
+    числе до перезапуска бота.
+    """
+    global _horizon
+    now = _utc_now().replace(microsecond=0)
+    if _horizon is None:
+        _horizon = now - MISFIRE_GRACE
+        if since is not None:
+            _horizon = min(max(periods.from_utc(since), _horizon), now + WINDOW)
+    horizon = now + WINDOW
+    if horizon > _horizon:
+        since, _horizon = _horizon, horizon
+        try:
+            count = await load_reminders(since, horizon)
+        except Exception:
+            # Окно возвращается назад: его загрузит следующий запуск задачи
+            _horizon = since
+            logger.exception(f"🔔 Не удалось загрузить напоминания ({since:%Y-%m-%d %H:%M} - "
+                             f"{horizon:%Y-%m-%d %H:%M} UTC)")
+        else:
+            logger.info(f"🔔 Запланировано напоминаний: {count} "
+                        f"({since:%Y-%m-%d %H:%M} - {horizon:%Y-%m-%d %H:%M} UTC)")
+    job = scheduler.get_job(HORIZON_JOB)
+    if job is not None:
+        job.modify(kwargs={'since': _horizon.strftime(periods.UTC_FORMAT)})
+
+async def refresh_reminder(plan_id):
+    """Переставить задачу плана после его изменения"""
+    reminder = await db.get_pending_reminder(plan_id)
+    if reminder is None or _horizon is None or periods.from_utc(reminder.remind_at) >= _horizon \
+            or periods.from_utc(reminder.remind_at) < _utc_now() - MISFIRE_GRACE:
+        _unschedule(plan_id)  # дальние напоминания загрузит extend_horizon
+    else:
+        _schedule(reminder)
+
+def plan_changed(plan_id):
+    """Подписчик database.plan_listeners; вызывается потоком-писателем"""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(lambda: _loop.create_task(refresh_reminder(plan_id)))
+
+async def fire_reminder(plan_id, remind_at):
+    """Задача планировщика: добавить напоминание в ближайшую рассылку"""
+    _due.append((plan_id, remind_at))
+    if len(_due) == 1:
+        _loop.create_task(send_due_reminders())
+
+async def send_due_reminders():
+    """Отметить сработавшие напоминания отправленными и разослать их"""
+    await asyncio.sleep(BATCH_WINDOW)
+    due = _due[:]
+    _due.clear()
+    
+    # План, переехавший в другой шард, приходит с новым id
+    reminders = await asyncio.gather(*(db.get_pending_reminder(plan_id) for plan_id, _ in due))
+    # план удален, напоминание выключено, перенесено или уже отправлено
+    reminders = [reminder for reminder, (_, remind_at) in zip(reminders, due)
+                 if reminder is not None and reminder.remind_at == remind_at]
+    claimed = await asyncio.gather(*(db.mark_reminder_sent(reminder.plan_id, reminder.remind_at)
+                                     for reminder in reminders))
+    # Следующий повтор повторяющихся планов
+    await asyncio.gather(*(refresh_reminder(reminder.plan_id) for reminder, ok in zip(reminders, claimed)
+                           if ok and reminder.recurrence))
+    
+    # Опоздавшие после простоя напоминания пользователя - одним сообщением
+    late_before = (_utc_now() - LATE).strftime(periods.UTC_FORMAT)
+    deliveries = []
+    late = {}
+    for reminder, ok in zip(reminders, claimed):
+        if not ok:
+            continue
+        if reminder.remind_at < late_before:
+            late.setdefault(reminder.user_id, []).append(reminder)
+        else:
+            deliveries.append(delivery.Delivery(reminder.user_id, reminder_text(reminder), 'reminder', 'Markdown'))
+    deliveries[:0] = [delivery.Delivery(user_id, reminder_text(missed[0]) if len(missed) == 1
+                                        else missed_reminders_text(missed), 'reminder', 'Markdown')
+                      for user_id, missed in late.items()]
+    if deliveries:
+        await delivery.deliver(_bot, deliveries, 'напоминания', level=outbox.REMINDER)
+
+def reminder_text(reminder):
+    """Текст напоминания"""
+    message = f"🔔 Напоминание!\n\n**{reminder.title}**"
+    if reminder.description:
+        message += f"\n\n{reminder.description}"
+    return message
+
+def missed_reminders_text(reminders):
+    """Одно сообщение о нескольких напоминаниях, пропущенных, пока бот был недоступен"""
+    lines = [f"• **{reminder.title}** ({reminder.date} {reminder.notification_time})"
+             for reminder in sorted(reminders, key=lambda reminder: reminder.remind_at)]
+    return "🔔 Напоминания, пропущенные пока бот был недоступен:\n\n" + "\n".join(lines)
+
+def reminder_missed(event):
+    """Задача опоздала больше чем на MISFIRE_GRACE (бот долго не работал)"""
+    if event.job_id.startswith('reminder:'):
+        logger.warning(f"⏰ Напоминание {event.job_id} пропущено: опоздание больше {MISFIRE_GRACE}")
+        remind_at = event.scheduled_run_time.astimezone(timezone.utc).strftime(periods.UTC_FORMAT)
+        _loop.create_task(skip_missed_reminder(int(event.job_id.split(':', 1)[1]), remind_at))
+
+async def skip_missed_reminder(plan_id, remind_at):
+    """Перевести пропущенное напоминание повторяющегося плана на следующий повтор"""
+    reminder = await db.get_pending_reminder(plan_id)
+    if reminder is not None and reminder.recurrence and reminder.remind_at == remind_at:
+        if await db.mark_reminder_sent(reminder.plan_id, remind_at):
+            await refresh_reminder(reminder.plan_id)
 
 async def schedule_reminders(bot):
-    """Запланировать проверку напоминаний"""
-    scheduler.add_job(
-        check_and_send_reminders,
-        CronTrigger(minute='*/30'),  # Каждые 30 минут
-        args=[bot]
-    )
-    scheduler.start()
\ No newline at end of file
+    """Запланировать напоминания и следить за изменениями планов"""
+    global _bot, _loop
+    _bot = bot
+    _loop = asyncio.get_running_loop()
+    database.plan_listeners.append(plan_changed)
+    
+    scheduler.add_jobstore(SQLiteJobStore(database.router.pools[0]))
+    scheduler.add_listener(reminder_missed, EVENT_JOB_MISSED)
+    # Пока планировщик на паузе, дозагружаем окно с места, где оно кончилось
+    # до перезапуска; сохраненные задачи напоминаний срабатывают после resume
+    scheduler.start(paused=True)
+    await db.advance_recurring_reminders((_utc_now() - MISFIRE_GRACE).strftime(periods.UTC_FORMAT))
+    job = scheduler.get_job(HORIZON_JOB)
+    await extend_horizon(job.kwargs.get('since') if job is not None else None)
+    scheduler.add_job(extend_horizon, CronTrigger(minute=0), id=HORIZON_JOB, replace_existing=True,
+                      kwargs={'since': _horizon.strftime(periods.UTC_FORMAT)})
+    scheduler.resume()
+
+def stop_reminders():
+    """Остановить планировщик и дописать его задачи в базу (до close_db)"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
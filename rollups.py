@@ -0,0 +1,149 @@
+import sys
+
+# ========== АГРЕГАТЫ ТРАНЗАКЦИЙ ==========
+#
+# daily_totals и monthly_totals хранят сумму и количество транзакций
+# по ключу (пользователь, день/месяц, тип, категория). Функции записи
+# в database.py обновляют их в той же транзакции, что и саму запись,
+# поэтому статистика читает O(дней) строк вместо O(транзакций).
+
+ROLLUP_TABLES = (
+    # (таблица, колонка периода, длина префикса даты)
+    ('daily_totals', 'day', 10),
+    ('monthly_totals', 'month', 7),
+)
+
+# Сумма может расходиться с пересчетом из-за округления REAL
+TOLERANCE = 0.005
+
+
+def create_tables(cursor):
+    """Создать таблицы агрегатов"""
+    for table, column, _ in ROLLUP_TABLES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id INTEGER NOT NULL,
+                {column} TEXT NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, {column}, type, category)
+            ) WITHOUT ROWID
+        ''')
+        # Для сводок по всем пользователям за период
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_{column}
+            ON {table} ({column}, type, category)
+        ''')
+
+
+def apply(cursor, user_id, trans_type, amount, category, trans_date, sign=1):
+    """Добавить (sign=1) или вычесть (sign=-1) транзакцию из агрегатов"""
+    trans_type = trans_type or ''
+    category = category or ''
+    amount = (amount or 0) * sign
+
+    for table, column, length in ROLLUP_TABLES:
+        key = trans_date[:length]
+        cursor.execute(f'''
+            INSERT INTO {table} (user_id, {column}, type, category, total, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, {column}, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''', (user_id, key, trans_type, category, amount, sign))
+        if sign < 0:
+            cursor.execute(f'''
+                DELETE FROM {table}
+                WHERE user_id = ? AND {column} = ? AND type = ? AND category = ? AND count <= 0
+            ''', (user_id, key, trans_type, category))
+
+
+def apply_many(cursor, entries):
+    """Добавить в агрегаты пачку новых транзакций (user_id, type, amount, category, date)
+
+    Строки сначала суммируются по ключу агрегата, поэтому на пачку
+    приходится по одному UPSERT на ключ, а не на транзакцию.
+    """
+    for table, column, length in ROLLUP_TABLES:
+        totals = {}
+        for user_id, trans_type, amount, category, trans_date in entries:
+            key = (user_id, trans_date[:length], trans_type or '', category or '')
+            total, count = totals.get(key, (0, 0))
+            totals[key] = (total + (amount or 0), count + 1)
+        cursor.executemany(f'''
+            INSERT INTO {table} (user_id, {column}, type, category, total, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, {column}, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        ''', [key + value for key, value in totals.items()])
+
+
+def _aggregate_sql(column, length):
+    """Пересчет агрегата из сырых транзакций"""
+    return f'''
+        SELECT user_id, substr(date, 1, {length}) as {column},
+               COALESCE(type, '') as type, COALESCE(category, '') as category,
+               SUM(COALESCE(amount, 0)) as total, COUNT(*) as count
+        FROM transactions
+        WHERE is_deleted = 0
+        GROUP BY user_id, {column}, type, category
+    '''
+
+
+def rebuild(cursor):
+    """Полностью пересчитать агрегаты из таблицы transactions"""
+    for table, column, length in ROLLUP_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f'''
+            INSERT INTO {table} (user_id, {column}, type, category, total, count)
+            {_aggregate_sql(column, length)}
+        ''')
+
+
+def verify(cursor):
+    """Сравнить агрегаты с сырыми данными, вернуть список расхождений"""
+    mismatches = []
+    for table, column, length in ROLLUP_TABLES:
+        cursor.execute(f"SELECT user_id, {column}, type, category, total, count FROM {table}")
+        stored = {row[:4]: row[4:] for row in cursor.fetchall()}
+        cursor.execute(_aggregate_sql(column, length))
+        expected = {row[:4]: row[4:] for row in cursor.fetchall()}
+
+        for key in stored.keys() | expected.keys():
+            have = stored.get(key, (0, 0))
+            want = expected.get(key, (0, 0))
+            if have[1] != want[1] or abs(have[0] - want[0]) > TOLERANCE:
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+
+def main(argv):
+    """Командная строка: python rollups.py verify|rebuild"""
+    import database
+
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command not in ('verify', 'rebuild'):
+        print("Использование: python rollups.py verify|rebuild")
+        return 2
+
+    try:
+        if command == 'rebuild':
+            database.rebuild_rollups()
+            print("✅ Агрегаты пересчитаны")
+            return 0
+
+        mismatches = database.verify_rollups()
+        for table, key, have, want in mismatches:
+            print(f"❌ {table} {key}: в агрегате {have}, по транзакциям {want}")
+        if mismatches:
+            print(f"Найдено расхождений: {len(mismatches)}")
+            return 1
+        print("✅ Агрегаты совпадают с транзакциями")
+        return 0
+    finally:
+        database.close_db()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,150 @@
+import inspect
+
+from aiogram.dispatcher.filters.state import State
+from aiogram.dispatcher.handler import SkipHandler
+
+# ========== ТАБЛИЦА МАРШРУТОВ КНОПОК ==========
+#
+# aiogram проверяет фильтры обработчиков по очереди, поэтому каждое нажатие
+# inline-кнопки проходило всю цепочку lambda c: c.data.startswith(...),
+# а каждое сообщение - все сравнения message.text == '...'. Здесь обработчики
+# лежат в таблице: точные значения callback_data и тексты кнопок меню -
+# в словарях, префиксы вида 'edit_amount_expense_' - в дереве по сегментам
+# между '_'. Поиск стоит одного разбора callback_data и нескольких обращений
+# к словарям при любом числе обработчиков. Остаток callback_data после
+# префикса (номер записи, категория) обработчик получает в аргументе payload.
+
+# Обработчик для любого состояния FSM (как state='*' в aiogram)
+ANY_STATE = '*'
+
+
+def _state_key(state):
+    return state.state if isinstance(state, State) else state
+
+
+class _Route:
+    """Обработчик и то, какие из аргументов state/payload он принимает"""
+    __slots__ = ('handler', 'wants_state', 'wants_payload')
+
+    def __init__(self, handler):
+        parameters = inspect.signature(handler).parameters
+        self.handler = handler
+        self.wants_state = 'state' in parameters
+        self.wants_payload = 'payload' in parameters
+
+    def __call__(self, event, state, payload):
+        kwargs = {}
+        if self.wants_state:
+            kwargs['state'] = state
+        if self.wants_payload:
+            kwargs['payload'] = payload
+        return self.handler(event, **kwargs)
+
+
+class _Node:
+    """Узел дерева префиксов: сегмент -> дочерний узел, состояние -> маршрут"""
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = {}
+        self.routes = {}
+
+
+def _add(routes, state, handler, key):
+    state = _state_key(state)
+    if state in routes:
+        raise ValueError(f"Обработчик для {key!r} в состоянии {state!r} уже зарегистрирован")
+    routes[state] = _Route(handler)
+
+
+def _pick(routes, state):
+    return routes.get(state) or routes.get(ANY_STATE)
+
+
+class Router:
+    """Обработчики callback_data и текстов кнопок меню с поиском за O(1)
+
+    Как и в aiogram, обработчик без state срабатывает только вне диалога,
+    state=ANY_STATE - в любом состоянии. Если обработчика нет, обновление
+    передается следующим обработчикам диспетчера.
+    """
+
+    def __init__(self):
+        self._exact = {}          # callback_data -> {состояние: маршрут}
+        self._prefixes = _Node()  # префиксы callback_data по сегментам
+        self._depth = 0           # длина самого длинного префикса в сегментах
+        self._texts = {}          # текст кнопки -> {состояние: маршрут}
+
+    def callback(self, data, state=None):
+        """Декоратор обработчика нажатия
+
+        data - точное значение callback_data или префикс, оканчивающийся на '_'.
+        Из нескольких подходящих префиксов выбирается самый длинный.
+        """
+        def decorator(handler):
+            if data.endswith('_'):
+                segments = data[:-1].split('_')
+                node = self._prefixes
+                for segment in segments:
+                    node = node.children.setdefault(segment, _Node())
+                self._depth = max(self._depth, len(segments))
+                _add(node.routes, state, handler, data)
+            else:
+                _add(self._exact.setdefault(data, {}), state, handler, data)
+            return handler
+        return decorator
+
+    def text(self, text, state=None):
+        """Декоратор обработчика кнопки меню с текстом text"""
+        def decorator(handler):
+            _add(self._texts.setdefault(text, {}), state, handler, text)
+            return handler
+        return decorator
+
+    def resolve_callback(self, data, state=None):
+        """(маршрут, payload) для callback_data в состоянии state, (None, None) - не найден"""
+        routes = self._exact.get(data)
+        if routes is not None:
+            route = _pick(routes, state)
+            if route is not None:
+                return route, ''
+
+        found = None, None
+        segments = data.split('_', self._depth)
+        node = self._prefixes
+        # Последний элемент - остаток строки, он не может быть частью префикса
+        for i in range(len(segments) - 1):
+            node = node.children.get(segments[i])
+            if node is None:
+                break
+            route = _pick(node.routes, state)
+            if route is not None:
+                found = route, '_'.join(segments[i + 1:])
+        return found
+
+    def resolve_text(self, text, state=None):
+        """Маршрут кнопки меню с текстом text в состоянии state или None"""
+        routes = self._texts.get(text)
+        return _pick(routes, state) if routes is not None else None
+
+    # ---------- Подключение к диспетчеру ----------
+
+    def _is_menu_text(self, message):
+        return message.text in self._texts
+
+    async def _dispatch_text(self, message, state):
+        route = self.resolve_text(message.text, await state.get_state())
+        if route is None:
+            raise SkipHandler()
+        await route(message, state, None)
+
+    async def _dispatch_callback(self, callback_query, state):
+        route, payload = self.resolve_callback(callback_query.data or '', await state.get_state())
+        if route is None:
+            raise SkipHandler()
+        await route(callback_query, state, payload)
+
+    def setup(self, dispatcher):
+        """Зарегистрировать в диспетчере по одному обработчику сообщений и нажатий"""
+        dispatcher.register_message_handler(self._dispatch_text, self._is_menu_text, state=ANY_STATE)
+        dispatcher.register_callback_query_handler(self._dispatch_callback, state=ANY_STATE)
@@ -0,0 +1,102 @@
+import re
+import sqlite3
+
+# ========== ПОЛНОТЕКСТОВЫЙ ПОИСК (FTS5) ==========
+#
+# Для transactions, plans и planned_purchases создаются FTS5-таблицы
+# с внешним содержимым (content=...), которые синхронизируются триггерами.
+# unicode61 приводит регистр для кириллицы, но не сводит "ё" к "е",
+# поэтому текст нормализуется при индексации и в запросе.
+# Индексы префиксов ускоряют поиск по началу слова.
+# Если SQLite собран без FTS5, функции поиска используют LIKE.
+
+TOKENIZER = 'unicode61 remove_diacritics 2'
+PREFIXES = '2 3 4'
+
+# (FTS-таблица, таблица с данными, индексируемые колонки)
+FTS_TABLES = (
+    ('transactions_fts', 'transactions', ('description', 'category')),
+    ('plans_fts', 'plans', ('title', 'description')),
+    ('purchases_fts', 'planned_purchases', ('item_name', 'notes')),
+)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _normalized(expr):
+    """SQL-выражение с заменой ё на е"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts5_available():
+    """Проверить, собран ли SQLite с поддержкой FTS5"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+available = _fts5_available()
+
+
+def create_tables(cursor):
+    """Создать FTS-таблицы и триггеры, проиндексировать существующие данные"""
+    if not available:
+        return
+
+    for fts, table, columns in FTS_TABLES:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+        exists = cursor.fetchone() is not None
+
+        cols = ', '.join(columns)
+        new_cols = ', '.join(_normalized(f'new.{col}') for col in columns)
+        old_cols = ', '.join(_normalized(f'old.{col}') for col in columns)
+
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols},
+                content='{table}', content_rowid='id',
+                tokenize='{TOKENIZER}', prefix='{PREFIXES}'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        ''')
+        # Переиндексируем только при изменении текстовых колонок
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        ''')
+
+        # 'rebuild' взял бы ненормализованный текст, поэтому индексируем вручную
+        if not exists:
+            cursor.execute(f'''
+                INSERT INTO {fts} (rowid, {cols})
+                SELECT id, {', '.join(_normalized(col) for col in columns)} FROM {table}
+            ''')
+
+
+def match_query(search_text):
+    """Преобразовать текст пользователя в запрос MATCH
+
+    Каждое слово ищется по префиксу, все слова должны встретиться.
+    Возвращает None, если в тексте нет слов.
+    """
+    text = (search_text or '').replace('ё', 'е').replace('Ё', 'Е')
+    words = _WORD_RE.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
@@ -0,0 +1,753 @@
+import os
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from db_pool import ConnectionPool
+
+# ========== ШАРДИРОВАНИЕ ПО ДОМОХОЗЯЙСТВАМ ==========
+#
+# Все данные домохозяйства (участники, записи, агрегаты) лежат в одном
+# файле SQLite - шарде. Какой шард у домохозяйства, записано в справочнике
+# (отдельный файл); пользователь без домохозяйства живет в шарде,
+# выбранном стабильным хэшем его id. Справочник кэшируется в памяти,
+# кэш сбрасывается, как только справочник меняет другое подключение
+# (PRAGMA data_version), поэтому перенос из другого процесса виден сразу.
+#
+# id записей шарда k выдаются из диапазона [k << 40, (k + 1) << 40):
+# шард записи виден по ее id без обращения к справочнику. При переносе
+# домохозяйства записи получают новые id в диапазоне целевого шарда,
+# id домохозяйств при нескольких шардах выдает справочник.
+#
+# Выбор шарда для записи и ее выполнение разделены очередью писателя,
+# поэтому поток-писатель перед операцией еще раз сверяет домохозяйство
+# со справочником (fenced): если оно переносится или уже в другом шарде,
+# операция завершается HouseholdMovedError и направляется заново. Перенос
+# после пометки "переносится" ставит в очередь исходного шарда пустую
+# запись: все, что писатель выполнил до нее, попадет в копию, а все
+# последующее увидит пометку.
+#
+# Прежние id перенесенных записей остаются в справочнике (moved_records):
+# по старому id - из кнопки, незаконченного диалога, задачи напоминания -
+# запись находится в новом шарде (resolve_record). Сохранить сами id
+# нельзя: AUTOINCREMENT целевого шарда продолжил бы счет с чужого диапазона.
+#
+# С одним шардом (по умолчанию) справочник не создается и вся
+# маршрутизация сводится к одному пулу.
+
+SHARD_ID_BITS = 40
+
+# Таблицы с автоинкрементными id записей
+RECORD_TABLES = ('transactions', 'plans', 'planned_purchases', 'recurring_transactions')
+# Таблицы, строки которых при переносе получают новые id: записи и
+# недоставленные сообщения (их id не уникальны между шардами)
+RENUMBERED_TABLES = RECORD_TABLES + ('delivery_dead_letters',)
+
+# Сколько запись ждет окончания переноса домохозяйства
+MOVE_WAIT_TIMEOUT = 30
+
+_MEMBERS = 'SELECT user_id FROM household_members WHERE household_id = ?'
+
+# Строки домохозяйства: (таблица, условие с одним параметром - household_id).
+# Порядок - порядок удаления: условия по участникам раньше самих участников
+HOUSEHOLD_SCOPE = (
+    ('transactions', 'household_id = ?'),
+    ('plans', 'household_id = ?'),
+    ('planned_purchases', 'household_id = ?'),
+    ('recurring_transactions', 'household_id = ?'),
+    ('delivery_dead_letters', f'user_id IN ({_MEMBERS})'),
+    ('daily_totals', f'user_id IN ({_MEMBERS})'),
+    ('monthly_totals', f'user_id IN ({_MEMBERS})'),
+    ('users', f'id IN ({_MEMBERS})'),
+    ('household_members', 'household_id = ?'),
+    ('households', 'id = ?'),
+)
+
+# Строки пользователя, которые переезжают вместе с ним (параметр - user_id);
+# членство в домохозяйстве не копируется - его создает вступление
+USER_SCOPE = (
+    ('transactions', 'user_id = ?'),
+    ('plans', 'user_id = ?'),
+    ('planned_purchases', 'user_id = ?'),
+    ('recurring_transactions', 'user_id = ?'),
+    ('delivery_dead_letters', 'user_id = ?'),
+    ('daily_totals', 'user_id = ?'),
+    ('monthly_totals', 'user_id = ?'),
+    ('users', 'id = ?'),
+)
+
+DIRECTORY_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS household_shards (
+        household_id INTEGER PRIMARY KEY,
+        shard INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'active' CHECK(state IN ('active', 'moving')),
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_households (
+        user_id INTEGER PRIMARY KEY,
+        household_id INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_user_households_household ON user_households (household_id)',
+    # Выдача id домохозяйств: AUTOINCREMENT не повторяет id удаленных
+    'CREATE TABLE IF NOT EXISTS household_ids (id INTEGER PRIMARY KEY AUTOINCREMENT)',
+    # Новые id записей, перенесенных в другой шард
+    '''
+    CREATE TABLE IF NOT EXISTS moved_records (
+        table_name TEXT NOT NULL,
+        old_id INTEGER NOT NULL,
+        new_id INTEGER NOT NULL,
+        PRIMARY KEY (table_name, old_id)
+    ) WITHOUT ROWID
+    ''',
+)
+
+
+class ShardMovingError(Exception):
+    """Домохозяйство не удалось дождаться после переноса между шардами"""
+
+
+class HouseholdMovedError(ShardMovingError):
+    """Операция записи дошла до шарда, откуда домохозяйство переносится или уже перенесено"""
+
+
+def gather(futures):
+    """Future, который завершается вместе со всеми futures; результат - список их результатов"""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        for future in futures:
+            error = CancelledError() if future.cancelled() else future.exception()
+            if error is not None:
+                combined.set_exception(error)
+                return
+        combined.set_result([future.result() for future in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
+
+
+def _raise_sequence(cursor, table, value):
+    """Поднять счетчик AUTOINCREMENT таблицы до value (не опуская его)"""
+    cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, value))
+    elif row[0] < value:
+        cursor.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (value, table))
+
+
+class ShardRouter:
+    """Пулы подключений шардов и выбор шарда по пользователю, домохозяйству или id записи
+
+    paths - файлы шардов, первым идет файл с уже существующими данными.
+    directory_path - файл справочника (используется только при нескольких шардах).
+    Остальные аргументы передаются в ConnectionPool каждого шарда.
+    """
+
+    def __init__(self, paths, directory_path, **pool_kwargs):
+        self.paths = list(paths)
+        self.pools = [ConnectionPool(path, **pool_kwargs) for path in self.paths]
+        self.single = len(self.pools) == 1
+
+        directory_kwargs = dict(pool_kwargs, trace_callback=None)
+        self.directory = None if self.single else ConnectionPool(directory_path, **directory_kwargs)
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+        self._cache_lock = threading.Lock()
+        self._generation = 0
+        self._households = {}  # household_id -> (shard, state)
+        self._users = {}       # user_id -> household_id (0 - без домохозяйства)
+        self._moving = frozenset()
+
+    # ---------- Справочник ----------
+
+    @contextmanager
+    def _directory_reader(self):
+        """Подключение к справочнику; сбросить кэш, если справочник изменился"""
+        with self.directory.reader() as conn:
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != getattr(self._local, 'version', None):
+                moving = frozenset(row[0] for row in conn.execute(
+                    "SELECT household_id FROM household_shards WHERE state = 'moving'"
+                ))
+                with self._cache_lock:
+                    self._generation += 1
+                    self._households.clear()
+                    self._users.clear()
+                    self._moving = moving
+                self._local.version = version
+            yield conn
+
+    def _remember(self, cache, key, value, generation):
+        """Положить значение в кэш, если его не сбросили, пока оно читалось"""
+        with self._cache_lock:
+            if generation == self._generation:
+                cache[key] = value
+
+    def locate(self, household_id):
+        """(шард, состояние) домохозяйства по справочнику или None, если его там нет"""
+        with self._directory_reader() as conn:
+            location = self._households.get(household_id)
+            if location is None:
+                generation = self._generation
+                row = conn.execute(
+                    'SELECT shard, state FROM household_shards WHERE household_id = ?', (household_id,)
+                ).fetchone()
+                location = tuple(row) if row else ()
+                self._remember(self._households, household_id, location, generation)
+        return location or None
+
+    def household_location(self, household_id):
+        """(шард, состояние) домохозяйства; неизвестное - (0, 'active')"""
+        if self.single:
+            return 0, 'active'
+        return self.locate(household_id) or (0, 'active')
+
+    def user_household(self, user_id):
+        """id домохозяйства пользователя по справочнику (None - не состоит)"""
+        with self._directory_reader() as conn:
+            household_id = self._users.get(user_id)
+            if household_id is None:
+                generation = self._generation
+                row = conn.execute(
+                    'SELECT household_id FROM user_households WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                household_id = row[0] if row else 0
+                self._remember(self._users, user_id, household_id, generation)
+        return household_id or None
+
+    def moving(self):
+        """id домохозяйств, которые сейчас переносятся"""
+        if self.single:
+            return frozenset()
+        with self._directory_reader():
+            return self._moving
+
+    def _write_directory(self, operation):
+        """Изменить справочник и дождаться commit"""
+        return self.directory.write(operation)
+
+    def allocate_household_id(self):
+        """Новый id домохозяйства, уникальный для всех шардов"""
+        def operation(cursor):
+            cursor.execute('INSERT INTO household_ids DEFAULT VALUES')
+            household_id = cursor.lastrowid
+            cursor.execute('DELETE FROM household_ids WHERE id < ?', (household_id,))
+            return household_id
+        return self._write_directory(operation)
+
+    def register_household(self, household_id, shard, members=(), removed=None):
+        """Записать шард домохозяйства (если его еще нет в справочнике) и его участников
+
+        removed - прежнее домохозяйство участника, которое опустело
+        и удалено из шарда.
+        """
+        def operation(cursor):
+            cursor.execute('''
+                INSERT OR IGNORE INTO household_shards (household_id, shard, state) VALUES (?, ?, 'active')
+            ''', (household_id, shard))
+            cursor.executemany(
+                'INSERT OR REPLACE INTO user_households (user_id, household_id) VALUES (?, ?)',
+                [(user_id, household_id) for user_id in members]
+            )
+            if removed is not None and removed != household_id:
+                cursor.execute('DELETE FROM household_shards WHERE household_id = ?', (removed,))
+        self._write_directory(operation)
+
+    def record_moves(self, moved):
+        """Запомнить новые id перенесенных записей: {таблица: [(старый id, новый id)]}
+
+        Записи, уже переносившиеся раньше, ведут сразу к последнему id.
+        """
+        def operation(cursor):
+            for table, pairs in moved.items():
+                if table not in RECORD_TABLES:
+                    continue
+                cursor.executemany(
+                    'UPDATE moved_records SET new_id = ? WHERE table_name = ? AND new_id = ?',
+                    [(new_id, table, old_id) for old_id, new_id in pairs]
+                )
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO moved_records (table_name, old_id, new_id) VALUES (?, ?, ?)',
+                    [(table, old_id, new_id) for old_id, new_id in pairs]
+                )
+        if moved:
+            self._write_directory(operation)
+
+    def resolve_record(self, table, record_id):
+        """Новый id записи, перенесенной в другой шард, или None"""
+        if self.single:
+            return None
+        with self.directory.reader() as conn:
+            row = conn.execute('SELECT new_id FROM moved_records WHERE table_name = ? AND old_id = ?',
+                               (table, record_id)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, household_id, state, shard=None):
+        """Пометить домохозяйство переносимым/активным и при необходимости сменить шард"""
+        def operation(cursor):
+            cursor.execute('''
+                UPDATE household_shards
+                SET state = ?, shard = COALESCE(?, shard), updated_at = CURRENT_TIMESTAMP
+                WHERE household_id = ?
+            ''', (state, shard, household_id))
+        self._write_directory(operation)
+
+    def init_directory(self):
+        """Создать справочник и занести в него домохозяйства, которые уже есть в шардах
+
+        Существующие записи справочника не меняются. Счетчики id записей
+        шардов поднимаются до начала их диапазонов.
+        """
+        if self.single:
+            return
+
+        def read_memberships(pool):
+            with pool.reader() as conn:
+                households = [row[0] for row in conn.execute('SELECT id FROM households')]
+                members = conn.execute('SELECT user_id, household_id FROM household_members').fetchall()
+            return households, members
+
+        located = self.fan_out(read_memberships)
+
+        def operation(cursor):
+            for statement in DIRECTORY_SCHEMA:
+                cursor.execute(statement)
+            top = 0
+            for shard, (households, members) in enumerate(located):
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO household_shards (household_id, shard) VALUES (?, ?)',
+                    [(household_id, shard) for household_id in households]
+                )
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO user_households (user_id, household_id) VALUES (?, ?)', members
+                )
+                top = max([top, *households])
+            _raise_sequence(cursor, 'household_ids', top)
+        self._write_directory(operation)
+
+        for shard, pool in enumerate(self.pools):
+            def seed(cursor, start=shard << SHARD_ID_BITS):
+                for table in RECORD_TABLES:
+                    _raise_sequence(cursor, table, start)
+            pool.write(seed)
+
+    # ---------- Маршрутизация ----------
+
+    def home_shard(self, key):
+        """Шард по стабильному хэшу (crc32 не меняется между запусками, в отличие от hash())"""
+        return zlib.crc32(str(key).encode()) % len(self.pools)
+
+    def record_shard(self, record_id):
+        """Шард записи по диапазону ее id"""
+        shard = record_id >> SHARD_ID_BITS
+        return shard if 0 <= shard < len(self.pools) else 0
+
+    def user_shard(self, user_id, write=False):
+        """Номер шарда пользователя; для записи - дождаться окончания переноса"""
+        if self.single:
+            return 0
+        household_id = self.user_household(user_id)
+        if household_id is None:
+            return self.home_shard(user_id)
+        return self.household_shard(household_id, write)
+
+    def household_shard(self, household_id, write=False):
+        """Номер шарда домохозяйства; для записи - дождаться окончания переноса"""
+        deadline = time.monotonic() + MOVE_WAIT_TIMEOUT
+        while True:
+            shard, state = self.household_location(household_id)
+            if state == 'active' or not write:
+                return shard
+            if time.monotonic() > deadline:
+                raise ShardMovingError(f"Домохозяйство {household_id} переносится дольше {MOVE_WAIT_TIMEOUT} с")
+            time.sleep(0.05)
+
+    def for_user(self, user_id, write=False):
+        """Пул шарда пользователя"""
+        return self.pools[self.user_shard(user_id, write)]
+
+    def for_household(self, household_id, write=False):
+        """Пул шарда домохозяйства"""
+        if self.single:
+            return self.pools[0]
+        return self.pools[self.household_shard(household_id, write)]
+
+    def for_record(self, table, record_id, write=False):
+        """Пул шарда записи; запись ждет, если ее домохозяйство переносится"""
+        if self.single:
+            return self.pools[0]
+        pool = self.pools[self.record_shard(record_id)]
+        if write and self.moving():
+            with pool.reader() as conn:
+                row = conn.execute(f'SELECT household_id FROM {table} WHERE id = ?', (record_id,)).fetchone()
+            if row and row[0] is not None:
+                self.household_shard(row[0], write=True)
+        return pool
+
+    def fenced(self, pool, household_of, operation):
+        """Операция записи в pool, которая в потоке-писателе сверяет домохозяйство со справочником
+
+        household_of(cursor) - id домохозяйства, которого касается операция
+        (None - не проверять). Если домохозяйство переносится или его шард -
+        не pool, операция не выполняется: HouseholdMovedError.
+        """
+        if self.single:
+            return operation
+
+        def checked(cursor):
+            household_id = household_of(cursor)
+            location = self.locate(household_id) if household_id is not None else None
+            if location is not None and (location[1] == 'moving' or self.pools[location[0]] is not pool):
+                raise HouseholdMovedError(f"Домохозяйство {household_id} переносится в другой шард")
+            return operation(cursor)
+        return checked
+
+    # ---------- Все шарды ----------
+
+    def _get_executor(self):
+        """Пул потоков для параллельного обхода шардов"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=len(self.pools),
+                                                        thread_name_prefix='shard')
+        return self._executor
+
+    def fan_out(self, func):
+        """Выполнить func(pool) на всех шардах параллельно, результаты - по порядку шардов"""
+        if self.single:
+            return [func(self.pools[0])]
+        executor = self._get_executor()
+        futures = [executor.submit(func, pool) for pool in self.pools]
+        return [future.result() for future in futures]
+
+    def submit_write_all(self, operation):
+        """Поставить операцию записи в очередь каждого шарда; Future со списком результатов"""
+        return gather([pool.submit_write(operation) for pool in self.pools])
+
+    def interrupt(self, thread_id):
+        """Прервать чтение потока thread_id во всех шардах и в справочнике"""
+        for pool in self.pools:
+            pool.interrupt(thread_id)
+        if self.directory is not None:
+            self.directory.interrupt(thread_id)
+
+    def close(self):
+        """Закрыть пулы шардов и справочника"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for pool in self.pools:
+            pool.close()
+        if self.directory is not None:
+            self.directory.close()
+
+
+# ========== ПЕРЕНОС МЕЖДУ ШАРДАМИ ==========
+
+def _read_scope(pool, scope, key):
+    """Прочитать строки области одним снимком: {таблица: (колонки, строки)}"""
+    rows = {}
+    with pool.reader() as conn:
+        conn.execute('BEGIN')
+        try:
+            for table, condition in scope:
+                cursor = conn.execute(f'SELECT * FROM {table} WHERE {condition}', (key,))
+                rows[table] = ([column[0] for column in cursor.description], cursor.fetchall())
+        finally:
+            conn.execute('COMMIT')
+    return rows
+
+
+def _delete_scope(cursor, scope, key):
+    """Удалить строки области (в порядке scope)"""
+    for table, condition in scope:
+        cursor.execute(f'DELETE FROM {table} WHERE {condition}', (key,))
+
+
+def _insert_rows(cursor, rows):
+    """Вставить прочитанные строки; записи получают новые id в диапазоне шарда
+
+    Возвращает {таблица: [(старый id, новый id)]} для RENUMBERED_TABLES.
+    """
+    moved = {}
+    for table, (columns, values) in rows.items():
+        if not values:
+            continue
+        if table in RENUMBERED_TABLES:
+            id_index = columns.index('id')
+            keep = [index for index, column in enumerate(columns) if column != 'id']
+            statement = (f"INSERT INTO {table} ({', '.join(columns[index] for index in keep)}) "
+                         f"VALUES ({', '.join('?' * len(keep))})")
+            pairs = moved[table] = []
+            for row in values:
+                cursor.execute(statement, [row[index] for index in keep])
+                pairs.append((row[id_index], cursor.lastrowid))
+            continue
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values
+        )
+    return moved
+
+
+def _flush_writes(pool):
+    """Дождаться записей, которые писатель выполнил до пометки "переносится"
+
+    Очередь писателя - FIFO, а операции после пустой записи проверяют
+    пометку сами (ShardRouter.fenced) и в исходный шард не попадут.
+    """
+    pool.write(lambda cursor: None)
+
+
+def move_household(router, household_id, target):
+    """Перенести домохозяйство в шард target без остановки бота
+
+    Запись в домохозяйство ждет, пока оно помечено "переносится";
+    чтение до переключения справочника идет в исходный шард. Новые id
+    записей попадают в справочник раньше, чем исходные строки удаляются.
+    Возвращает число перенесенных строк.
+    """
+    source, state = router.household_location(household_id)
+    if source == target:
+        return 0
+    if state == 'moving':
+        raise ShardMovingError(f"Домохозяйство {household_id} уже переносится")
+
+    router.set_state(household_id, 'moving')
+    try:
+        _flush_writes(router.pools[source])
+        rows = _read_scope(router.pools[source], HOUSEHOLD_SCOPE, household_id)
+
+        def copy(cursor):
+            # Остатки прерванного переноса в целевом шарде
+            _delete_scope(cursor, HOUSEHOLD_SCOPE, household_id)
+            return _insert_rows(cursor, rows)
+        router.record_moves(router.pools[target].write(copy))
+    except BaseException:
+        router.set_state(household_id, 'active')
+        raise
+
+    router.set_state(household_id, 'active', shard=target)
+    router.pools[source].write(lambda cursor: _delete_scope(cursor, HOUSEHOLD_SCOPE, household_id))
+    return sum(len(values) for _, values in rows.values())
+
+
+def move_user(router, user_id, target):
+    """Перенести записи пользователя в шард target (перед вступлением в домохозяйство этого шарда)
+
+    Пользователь выходит из прежнего домохозяйства; если в нем никого
+    не осталось, оно удаляется. На время переноса прежнее домохозяйство
+    помечено "переносится".
+    """
+    source = router.user_shard(user_id)
+    if source == target:
+        return
+    household_id = router.user_household(user_id)
+    if household_id is not None:
+        router.set_state(household_id, 'moving')
+    try:
+        _flush_writes(router.pools[source])
+        rows = _read_scope(router.pools[source], USER_SCOPE, user_id)
+
+        def copy(cursor):
+            _delete_scope(cursor, USER_SCOPE, user_id)
+            return _insert_rows(cursor, rows)
+        router.record_moves(router.pools[target].write(copy))
+
+        def remove(cursor):
+            _delete_scope(cursor, USER_SCOPE, user_id)
+            cursor.execute('DELETE FROM household_members WHERE user_id = ?', (user_id,))
+            if household_id is not None:
+                cursor.execute('''
+                    DELETE FROM households
+                    WHERE id = ? AND NOT EXISTS (SELECT 1 FROM household_members WHERE household_id = ?)
+                ''', (household_id, household_id))
+                return cursor.rowcount > 0
+            return False
+        emptied = router.pools[source].write(remove)
+    finally:
+        if household_id is not None:
+            router.set_state(household_id, 'active')
+
+    def forget(cursor):
+        cursor.execute('DELETE FROM user_households WHERE user_id = ?', (user_id,))
+        if emptied:
+            cursor.execute('DELETE FROM household_shards WHERE household_id = ?', (household_id,))
+    router._write_directory(forget)
+
+
+def household_sizes(router):
+    """Размер домохозяйств по шардам: [{household_id: число записей}]"""
+    def count(pool):
+        sizes = {}
+        with pool.reader() as conn:
+            for row in conn.execute('SELECT id FROM households'):
+                sizes[row[0]] = 0
+            for table in RECORD_TABLES:
+                for household_id, rows in conn.execute(
+                    f'SELECT household_id, COUNT(*) FROM {table} WHERE household_id IS NOT NULL GROUP BY household_id'
+                ):
+                    sizes[household_id] = sizes.get(household_id, 0) + rows
+        return sizes
+    return router.fan_out(count)
+
+
+def plan_rebalance(router, tolerance=0.1):
+    """Список переносов (household_id, из шарда, в шард), выравнивающий число записей
+
+    Жадно переносит самое крупное домохозяйство, которое уменьшает разрыв
+    между самым загруженным и самым свободным шардами, пока разрыв больше
+    tolerance от средней загрузки.
+    """
+    sizes = household_sizes(router)
+    # Только домохозяйства, которые по справочнику живут в этом шарде (без остатков переносов)
+    for shard, households in enumerate(sizes):
+        for household_id in list(households):
+            location = router.locate(household_id)
+            if location is None or location[0] != shard:
+                del households[household_id]
+
+    loads = [sum(households.values()) for households in sizes]
+    average = sum(loads) / len(loads)
+    moves = []
+    while True:
+        heavy = max(range(len(loads)), key=loads.__getitem__)
+        light = min(range(len(loads)), key=loads.__getitem__)
+        gap = loads[heavy] - loads[light]
+        if gap <= tolerance * average:
+            break
+        candidates = [(size, household_id) for household_id, size in sizes[heavy].items()
+                      if 0 < size < gap]
+        if not candidates:
+            break
+        size, household_id = max(candidates, key=lambda item: min(item[0], gap - item[0]))
+        del sizes[heavy][household_id]
+        sizes[light][household_id] = size
+        loads[heavy] -= size
+        loads[light] += size
+        moves.append((household_id, heavy, light))
+    return moves
+
+
+def cleanup(router):
+    """Удалить остатки прерванных переносов и снять зависшие пометки "переносится"
+
+    Запускать, когда не идет ни один перенос. Возвращает число удаленных домохозяйств-копий.
+    """
+    for household_id in router.moving():
+        router.set_state(household_id, 'active')
+
+    removed = 0
+    for shard, households in enumerate(household_sizes(router)):
+        # Домохозяйства, которых нет в справочнике, не трогаем: их создание могло не дойти до справочника
+        orphans = []
+        for household_id in households:
+            location = router.locate(household_id)
+            if location is not None and location[0] != shard:
+                orphans.append(household_id)
+        if orphans:
+            def remove(cursor, orphans=orphans):
+                for household_id in orphans:
+                    _delete_scope(cursor, HOUSEHOLD_SCOPE, household_id)
+            router.pools[shard].write(remove)
+            removed += len(orphans)
+    return removed
+
+
+def report(router):
+    """Сводка по шардам: [(шард, файл, домохозяйств, пользователей, транзакций, МБ)]"""
+    def summarize(pool):
+        with pool.reader() as conn:
+            households, users, transactions, size = conn.execute('''
+                SELECT (SELECT COUNT(*) FROM households),
+                       (SELECT COUNT(*) FROM users),
+                       (SELECT COUNT(*) FROM transactions WHERE is_deleted = 0),
+                       (SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size())
+            ''').fetchone()
+        return os.path.basename(pool.db_path), households, users, transactions, size / 2 ** 20
+    return [(shard, *row) for shard, row in enumerate(router.fan_out(summarize))]
+
+
+def main(argv):
+    """Командная строка: python shards.py status|move <household_id> <shard>|rebalance [--dry-run]|cleanup"""
+    import database
+
+    usage = "Использование: python shards.py status|move <household_id> <shard>|rebalance [--dry-run]|cleanup"
+    command = argv[1] if len(argv) > 1 else 'status'
+    if command not in ('status', 'move', 'rebalance', 'cleanup'):
+        print(usage)
+        return 2
+
+    router = database.router
+    try:
+        database.init_db()
+
+        if command == 'status':
+            for shard, path, households, users, transactions, megabytes in report(router):
+                print(f"#{shard} {path}: домохозяйств {households}, пользователей {users}, "
+                      f"транзакций {transactions}, {megabytes:.1f} МБ")
+            moving = sorted(router.moving())
+            if moving:
+                print(f"⏳ Переносятся: {', '.join(map(str, moving))}")
+            return 0
+
+        if router.single:
+            print("ℹ️ Настроен один шард (DB_SHARDS), переносить некуда")
+            return 1
+
+        if command == 'move':
+            if len(argv) != 4:
+                print(usage)
+                return 2
+            household_id, target = int(argv[2]), int(argv[3])
+            if not 0 <= target < len(router.pools):
+                print(f"❌ Нет шарда {target}")
+                return 2
+            started = time.perf_counter()
+            rows = move_household(router, household_id, target)
+            print(f"✅ Домохозяйство {household_id} в шарде {target}: {rows} строк "
+                  f"за {time.perf_counter() - started:.1f} с")
+            return 0
+
+        if command == 'rebalance':
+            moves = plan_rebalance(router)
+            if not moves:
+                print("✅ Шарды уже сбалансированы")
+                return 0
+            for household_id, source, target in moves:
+                if '--dry-run' in argv:
+                    print(f"• {household_id}: {source} → {target}")
+                    continue
+                rows = move_household(router, household_id, target)
+                print(f"✅ {household_id}: {source} → {target}, {rows} строк")
+            return 0
+
+        removed = cleanup(router)
+        print(f"✅ Удалено остатков переносов: {removed}")
+        return 0
+    finally:
+        database.close_db()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,44 @@
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# database.py настраивается переменными окружения при первом импорте config,
+# поэтому тесты получают отдельную базу из двух шардов до любых импортов
+_DIRECTORY = tempfile.mkdtemp(prefix='finance-tests-')
+os.environ.update({
+    'BOT_TOKEN': '123456:TEST',
+    'MY_USER_ID': '1',
+    'GIRLFRIEND_USER_ID': '2',
+    'DB_PATH': os.path.join(_DIRECTORY, 'shard0.db'),
+    'DB_SHARDS': ','.join(os.path.join(_DIRECTORY, f'shard{shard}.db') for shard in range(2)),
+    'DB_SHARD_DIRECTORY': os.path.join(_DIRECTORY, 'directory.db'),
+    'DB_SLOW_LOG': os.path.join(_DIRECTORY, 'slow_queries.log'),
+    'FSM_DB_PATH': os.path.join(_DIRECTORY, 'fsm_states.db'),
+    'DEFAULT_TIMEZONE': 'UTC',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_user_ids = itertools.count(1000)
+
+
+@pytest.fixture(scope='session')
+def database():
+    """database.py, подключенный к временной базе из двух шардов"""
+    import database
+    database.init_db()
+    yield database
+    database.close_db()
+    shutil.rmtree(_DIRECTORY, ignore_errors=True)
+
+
+@pytest.fixture
+def user(database):
+    """Новый пользователь со своим домохозяйством"""
+    user_id = next(_user_ids)
+    database.add_user(user_id, f'user{user_id}', f'Пользователь {user_id}')
+    database.create_household(user_id, f'Дом {user_id}')
+    return user_id
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+SLOW_QUERY = '''
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+    SELECT COUNT(*) FROM c WHERE x < 10000000000
+'''
+
+
+@pytest.fixture
+def db_async(database):
+    import db_async
+    return db_async
+
+
+def test_timed_out_read_is_interrupted(database, db_async, user):
+    pool = database.router.for_user(user)
+
+    def slow_read():
+        with pool.reader() as conn:
+            return conn.execute(SLOW_QUERY).fetchone()
+
+    async def main():
+        with pytest.raises(db_async.DatabaseTimeoutError) as error:
+            await db_async.run(slow_read, timeout=0.2)
+        assert not error.value.may_complete
+        # Прерванный поток свободен и выполняет следующий запрос целиком
+        return await db_async.get_user_today(user)
+
+    assert asyncio.run(main()) == database.get_user_today(user)
+    # Прерванный запрос освобождает слот читателя, а не досчитывается
+    deadline = time.monotonic() + 2
+    while pool._active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool._active == {}
+
+
+def test_queued_write_is_cancelled(database, db_async, user):
+    pool = database.router.for_user(user, write=True)
+    release = threading.Event()
+    blocker = pool.submit_write(lambda cursor: release.wait(10))
+
+    async def main():
+        with pytest.raises(db_async.DatabaseTimeoutError) as error:
+            await db_async.add_transaction(user, 'expense', 10, 'Еда', 'отмененная', timeout=0.2)
+        return error.value
+
+    error = asyncio.run(main())
+    release.set()
+    blocker.result()
+    assert not error.may_complete
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = 'отмененная'").fetchone()[0] == 0
@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+import time
+
+from fsm_storage import SQLiteStorage
+
+
+def _rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT chat_id, user_id, state, data FROM fsm_states ORDER BY chat_id').fetchall()
+
+
+def test_changes_are_batched_and_survive_restart(tmp_path):
+    path = str(tmp_path / 'fsm.db')
+
+    async def first():
+        storage = SQLiteStorage(path, flush_interval=0.05)
+        await storage.set_state(chat=1, user=1, state='AddExpense:amount')
+        await storage.update_data(chat=1, user=1, amount=450)
+        await storage.update_data(chat=1, user=1, category='Еда')
+        assert _rows(path) == []  # запись отложена
+        await asyncio.sleep(0.2)
+        assert _rows(path) == [(1, 1, 'AddExpense:amount', '{"amount":450,"category":"Еда"}')]
+        await storage.set_state(chat=2, user=2, state='EditPlan:date')
+        await storage.close()  # записывает то, что не успел таймер
+
+    async def second():
+        storage = SQLiteStorage(path)
+        assert await storage.get_state(chat=1, user=1) == 'AddExpense:amount'
+        assert await storage.get_data(chat=1, user=1) == {'amount': 450, 'category': 'Еда'}
+        await storage.reset_state(chat=1, user=1)
+        await storage.close()
+
+    asyncio.run(first())
+    assert len(_rows(path)) == 2
+    asyncio.run(second())
+    assert _rows(path) == [(2, 2, 'EditPlan:date', None)]
+
+
+def test_abandoned_dialog_expires(tmp_path):
+    path = str(tmp_path / 'fsm.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE fsm_states (chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, state TEXT, '
+                     'data TEXT, bucket TEXT, updated_at REAL NOT NULL, PRIMARY KEY (chat_id, user_id)) WITHOUT ROWID')
+        conn.executemany('INSERT INTO fsm_states VALUES (?, ?, ?, ?, NULL, ?)', [
+            (1, 1, 'AddExpense:amount', '{"amount":1}', time.time() - 7200),
+            (2, 2, 'AddIncome:amount', None, time.time()),
+        ])
+
+    async def main():
+        storage = SQLiteStorage(path, ttl=3600)
+        assert await storage.get_state(chat=1, user=1) is None
+        assert await storage.get_data(chat=1, user=1) == {}
+        assert await storage.get_state(chat=2, user=2) == 'AddIncome:amount'
+        await storage.close()
+
+    asyncio.run(main())
+    assert _rows(path) == [(2, 2, 'AddIncome:amount', None)]
+
+
+def test_cache_eviction_keeps_unsaved_changes(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'fsm.db'), cache_size=1, flush_interval=60)
+        await storage.set_state(chat=1, user=1, state='AddExpense:amount')
+        await storage.set_state(chat=2, user=2, state='AddIncome:amount')
+        assert list(storage._cache) == [(2, 2)]
+        assert await storage.get_state(chat=1, user=1) == 'AddExpense:amount'
+        await storage.close()
+
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+import importer
+
+PROFILES = importer.load_profiles(None)
+
+
+def _read(text, profile='generic', user_id=1, encoding='utf-8'):
+    stats = importer.ImportStats()
+    rows = list(importer.read_statement(io.BytesIO(text.encode(encoding)), PROFILES[profile], user_id, stats))
+    return rows, stats
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('-1 234,56', -1234.56), ('1\xa0000', 1000.0), ('−250', -250.0), ('', 0.0), (42, 42.0), (-3.5, -3.5),
+])
+def test_parse_amount(value, expected):
+    assert importer.parse_amount(value) == expected
+
+
+def test_parse_amount_rejects_text():
+    with pytest.raises(ValueError):
+        importer.parse_amount('сто')
+
+
+def test_parse_datetime_moves_matching_format_first():
+    formats = ['%Y-%m-%d', '%d.%m.%Y %H:%M']
+    assert importer._parse_datetime(' 05.03.2024 14:30 ', formats).isoformat() == '2024-03-05T14:30:00'
+    assert formats[0] == '%d.%m.%Y %H:%M'
+    with pytest.raises(ValueError):
+        importer._parse_datetime('вчера', formats)
+
+
+def test_to_transaction_debit_credit_columns():
+    profile = {**PROFILES['generic'], 'debit': 'out', 'credit': 'in', 'categories': {'Такси': 'Транспорт'}}
+    fields = {'date': '2024-03-05 08:15:00', 'out': '350', 'in': '', 'category': 'Такси', 'description': 'поездка'}
+    assert importer.to_transaction(fields, profile) == (
+        '2024-03-05', '2024-03-05 08:15:00', 'expense', 350.0, 'Транспорт', 'поездка')
+    with pytest.raises(ValueError):
+        importer.to_transaction({**fields, 'out': '0'}, profile)
+
+
+def test_read_statement_numbers_repeated_rows():
+    rows, stats = _read('date;amount;description\n'
+                        '2024-03-05;-100;кофе\n'
+                        '2024-03-05;-100;кофе\n'
+                        '2024-03-06;5000;зарплата\n')
+    hashes = [row[-1] for row in rows]
+    assert stats.read == 3 and stats.errors == 0
+    assert hashes[0].startswith('2024-03-05:') and hashes[1] == hashes[0] + ':1'
+    assert rows[2][:5] == ('2024-03-06', '2024-03-06 00:00:00', 'income', 5000.0, 'Зарплата')
+    # Повторное чтение той же выписки дает те же хеши, другой пользователь - другие
+    assert [row[-1] for row in _read('date;amount;description\n2024-03-05;-100;кофе\n')[0]] == hashes[:1]
+    assert _read('date;amount;description\n2024-03-05;-100;кофе\n', user_id=2)[0][0][-1] != hashes[0]
+
+
+def test_read_statement_counts_errors_and_skipped():
+    text = ('Дата операции;Сумма операции;Статус;Категория;Описание\n'
+            '05.03.2024 10:00:00;-450,00;OK;Кафе;Кофейня\n'
+            '05.03.2024 11:00:00;-100,00;FAILED;Кафе;Кофейня\n'
+            'вчера;-100,00;OK;Кафе;Кофейня\n')
+    rows, stats = _read(text, 'tinkoff', encoding='cp1251')
+    assert [row[:6] for row in rows] == [
+        ('2024-03-05', '2024-03-05 10:00:00', 'expense', 450.0, 'Еда', 'Кофейня')]
+    assert (stats.read, stats.skipped, stats.errors) == (3, 1, 1)
+    assert stats.error_samples[0][0] == 4
+
+
+def test_read_statement_jsonl():
+    rows, stats = _read('{"date": "2024-03-05", "amount": -20, "description": "хлеб"}\n\n'
+                        '{"date": "2024-03-05", "amount": 0}\n', 'jsonl')
+    assert len(rows) == 1 and rows[0][2:4] == ('expense', 20.0)
+    assert stats.error_samples == [(3, 'нулевая сумма')]
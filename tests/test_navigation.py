@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from aiogram.utils.exceptions import BadRequest, MessageNotModified
+
+import navigation
+
+
+class _Message:
+    def __init__(self, message_id, text='Меню', error=None):
+        self.chat = SimpleNamespace(id=1)
+        self.message_id = message_id
+        self.text = text
+        self.date = datetime.now()
+        self.reply_markup = None
+        self.error = error
+        self.edits = 0
+
+    async def edit_text(self, text, parse_mode=None, reply_markup=None):
+        self.edits += 1
+        if self.error is not None:
+            raise self.error
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        self.sent.append(text)
+        return _Message(1000 + len(self.sent), text)
+
+
+def _show(message, text='Статистика'):
+    bot = _Bot()
+    query = SimpleNamespace(message=message, bot=bot, from_user=SimpleNamespace(id=1))
+    return asyncio.run(navigation.show(query, text)), bot
+
+
+def test_edits_text_message_in_place():
+    message = _Message(1)
+    shown, bot = _show(message)
+    assert shown is message and message.edits == 1 and bot.sent == []
+
+
+@pytest.mark.parametrize('error', [BadRequest('There is no text in the message to edit'),
+                                   BadRequest("Message can't be edited")])
+def test_sends_new_message_when_edit_is_rejected(error):
+    message = _Message(2, error=error)
+    shown, bot = _show(message)
+    assert shown is not message and bot.sent == ['Статистика']
+
+
+def test_message_without_text_is_not_edited():
+    message = _Message(3, text=None)
+    shown, bot = _show(message)
+    assert message.edits == 0 and bot.sent == ['Статистика']
+
+
+def test_not_modified_is_not_an_error():
+    message = _Message(4, error=MessageNotModified('Message is not modified'))
+    shown, bot = _show(message)
+    assert shown is message and bot.sent == []
@@ -0,0 +1,62 @@
+import asyncio
+import io
+
+import pytest
+from aiogram import Bot, types
+from aiogram.utils.exceptions import RetryAfter
+
+from outbox import Outbox, QueuedBot
+
+
+class _Once429:
+    """Bot.request, который на первый вызов отвечает 429 и запоминает отправленные файлы"""
+
+    def __init__(self):
+        self.uploads = []
+
+    async def __call__(self, bot, method, data=None, files=None, **kwargs):
+        self.uploads.append({key: (value.file if isinstance(value, types.InputFile) else value[1]).read()
+                             for key, value in files.items()})
+        if len(self.uploads) == 1:
+            raise RetryAfter(0)
+        return {'ok': True}
+
+
+@pytest.fixture
+def fake_request(monkeypatch):
+    request = _Once429()
+
+    async def fake(bot, method, data=None, files=None, **kwargs):
+        return await request(bot, method, data, files, **kwargs)
+    monkeypatch.setattr(Bot, 'request', fake)
+    return request
+
+
+def _send(files):
+    async def main():
+        bot = QueuedBot(token='123456:TEST', outbox=Outbox(global_rate=1000, chat_rate=1000))
+        try:
+            return await bot.request('sendDocument', {'chat_id': 1}, files)
+        finally:
+            await bot.outbox.close()
+    return asyncio.run(main())
+
+
+def test_retried_upload_sends_whole_file(fake_request):
+    stream = io.BytesIO(b'header;data')
+    stream.seek(7)
+    assert _send({'document': types.InputFile(stream, filename='report.csv')}) == {'ok': True}
+    assert fake_request.uploads == [{'document': b'data'}, {'document': b'data'}]
+
+
+def test_unseekable_upload_is_not_requeued(fake_request):
+    class Pipe(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return 0
+
+    with pytest.raises(RetryAfter):
+        _send({'document': ('pipe.bin', Pipe())})
+    assert len(fake_request.uploads) == 1
@@ -0,0 +1,51 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import periods
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('+3', 'Etc/GMT-3'),
+    ('UTC+03', 'Etc/GMT-3'),
+    ('utc-5', 'Etc/GMT+5'),
+    ('GMT-12', 'Etc/GMT+12'),
+    ('+14', 'Etc/GMT-14'),
+    ('UTC+0', 'UTC'),
+    ('UTC', 'UTC'),
+    (' Europe/Moscow ', 'Europe/Moscow'),
+])
+def test_parse_zone(text, expected):
+    assert periods.parse_zone(text) == expected
+
+
+@pytest.mark.parametrize('text', ['UTC-13', '-14', '+15', 'UTC+3:30', 'Nowhere/City', ''])
+def test_parse_zone_rejects_zones_missing_from_iana(text):
+    assert periods.parse_zone(text) is None
+
+
+def test_parsed_offsets_are_real_zones():
+    noon = datetime(2024, 6, 1, 12)
+    for hours in range(-12, 15):
+        name = periods.parse_zone(f'{hours:+d}')
+        # get_zone не подменил пояс поясом по умолчанию
+        assert periods.get_zone(name).key == name
+        assert periods.to_utc(noon.date(), '12:00', name) == (noon - timedelta(hours=hours)).strftime(
+            periods.UTC_FORMAT)
+
+
+@pytest.mark.parametrize('period, expected', [
+    ('today', ('2024-02-29', '2024-03-01')),
+    ('week', ('2024-02-22', '2024-03-01')),
+    ('month', ('2024-02-01', '2024-03-01')),
+    ('all', (None, None)),
+    (('2024-01-01', None), ('2024-01-01', None)),
+])
+def test_period_bounds(period, expected):
+    assert periods.period_bounds(period, date(2024, 2, 29)) == expected
+
+
+def test_month_bounds_cross_year():
+    assert periods.period_bounds('month', '2024-12-31') == ('2024-12-01', '2025-01-01')
+    with pytest.raises(ValueError):
+        periods.period_bounds('year', '2024-12-31')
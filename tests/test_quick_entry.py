@@ -0,0 +1,73 @@
+import re
+
+import pytest
+
+import quick_entry
+from quick_entry import QuickEntry
+
+# Так фильтр regexp aiogram компилирует строковые шаблоны
+BULK_TRIGGER = re.compile(quick_entry.BULK_TRIGGER, re.IGNORECASE | re.MULTILINE)
+
+
+@pytest.mark.parametrize('text', ['450 еда обед', '1 200,50 такси', '+50000 зарплата', '5к продукты',
+                                  '10 р кофе', '-300 кафе', '12.05 встреча'])
+def test_trigger_matches_amount_with_words(text):
+    assert quick_entry.TRIGGER.search(text)
+
+
+@pytest.mark.parametrize('text', ['500', '+50000', '10р', '12.05.2024 врач', '15:00 кино', 'обед 450',
+                                  '450 еда\n300 такси', '2024-01-01 такси'])
+def test_trigger_ignores_other_messages(text):
+    assert not quick_entry.TRIGGER.search(text)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('450 еда обед в кафе', QuickEntry('expense', 450, 'Еда', 'обед в кафе')),
+    ('1 200,50 такси', QuickEntry('expense', 1200.5, 'Транспорт', 'такси')),
+    ('5к продукты', QuickEntry('expense', 5000, 'Еда', 'продукты')),
+    ('+50000 зарплата', QuickEntry('income', 50000, 'Зарплата', None)),
+    ('70000 зп', QuickEntry('income', 70000, 'Зарплата', 'зп')),
+    ('300 транспрт', QuickEntry('expense', 300, 'Транспорт', None)),
+    ('150 разв', QuickEntry('expense', 150, 'Развлечения', None)),
+    ('+1000 возврат долга от Пети', QuickEntry('income', 1000, 'Возврат долга', 'от Пети')),
+    ('-200 зарплата', QuickEntry('expense', 200, 'Другое', 'зарплата')),
+    ('450', QuickEntry('expense', 450, None, None)),
+])
+def test_parse(text, expected):
+    assert quick_entry.parse(text) == expected
+
+
+def test_parse_without_fallback_requires_category():
+    assert quick_entry.parse('12.05 встреча') == QuickEntry('expense', 12.05, 'Другое', 'встреча')
+    assert quick_entry.parse('12.05 встреча', fallback=False) is None
+    assert quick_entry.parse('450 обед', fallback=False) == QuickEntry('expense', 450, 'Еда', 'обед')
+
+
+@pytest.mark.parametrize('text', ['0 еда', 'еда 450', '', '1,234 еда'])
+def test_parse_rejects_non_amounts(text):
+    assert quick_entry.parse(text) is None
+
+
+def test_parse_lines_reports_each_line():
+    results = quick_entry.parse_lines(['# комментарий', '450 обед', '', 'обед', '300', '+100 кешбэк'])
+    assert [(number, entry is not None) for number, entry, _ in results] == [
+        (2, True), (4, False), (5, False), (6, True)]
+    assert results[3][1] == QuickEntry('income', 100, 'Прочее', 'кешбэк')
+    assert 'сумма' in results[1][2] and 'категории' in results[2][2]
+
+
+def test_parse_lines_limit():
+    results = quick_entry.parse_lines(['1 еда'] * (quick_entry.BULK_MAX_LINES + 5))
+    assert len(results) == quick_entry.BULK_MAX_LINES + 1
+    assert results[-1][1] is None
+
+
+def test_bulk_trigger_needs_several_lines():
+    assert BULK_TRIGGER.search('450 еда\n300 такси')
+    assert not BULK_TRIGGER.search('450 еда')
+
+
+def test_document_lines_csv_skips_header():
+    data = 'amount;category;description\r\n450;Еда;обед\r\n300;такси;\r\n'.encode('cp1251')
+    assert quick_entry.document_lines(data, 'bank.CSV') == ['', '450 Еда обед', '300 такси']
+    assert quick_entry.document_lines('450 еда\n'.encode('utf-8-sig'), 'list.txt') == ['450 еда']
@@ -0,0 +1,76 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import recurrence
+
+
+def dates(*days):
+    return [date.fromisoformat(day) for day in days]
+
+
+def test_31st_moves_to_last_day_of_short_months():
+    rule = 'FREQ=MONTHLY;BYMONTHDAY=31'
+    assert list(recurrence.occurrences(rule, '2024-01-31', until='2024-06-01')) == dates(
+        '2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30', '2024-05-31')
+    # Без BYMONTHDAY день берется из даты начала и тоже не "съезжает" после февраля
+    assert list(recurrence.occurrences('FREQ=MONTHLY', '2023-01-31', '2023-02-01', '2023-05-01')) == dates(
+        '2023-02-28', '2023-03-31', '2023-04-30')
+
+
+def test_31st_window_far_from_start():
+    assert list(recurrence.occurrences('FREQ=MONTHLY;INTERVAL=2;BYMONTHDAY=31', '2020-01-31',
+                                       '2031-01-01', '2031-07-01')) == dates(
+        '2031-01-31', '2031-03-31', '2031-05-31')
+
+
+def test_last_friday():
+    rule = 'FREQ=MONTHLY;BYDAY=-1FR'
+    assert list(recurrence.occurrences(rule, '2024-01-01', until='2024-06-01')) == dates(
+        '2024-01-26', '2024-02-23', '2024-03-29', '2024-04-26', '2024-05-31')
+    # Дата начала после последней пятницы месяца - первый повтор в следующем месяце
+    assert recurrence.next_occurrence(rule, '2024-05-31', '2024-06-01') == date(2024, 6, 28)
+
+
+def test_fifth_weekday_skips_months_without_it():
+    assert list(recurrence.occurrences('FREQ=MONTHLY;BYDAY=5TU', '2024-01-01', until='2025-01-01')) == dates(
+        '2024-01-30', '2024-04-30', '2024-07-30', '2024-10-29', '2024-12-31')
+
+
+@pytest.mark.parametrize('since, until, expected', [
+    ('2024-03-03', '2024-03-10', ('2024-03-03', '2024-03-04', '2024-03-05')),
+    ('2024-02-01', '2024-03-03', ('2024-03-01', '2024-03-02')),
+    ('2024-03-06', '2024-04-01', ()),
+])
+def test_count_is_numbered_from_start_not_from_window(since, until, expected):
+    rule = 'FREQ=DAILY;COUNT=5'
+    assert list(recurrence.occurrences(rule, '2024-03-01', since, until)) == dates(*expected)
+    assert recurrence.count_occurrences(rule, '2024-03-01', None, since, until) == len(expected)
+
+
+def test_count_with_until_stops_at_first_limit():
+    rule = 'FREQ=WEEKLY;BYDAY=MO,FR;COUNT=10;UNTIL=2024-01-15'
+    assert list(recurrence.occurrences(rule, '2024-01-01', '2024-01-05', '2024-12-31')) == dates(
+        '2024-01-05', '2024-01-08', '2024-01-12', '2024-01-15')
+
+
+def test_count_occurrences_fast_path_matches_expansion():
+    rnd = random.Random(0)
+    rules = ('FREQ=DAILY', 'FREQ=DAILY;INTERVAL=3', 'FREQ=WEEKLY', 'FREQ=WEEKLY;BYDAY=MO,WE,SU',
+             'FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SA')
+    for _ in range(500):
+        rule = rnd.choice(rules)
+        start = date(2023, 1, 1) + timedelta(days=rnd.randrange(400))
+        since = start + timedelta(days=rnd.randrange(-30, 300))
+        until = since + timedelta(days=rnd.randrange(1, 120))
+        expected = sum(1 for _ in recurrence.occurrences(rule, start, since, until))
+        assert recurrence.count_occurrences(rule, start.isoformat(), None, since.isoformat(),
+                                            until.isoformat()) == expected, (rule, start, since, until)
+
+
+@pytest.mark.parametrize('text', ['FREQ=YEARLY', 'FREQ=MONTHLY;BYMONTHDAY=32', 'FREQ=DAILY;INTERVAL=0',
+                                  'FREQ=WEEKLY;BYMONTHDAY=5'])
+def test_invalid_rules(text):
+    with pytest.raises(ValueError):
+        recurrence.parse_rule(text)
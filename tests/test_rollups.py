@@ -0,0 +1,51 @@
+import rollups
+
+
+def _rollup(database, user_id, category):
+    """(сумма, число) расходов категории в дневном агрегате пользователя"""
+    with database.router.for_user(user_id).reader() as conn:
+        row = conn.execute('SELECT SUM(total), SUM(count) FROM daily_totals '
+                           'WHERE user_id = ? AND type = ? AND category = ?',
+                           (user_id, 'expense', category)).fetchone()
+    return (row[0] or 0, row[1] or 0)
+
+
+def test_verify_after_update(database, user):
+    transaction_id = database.add_transaction(user, 'expense', 450, 'Еда', 'обед')
+    database.add_transaction(user, 'expense', 100, 'Еда', 'кофе')
+
+    database.update_transaction(transaction_id, amount=500)
+    assert _rollup(database, user, 'Еда') == (600, 2)
+    assert database.verify_rollups() == []
+
+    database.update_transaction(transaction_id, category='Транспорт')
+    assert _rollup(database, user, 'Еда') == (100, 1)
+    assert _rollup(database, user, 'Транспорт') == (500, 1)
+    assert database.verify_rollups() == []
+
+
+def test_verify_after_delete(database, user):
+    first, second = database.add_transactions(user, [('expense', 300, 'Одежда', 'куртка'),
+                                                     ('expense', 200, 'Одежда', 'шарф')])
+
+    database.soft_delete_transaction(first)
+    assert _rollup(database, user, 'Одежда') == (200, 1)
+    assert database.verify_rollups() == []
+
+    database.soft_delete_transaction(second)
+    assert _rollup(database, user, 'Одежда')[1] == 0
+    assert database.verify_rollups() == []
+
+
+def test_verify_reports_drift(database, user):
+    database.add_transaction(user, 'expense', 50, 'Подарки', 'цветы')
+    pool = database.router.for_user(user, write=True)
+    pool.write(lambda cursor: cursor.execute('UPDATE daily_totals SET total = total + 1 WHERE user_id = ?',
+                                             (user,)))
+    try:
+        with pool.reader() as conn:
+            mismatches = rollups.verify(conn.cursor())
+        assert {(table, key[0]) for table, key, _, _ in mismatches} == {('daily_totals', user)}
+    finally:
+        pool.write(rollups.rebuild)
+    assert database.verify_rollups() == []
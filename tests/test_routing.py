@@ -0,0 +1,53 @@
+import pytest
+
+from routing import ANY_STATE, Router
+
+
+def _router():
+    router = Router()
+    for data in ('edit_', 'edit_amount_', 'edit_amount_expense_', 'menu'):
+        router.callback(data)(lambda event, payload, data=data: (data, payload))
+    router.callback('edit_', state='EditPlan:amount')(lambda event: 'in dialog')
+    router.callback('cancel', state=ANY_STATE)(lambda event, state: state)
+    router.text('📊 Статистика')(lambda event: 'stats')
+    return router
+
+
+@pytest.mark.parametrize('data, handler, payload', [
+    ('edit_amount_expense_42', 'edit_amount_expense_', '42'),
+    ('edit_amount_income_42', 'edit_amount_', 'income_42'),
+    ('edit_note_7', 'edit_', 'note_7'),
+    ('menu', 'menu', ''),
+])
+def test_longest_prefix_wins(data, handler, payload):
+    route, found = _router().resolve_callback(data)
+    assert route(None, None, found) == (handler, payload)
+
+
+def test_prefix_needs_remainder():
+    router = _router()
+    assert router.resolve_callback('edit') == (None, None)
+    assert router.resolve_callback('menu_1') == (None, None)
+    assert router.resolve_callback('unknown_1') == (None, None)
+
+
+def test_state_selects_route():
+    router = _router()
+    route, payload = router.resolve_callback('edit_amount_expense_42', 'EditPlan:amount')
+    assert route(None, None, payload) == 'in dialog'
+    assert router.resolve_callback('menu', 'EditPlan:amount') == (None, None)
+    route, _ = router.resolve_callback('cancel', 'AddExpense:amount')
+    assert route(None, 'AddExpense:amount', None) == 'AddExpense:amount'
+
+
+def test_menu_text():
+    router = _router()
+    assert router.resolve_text('📊 Статистика')(None, None, None) == 'stats'
+    assert router.resolve_text('📊 Статистика', 'AddExpense:amount') is None
+    assert router.resolve_text('Статистика') is None
+
+
+def test_duplicate_registration():
+    router = _router()
+    with pytest.raises(ValueError):
+        router.callback('edit_amount_')(lambda event: None)
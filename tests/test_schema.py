@@ -0,0 +1,16 @@
+from datetime import date, timedelta
+
+
+def test_init_db_keeps_cleared_notification_time(database, user):
+    tomorrow = (date.today() + timedelta(days=2)).isoformat()
+    plan_id = database.add_plan(user, 'Без напоминания', '', tomorrow, '10:00')
+    pool = database.router.for_record('plans', plan_id, write=True)
+    pool.write(lambda cursor: cursor.execute(
+        'UPDATE plans SET notification_time = NULL, remind_at = NULL WHERE id = ?', (plan_id,)))
+
+    database.init_db()
+
+    with pool.reader() as conn:
+        row = conn.execute('SELECT notification_time, remind_at FROM plans WHERE id = ?', (plan_id,)).fetchone()
+    assert row == (None, None)
+    assert database.get_pending_reminder(plan_id) is None
@@ -0,0 +1,33 @@
+import pytest
+
+import search_index
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('кофе', '"кофе"*'),
+    ('  Ёлка, игрушки!', '"Елка"* "игрушки"*'),
+    ('такси "аэропорт" OR NEAR', '"такси"* "аэропорт"* "OR"* "NEAR"*'),
+    ('a*b-c', '"a"* "b"* "c"*'),
+])
+def test_match_query(text, expected):
+    assert search_index.match_query(text) == expected
+
+
+@pytest.mark.parametrize('text', [None, '', '  ', '*-"()'])
+def test_match_query_without_words(text):
+    assert search_index.match_query(text) is None
+
+
+def test_search_transactions_by_prefix(database, user):
+    database.add_transaction(user, 'expense', 450, 'Еда', 'Обед в столовой')
+    database.add_transaction(user, 'expense', 1200, 'Развлечения', 'Ёлочные игрушки')
+    database.add_transaction(user, 'expense', 300, 'Транспорт', 'такси OR метро')
+
+    def found(text):
+        return sorted(row[5] for row in database.search_transactions(user, text))
+
+    assert found('стол') == ['Обед в столовой']
+    assert found('елоч') == ['Ёлочные игрушки']
+    assert found('обед игр') == []
+    assert found('OR') == ['такси OR метро']
+    assert found('развлеч') == ['Ёлочные игрушки']
@@ -0,0 +1,84 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import shards
+from periods import UTC_FORMAT
+
+
+def _move_to_other_shard(database, user_id):
+    household_id = database.router.user_household(user_id)
+    source, _ = database.router.household_location(household_id)
+    target = 1 - source
+    assert shards.move_household(database.router, household_id, target) > 0
+    assert database.router.household_location(household_id) == (target, 'active')
+    return target
+
+
+def test_move_household_keeps_reminders_working(database, user):
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).date().isoformat()
+    plan_id = database.add_plan(user, 'Врач', '', tomorrow, '09:00')
+    transaction_id = database.add_transaction(user, 'expense', 700, 'Здоровье', 'анализы')
+    reminder = database.get_pending_reminder(plan_id)
+
+    target = _move_to_other_shard(database, user)
+
+    # Задание reminder:<plan_id>, кнопки и диалоги хранят старые id
+    moved = database.get_pending_reminder(plan_id)
+    assert moved is not None and moved.plan_id != plan_id
+    assert database.router.record_shard(moved.plan_id) == target
+    assert moved.remind_at == reminder.remind_at
+    assert database.get_plan(plan_id).id == moved.plan_id
+    assert database.get_transaction(transaction_id).amount == 700
+
+    # Перечитывание напоминаний при запуске видит план под новым id
+    since = datetime.now(timezone.utc).strftime(UTC_FORMAT)
+    until = (datetime.now(timezone.utc) + timedelta(days=2)).strftime(UTC_FORMAT)
+    assert moved.plan_id in {pending.plan_id for pending in database.get_pending_reminders(since, until)}
+
+    assert database.mark_reminder_sent(moved.plan_id, moved.remind_at)
+    assert database.get_pending_reminder(plan_id) is None
+    assert not database.mark_reminder_sent(moved.plan_id, moved.remind_at)
+
+
+def test_old_ids_resolve_after_moving_back(database, user):
+    tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).date().isoformat()
+    plan_id = database.add_plan(user, 'Стрижка', '', tomorrow, '18:30')
+
+    _move_to_other_shard(database, user)
+    _move_to_other_shard(database, user)
+
+    reminder = database.get_pending_reminder(plan_id)
+    assert reminder is not None and reminder.title == 'Стрижка'
+    assert database.router.resolve_record('plans', plan_id) == reminder.plan_id
+
+
+def test_write_routed_before_move_is_not_lost(database, user, monkeypatch):
+    household_id = database.router.user_household(user)
+    source, _ = database.router.household_location(household_id)
+    source_pool = database.router.pools[source]
+    routed, release = threading.Event(), threading.Event()
+    submit_write = source_pool.submit_write
+
+    def delayed_submit(operation):
+        # Шард уже выбран, а в очередь писателя запись попадает после переноса
+        if threading.current_thread().name == 'late-writer':
+            routed.set()
+            release.wait(10)
+        return submit_write(operation)
+    monkeypatch.setattr(source_pool, 'submit_write', delayed_submit)
+
+    result = {}
+    writer = threading.Thread(name='late-writer', target=lambda: result.update(
+        id=database.add_transaction(user, 'expense', 250, 'Транспорт', 'такси')))
+    writer.start()
+    assert routed.wait(10)
+    target = _move_to_other_shard(database, user)
+    release.set()
+    writer.join(10)
+
+    transaction = database.get_transaction(result['id'])
+    assert transaction is not None and transaction.amount == 250
+    assert database.router.record_shard(transaction.id) == target
+    with source_pool.reader() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM transactions WHERE user_id = ?', (user,)).fetchone()[0] == 0
+    assert database.verify_rollups() == []
@@ -0,0 +1,141 @@
+import asyncio
+import hmac
+import json
+import logging
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+# ========== ПРИЕМ ОБНОВЛЕНИЙ ЧЕРЕЗ WEBHOOK ==========
+#
+# Telegram присылает обновления POST-запросами на локальный aiohttp-сервер.
+# Запрос проверяется по секретному токену, обновление кладется в очередь,
+# и Telegram сразу получает ответ 200 - обработка идет в пуле обработчиков.
+# Обновления одного чата попадают в одну очередь и обрабатываются по порядку.
+# Если очереди заполнены, сервер отвечает 503 и Telegram повторит доставку позже.
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def chat_key(data):
+    """Ключ порядка обработки: id чата (или отправителя) из сырого обновления"""
+    for value in data.values():
+        if isinstance(value, dict):
+            chat = value.get('chat') or (value.get('message') or {}).get('chat')
+            if chat:
+                return chat['id']
+            sender = value.get('from')
+            if sender:
+                return sender['id']
+    return data.get('update_id', 0)
+
+
+class UpdateWorkers:
+    """Ограниченные очереди обновлений и пул обработчиков dispatcher.process_update
+
+    У каждого из workers обработчиков своя очередь на max_pending // workers
+    обновлений; очередь выбирается по chat_key.
+    """
+
+    def __init__(self, dispatcher, workers=32, max_pending=1000):
+        self.dispatcher = dispatcher
+        self._queues = [asyncio.Queue(max(1, max_pending // workers)) for _ in range(workers)]
+        self._tasks = []
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def put_nowait(self, data):
+        """Поставить сырое обновление в очередь; False - очередь заполнена"""
+        queue = self._queues[hash(chat_key(data)) % len(self._queues)]
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.received += 1
+        return True
+
+    async def _work(self, queue):
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        while True:
+            data = await queue.get()
+            try:
+                await self.dispatcher.process_update(types.Update(**data))
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f"❌ Ошибка обработки обновления {data.get('update_id')}: {e}")
+            finally:
+                queue.task_done()
+
+    def start(self):
+        """Запустить обработчики (в работающем цикле событий)"""
+        self._tasks = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+
+    async def stop(self, timeout=10):
+        """Дождаться обработки принятых обновлений (не дольше timeout) и остановить обработчики"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Не обработано обновлений: {sum(queue.qsize() for queue in self._queues)}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def create_app(workers, path, secret):
+    """aiohttp-приложение с одним маршрутом приема обновлений"""
+    async def receive(request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+            return web.Response(status=401)
+        try:
+            data = await request.json(loads=json.loads)
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+        if not workers.put_nowait(data):
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+def run(dispatcher, url, path, secret, host='127.0.0.1', port=8080, workers=32, max_pending=1000,
+        on_startup=None, on_shutdown=None, skip_updates=True):
+    """Запустить бота в режиме webhook (блокирует до остановки сервера)
+
+    url - внешний адрес, по которому Telegram доступен сервер (без path).
+    """
+    update_workers = UpdateWorkers(dispatcher, workers, max_pending)
+    app = create_app(update_workers, path, secret)
+
+    async def startup(app):
+        update_workers.start()
+        await dispatcher.bot.set_webhook(url.rstrip('/') + path, secret_token=secret,
+                                         drop_pending_updates=skip_updates)
+        if on_startup is not None:
+            await on_startup(dispatcher)
+
+    async def shutdown(app):
+        await update_workers.stop()
+        logger.info(f"Обновлений принято: {update_workers.received}, отклонено: {update_workers.rejected}, "
+                    f"обработано: {update_workers.processed}, с ошибкой: {update_workers.failed}")
+        if on_shutdown is not None:
+            await on_shutdown(dispatcher)
+        await dispatcher.storage.close()
+        await dispatcher.storage.wait_closed()
+        session = await dispatcher.bot.get_session()
+        await session.close()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    web.run_app(app, host=host, port=port, print=None)